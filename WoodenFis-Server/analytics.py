@@ -0,0 +1,342 @@
+"""
+离线分析导出与查询
+
+导出任务把 meditation_sessions 和 user_stats 增量写成按天分区的 Parquet 文件（zstd 压缩），
+留存、同期群、DAU 等分析在导出文件上用 Arrow / NumPy 向量化计算，不访问线上数据库：
+
+    <目录>/meditation_sessions/date=YYYY-MM-DD/part-<批次>-<序号>.parquet   按 created_at 所在日期
+    <目录>/user_stats/date=YYYY-MM-DD/part-<批次>-<序号>.parquet            按导出日期，只含有变化的用户
+    <目录>/_state/user_stats-<批次>.parquet                                  上次导出时各用户的 total_taps
+    <目录>/_checkpoint.json                                                  已提交的批次号和高水位
+
+- meditation_sessions：每张表（SQLite 为父表和各月份分区）记录已导出的最大ID，每次只导出ID更大、
+  且创建时间早于 SETTLE_SECONDS 之前的记录（PostgreSQL 的序列ID不按提交顺序分配，留出未提交事务的时间）
+- user_stats：全表按 user_id 顺序读出后与上次的状态比较，只写出新增或 total_taps 变化的用户，
+  total_taps_delta 为两次导出之间的敲击增量（按天汇总即为敲击流水）
+- 检查点最后原子替换写入。批次中断时已写出的文件不在检查点中，查询时不可见，下次导出先删除再重新导出，
+  不会重复或遗漏
+
+导出前归档的分区（partitions.py --archive-before）不会再被导出，归档周期应长于导出周期。
+
+用法:
+    python analytics.py export --dir analytics/             # 有只读副本时从副本读取
+    python analytics.py dau --dir analytics/ --start 2026-10-01
+    python analytics.py retention --dir analytics/          # 按首次活跃日分组的 D1/D7/D30 留存
+    python analytics.py cohort --dir analytics/ --weeks 8   # 按首次活跃周分组的周留存矩阵
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import func, or_, select
+
+import models
+import partitions
+import streaks
+from streaks import day_of
+
+logger = logging.getLogger("woodenfis.analytics")
+
+CHECKPOINT = "_checkpoint.json"
+STATE = "_state"
+SESSIONS = "meditation_sessions"
+USER_STATS = "user_stats"
+# 只导出创建时间早于这么多秒之前的会话，等待仍未提交的事务
+SETTLE_SECONDS = 60
+# 每批从库中读取的行数，以及缓冲多少行后写出文件
+FETCH_BATCH = 50_000
+FLUSH_ROWS = 500_000
+STAT_COLUMNS = ("user_id", "total_taps", "today_taps", "consecutive_days", "last_tap_date")
+# 周留存按周一对齐：1970-01-01 是周四
+WEEK_OFFSET = 3
+
+
+def day_number(moment: datetime) -> int:
+    return (moment.date() - streaks.EPOCH).days
+
+
+def _days(column) -> np.ndarray:
+    """时间列转为距1970-01-01的天数，没有时间的记录归入第0天"""
+    days = pc.fill_null(pc.cast(column, pa.date32()), pa.scalar(0, pa.date32()))
+    return days.to_numpy().astype(np.int64)
+
+
+# ----------------------------------------------------------------- 检查点
+
+
+def load_checkpoint(directory: str) -> dict:
+    path = os.path.join(directory, CHECKPOINT)
+    if not os.path.exists(path):
+        return {"sequence": 0, SESSIONS: {}, USER_STATS: {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_checkpoint(directory: str, checkpoint: dict) -> None:
+    path = os.path.join(directory, CHECKPOINT)
+    with open(path + ".tmp", "w") as file:
+        json.dump(checkpoint, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _sequence_of(path: str) -> int:
+    # part-000012-0003.parquet / user_stats-000012.parquet
+    return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+
+def _discard(directory: str, sequence: int) -> None:
+    """删除中断批次留下的文件"""
+    leftovers = glob.glob(os.path.join(directory, "*", "date=*", f"part-{sequence:06d}-*.parquet"))
+    leftovers += glob.glob(os.path.join(directory, STATE, f"{USER_STATS}-{sequence:06d}.parquet"))
+    for path in leftovers:
+        os.remove(path)
+    if leftovers:
+        logger.info("删除未提交批次 %d 的 %d 个文件", sequence, len(leftovers))
+
+
+def _write(table: pa.Table, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先写隐藏文件再改名，读到的文件总是完整的
+    hidden = os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+    pq.write_table(table, hidden, compression="zstd")
+    os.replace(hidden, path)
+
+
+class _DayWriter:
+    """按天缓冲 Arrow 表，缓冲超过 FLUSH_ROWS 行后每天写出一个文件"""
+
+    def __init__(self, directory: str, name: str, sequence: int):
+        self.directory, self.name, self.sequence = directory, name, sequence
+        self.buffered: Dict[int, List[pa.Table]] = {}
+        self.rows = 0
+        self.part = 0
+        self.files: List[str] = []
+
+    def add(self, table: pa.Table, days: np.ndarray) -> None:
+        order = np.argsort(days, kind="stable")
+        table, days = table.take(order), days[order]
+        numbers, starts = np.unique(days, return_index=True)
+        for number, start, stop in zip(numbers, starts, np.append(starts[1:], len(days))):
+            self.buffered.setdefault(int(number), []).append(table.slice(start, stop - start))
+        self.rows += len(days)
+        if self.rows >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffered:
+            return
+        for number, tables in sorted(self.buffered.items()):
+            path = os.path.join(self.directory, self.name, f"date={day_of(number)}",
+                                f"part-{self.sequence:06d}-{self.part:04d}.parquet")
+            _write(pa.concat_tables(tables), path)
+            self.files.append(path)
+        self.buffered, self.rows = {}, 0
+        self.part += 1
+
+
+# ----------------------------------------------------------------- 导出
+
+
+def export(engine, directory: str, sessions: partitions.MonthlyPartitions = partitions.SESSIONS,
+           now: Optional[datetime] = None) -> dict:
+    """导出上次检查点之后的数据，返回本批次号和各表导出行数"""
+    now = now or datetime.utcnow()
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = load_checkpoint(directory)
+    sequence = checkpoint["sequence"] + 1
+    _discard(directory, sequence)
+
+    session_rows, marks = _export_sessions(engine, directory, sequence, sessions, checkpoint[SESSIONS],
+                                           now - timedelta(seconds=SETTLE_SECONDS))
+    stat_rows, state = _export_user_stats(engine, directory, sequence, checkpoint[USER_STATS].get("state"), now)
+
+    _save_checkpoint(directory, {"sequence": sequence, "exported_at": now.isoformat(),
+                                 SESSIONS: marks, USER_STATS: {"state": state}})
+    for path in glob.glob(os.path.join(directory, STATE, f"{USER_STATS}-*.parquet")):
+        if _sequence_of(path) < sequence:
+            os.remove(path)
+    logger.info("导出批次 %d: meditation_sessions %d 行, user_stats %d 行", sequence, session_rows, stat_rows)
+    return {"sequence": sequence, SESSIONS: session_rows, USER_STATS: stat_rows}
+
+
+def _export_sessions(engine, directory: str, sequence: int, sessions: partitions.MonthlyPartitions,
+                     marks: Dict[str, int], cutoff: datetime) -> Tuple[int, Dict[str, int]]:
+    schema = pa.schema([(column.name, partitions.arrow_type(column.type)) for column in sessions.parent.columns])
+    writer = _DayWriter(directory, SESSIONS, sequence)
+    marks, rows = dict(marks), 0
+    with engine.connect() as conn:
+        for table in sessions.tables(conn):
+            low = marks.get(table.name, 0)
+            moment = table.c[sessions.time_column]
+            # 本批上界：已过等待期的最大ID，之后按主键区间顺序读取
+            high = conn.execute(select(func.max(table.c.id)).where(
+                table.c.id > low, or_(moment < cutoff, moment.is_(None)))).scalar()
+            if high is None:
+                continue
+            result = conn.execution_options(stream_results=True).execute(
+                select(table).where(table.c.id > low, table.c.id <= high).order_by(table.c.id))
+            for batch in result.partitions(FETCH_BATCH):
+                arrow = pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)], schema=schema)
+                writer.add(arrow, _days(arrow.column(sessions.time_column)))
+                rows += len(batch)
+            marks[table.name] = high
+    writer.flush()
+    return rows, marks
+
+
+def _export_user_stats(engine, directory: str, sequence: int, previous: Optional[str],
+                       now: datetime) -> Tuple[int, str]:
+    table = models.UserStat.__table__
+    schema = pa.schema([(name, partitions.arrow_type(table.c[name].type)) for name in STAT_COLUMNS])
+    batches = []
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(
+            select(*(table.c[name] for name in STAT_COLUMNS)).order_by(table.c.user_id, table.c.id))
+        for batch in result.partitions(FETCH_BATCH):
+            batches.append(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)], schema=schema))
+    current = pa.Table.from_batches(batches, schema=schema)
+
+    users = current.column("user_id").to_numpy()
+    totals = pc.fill_null(current.column("total_taps"), 0).to_numpy()
+    # 同一用户有多行时以最后一行为准
+    last = np.append(users[1:] != users[:-1], True) if len(users) else np.zeros(0, dtype=bool)
+    current, users, totals = current.filter(last), users[last], totals[last]
+
+    before = np.zeros(len(users), dtype=np.int64)
+    found = np.zeros(len(users), dtype=bool)
+    if previous:
+        state = pq.read_table(os.path.join(directory, previous))
+        known, known_totals = state.column("user_id").to_numpy(), state.column("total_taps").to_numpy()
+        position = np.minimum(np.searchsorted(known, users), max(len(known) - 1, 0))
+        if len(known):
+            found = known[position] == users
+            before = np.where(found, known_totals[position], 0)
+    delta = totals - before
+    changed = ~found | (delta != 0)
+
+    changes = current.filter(changed) \
+        .append_column("total_taps_delta", pa.array(delta[changed])) \
+        .append_column("exported_at", pa.array(np.full(int(changed.sum()), now), type=pa.timestamp("us")))
+    writer = _DayWriter(directory, USER_STATS, sequence)
+    writer.add(changes, np.full(changes.num_rows, day_number(now), dtype=np.int64))
+    writer.flush()
+
+    state = os.path.join(STATE, f"{USER_STATS}-{sequence:06d}.parquet")
+    _write(pa.table({"user_id": users, "total_taps": totals}), os.path.join(directory, state))
+    return changes.num_rows, state
+
+
+# ----------------------------------------------------------------- 查询
+
+
+def committed_files(directory: str, name: str, start: Optional[date] = None, end: Optional[date] = None) -> List[str]:
+    """已提交批次中 [start, end] 日期分区的文件"""
+    sequence = load_checkpoint(directory)["sequence"]
+    files = []
+    for path in glob.glob(os.path.join(directory, name, "date=*", "part-*.parquet")):
+        day = date.fromisoformat(os.path.basename(os.path.dirname(path))[len("date="):])
+        if _sequence_of(path) <= sequence and (start is None or day >= start) and (end is None or day <= end):
+            files.append(path)
+    return sorted(files)
+
+
+def activity(directory: str, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """有冥想会话的 (用户, 日期) 去重，按用户、日期排序，返回 (user_ids, days)"""
+    files = committed_files(directory, SESSIONS, start, end)
+    if not files:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    table = ds.dataset(files, format="parquet").to_table(columns=["user_id", "created_at"])
+    return streaks.unique_days(table.column("user_id").to_numpy(), _days(table.column("created_at")))
+
+
+def dau(directory: str, start: Optional[date] = None, end: Optional[date] = None) -> List[Tuple[date, int]]:
+    """每日活跃用户数"""
+    _, days = activity(directory, start, end)
+    numbers, counts = np.unique(days, return_counts=True)
+    return [(day_of(number), int(count)) for number, count in zip(numbers, counts)]
+
+
+def retention(directory: str, offsets: Sequence[int] = streaks.OFFSETS) -> List[dict]:
+    """
+    按首次活跃日分组的留存率：Dn 为首次活跃后第 n 天仍活跃的用户比例。
+    导出数据还没覆盖到第 n 天的分组为 None
+    """
+    cohorts, sizes, rates = streaks.compute_retention(*activity(directory), offsets)
+    return [{"cohort": day_of(cohort), "users": int(size),
+             **{f"d{offset}": None if np.isnan(rates[offset][i]) else float(rates[offset][i]) for offset in offsets}}
+            for i, (cohort, size) in enumerate(zip(cohorts, sizes))]
+
+
+def cohort(directory: str, weeks: int = 8) -> List[dict]:
+    """按首次活跃周（周一开始）分组，第 0..weeks-1 周各有多少用户活跃"""
+    users, days = activity(directory)
+    if not len(users):
+        return []
+    users, week_numbers = streaks.unique_days(users, (days + WEEK_OFFSET) // 7)
+    first = streaks.first_days(users, week_numbers)
+    offset = week_numbers - first
+    cohorts = streaks.distinct(first)
+    inside = offset < weeks
+    cells = np.searchsorted(cohorts, first[inside]) * weeks + offset[inside]
+    matrix = np.bincount(cells, minlength=len(cohorts) * weeks).reshape(len(cohorts), weeks)
+    return [{"cohort": day_of(week * 7 - WEEK_OFFSET), "users": int(row[0]), "weeks": row.tolist()}
+            for week, row in zip(cohorts, matrix)]
+
+
+def _date(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线分析导出与查询")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="增量导出到 Parquet")
+    export_parser.add_argument("--source", help="数据库URL，默认使用只读副本（未配置时为主库）")
+    dau_parser = commands.add_parser("dau", help="每日活跃用户数")
+    dau_parser.add_argument("--start", type=_date)
+    dau_parser.add_argument("--end", type=_date)
+    retention_parser = commands.add_parser("retention", help="D1/D7/D30 留存")
+    retention_parser.add_argument("--offsets", type=int, nargs="+", default=list(streaks.OFFSETS))
+    cohort_parser = commands.add_parser("cohort", help="周同期群留存矩阵")
+    cohort_parser.add_argument("--weeks", type=int, default=8)
+    for command in (export_parser, dau_parser, retention_parser, cohort_parser):
+        command.add_argument("--dir", default="analytics", help="导出目录")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "export":
+        import database
+        from sqlalchemy import create_engine
+
+        engine = create_engine(args.source) if args.source else \
+            (database.replica_engines[0] if database.replica_engines else database.engine)
+        print(export(engine, args.dir))
+    elif args.command == "dau":
+        for day, count in dau(args.dir, args.start, args.end):
+            print(f"{day}  {count:>8}")
+    elif args.command == "retention":
+        for row in retention(args.dir, args.offsets):
+            rates = "  ".join(f"d{offset}={'-' if row[f'd{offset}'] is None else format(row[f'd{offset}'], '.1%'):>6}"
+                              for offset in args.offsets)
+            print(f"{row['cohort']}  {row['users']:>8}  {rates}")
+    else:
+        for row in cohort(args.dir, args.weeks):
+            print(f"{row['cohort']}  {row['users']:>8}  " + " ".join(f"{count:>7}" for count in row["weeks"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 import models, schemas, crud
-from database import SessionLocal
+from database import ReadSession, get_db, get_user_read_db
+from http_cache import user_cache
+from serializers import dump_models, dump_rows
+import config
+import singleflight
 from typing import List
 
 router = APIRouter(prefix="/achievements", tags=["achievements"])
 
-def get_db():
-    db = SessionLocal()
+# 并发的成就目录请求只查询和序列化一次
+catalog_reads = singleflight.Group("/achievements/")
+
+
+def _catalog() -> bytes:
+    db = ReadSession()
     try:
-        yield db
+        if config.FAST_JSON:
+            return dump_rows(schemas.AchievementOut, crud.get_achievement_rows(db))
+        return dump_models(schemas.AchievementOut, crud.get_achievements(db))
     finally:
         db.close()
 
+
 @router.get("/", response_model=List[schemas.AchievementOut])
-def get_achievements(db: Session = Depends(get_db)):
-    return crud.get_achievements(db)
+async def get_achievements():
+    """成就目录，所有用户相同，可由客户端和中间代理缓存（压缩中间件也按内容缓存其压缩结果）"""
+    return Response(content=await catalog_reads.do((), _catalog), media_type="application/json",
+                    headers={"Cache-Control": f"public, max-age={config.CATALOG_MAX_AGE}"})
 
 @router.post("/{user_id}/unlock/{achievement_id}", response_model=schemas.UserAchievementOut)
 def unlock_achievement(user_id: int, achievement_id: int, db: Session = Depends(get_db)):
     return crud.unlock_achievement(db, user_id, achievement_id)
 
-@router.get("/{user_id}/user", response_model=List[schemas.UserAchievementOut])
-def get_user_achievements(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}/user", response_model=List[schemas.UserAchievementOut], dependencies=[Depends(user_cache)])
+def get_user_achievements(user_id: int, db: Session = Depends(get_user_read_db)):
     return crud.get_user_achievements(db, user_id)
+
+@router.get("/{user_id}/progress", response_model=schemas.UserAchievementProgressOut, dependencies=[Depends(user_cache)])
+def get_achievement_progress(user_id: int, db: Session = Depends(get_user_read_db)):
+    """已解锁的成就和各规则的进度，只读该用户的一行进度"""
+    return crud.get_achievement_progress(db, user_id)
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from fnmatch import fnmatchcase
+from typing import Optional
+import asyncio
+import hmac
+import config
+import sqltrace
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """校验管理员令牌，未配置令牌时拒绝所有请求"""
+    # 常数时间比较，不从响应耗时泄露令牌前缀
+    if not config.ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+@router.get("/slow-queries", dependencies=[Depends(require_admin)])
+def get_slow_queries(limit: int = 50):
+    """最近的慢查询记录（新的在前）"""
+    return list(reversed(sqltrace.slow_queries))[:limit]
+
+@router.get("/traces", dependencies=[Depends(require_admin)])
+def get_traces(limit: int = 20):
+    """最近采样请求的SQL时间线（新的在前）"""
+    return [trace.to_dict() for trace in list(reversed(sqltrace.traces))[:limit]]
+
+@router.get("/traces/{trace_id}", dependencies=[Depends(require_admin)])
+def get_trace(trace_id: int):
+    """单个请求的SQL时间线"""
+    for trace in list(sqltrace.traces):
+        if trace.id == trace_id:
+            return trace.to_dict()
+    raise HTTPException(status_code=404, detail="轨迹不存在或已被淘汰")
+
+
+def _walk_routes(routes):
+    """展开路由表（部分 FastAPI 版本把 include_router 保留为子路由器）"""
+    for route in routes:
+        nested = getattr(getattr(route, "original_router", None), "routes", None)
+        if nested is not None:
+            yield from _walk_routes(nested)
+        else:
+            yield route
+
+@router.get("/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(request: Request, seconds: float = Query(5, gt=0), route: Optional[str] = None):
+    """
+    对当前工作进程采样剖析 seconds 秒，返回折叠栈（可直接用于生成火焰图）
+    route 为路由模板的通配模式（如 /leaderboard/*），只保留处理这些路由的调用栈
+    """
+    if seconds > config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"采集时间不能超过{config.PROFILE_MAX_SECONDS:g}秒")
+    # 剖析器只在调试时用到，按需导入，不计入工作进程启动耗时
+    import profiler
+    target_codes = None
+    if route:
+        endpoints = [r.endpoint for r in _walk_routes(request.app.routes)
+                     if fnmatchcase(getattr(r, "path", ""), route) and hasattr(r, "endpoint")]
+        if not endpoints:
+            raise HTTPException(status_code=400, detail="没有匹配的路由")
+        target_codes = profiler.endpoint_codes(endpoints)
+
+    sampler = profiler.SamplingProfiler(config.PROFILE_INTERVAL_MS / 1000, target_codes)
+    try:
+        sampler.start()
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="已有剖析任务正在进行")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = sampler.stop()
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(sampler.samples)})
\ No newline at end of file
@@ -1,18 +1,79 @@
-from fastapi import APIRouter, Depends
+from email.utils import formatdate
+
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
+import schemas, crud
+from database import ReadSession, get_user_read_db
+from http_cache import etag_matches
+from serializers import dump_models, dump_rows, json_response
+from compression import precompressed_response
+import config
+import singleflight
+import snapshots
 from typing import List
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
-def get_db():
-    db = SessionLocal()
+# 好友排行榜单次最多返回的条数
+FRIENDS_LIMIT = 200
+
+# 并发的相同读取（同一页的查询、快照过期时的重建）只执行一次
+reads = singleflight.Group("/leaderboard/{period}")
+
+
+def _snapshot_headers(snapshot: snapshots.Snapshot) -> dict:
+    age = snapshot.age()
+    return {
+        "Age": str(int(age)),
+        "Last-Modified": formatdate(snapshot.built_at, usegmt=True),
+        "Cache-Control": f"public, max-age={max(0, int(config.LEADERBOARD_REFRESH_SECONDS - age))}",
+    }
+
+
+def _query(period: str, page: int) -> bytes:
+    """关闭快照时直接查询数据库"""
+    db = ReadSession()
     try:
-        yield db
+        offset = (page - 1) * config.LEADERBOARD_PAGE_SIZE
+        if config.FAST_JSON:
+            return dump_rows(schemas.LeaderboardOut,
+                             crud.get_leaderboard_rows(db, period, config.LEADERBOARD_PAGE_SIZE, offset))
+        return dump_models(schemas.LeaderboardOut,
+                           crud.get_leaderboard(db, period, config.LEADERBOARD_PAGE_SIZE, offset))
     finally:
         db.close()
 
+
 @router.get("/{period}", response_model=List[schemas.LeaderboardOut])
-def get_leaderboard(period: str, db: Session = Depends(get_db)):
-    return crud.get_leaderboard(db, period)
+async def get_leaderboard(period: str, request: Request, page: int = Query(1, ge=1)):
+    """
+    排行榜第 page 页，只包含前 LEADERBOARD_SNAPSHOT_SIZE 名。
+    返回快照中预先编码（按 Accept-Encoding 选择预先压缩）的字节串，Age 为快照生成至今的秒数，Last-Modified 为快照生成时间
+    """
+    if config.LEADERBOARD_REFRESH_SECONDS <= 0:
+        body = await reads.do((period, page), _query, period, page)
+        return Response(content=body, media_type="application/json")
+    snapshot = snapshots.fresh() or await reads.do("snapshot", snapshots.current)
+    cached = snapshot.page(period, page)
+    headers = {"ETag": cached.etag, **_snapshot_headers(snapshot)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return precompressed_response(request, cached.body, cached.variants, headers)
+
+
+@router.get("/{period}/friends/{user_id}", response_model=List[schemas.FriendRankOut])
+def get_friends_leaderboard(period: str, user_id: int, limit: int = Query(50, ge=1, le=FRIENDS_LIMIT),
+                            db: Session = Depends(get_user_read_db)):
+    """
+    本人和其关注的用户在 period 排行榜中名次最靠前的 limit 个。
+    关注列表按用户缓存（关注/取消关注时失效），名次来自排行榜快照的分数缓存；关闭快照时按名次遍历排行榜并逐行判断关注关系
+    """
+    if config.LEADERBOARD_REFRESH_SECONDS <= 0:
+        rows = crud.get_friend_leaderboard_rows(db, period, user_id, limit)
+        return json_response(schemas.FriendRankOut, [(position, *row) for position, row in enumerate(rows, 1)])
+    snapshot = snapshots.current()
+    ranking = snapshot.rankings.get(period)
+    rows = ranking.top(crud.get_friend_ids(db, user_id), limit) if ranking is not None else []
+    return json_response(schemas.FriendRankOut, rows, headers={**_snapshot_headers(snapshot),
+                                                               "Cache-Control": "private, no-cache"})
@@ -1,22 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 import models, schemas, crud
-from database import SessionLocal
+from database import get_db, get_user_read_db
+from http_cache import user_cache
+from serializers import json_response
+import config
 from typing import List
 
 router = APIRouter(prefix="/meditation", tags=["meditation"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/{user_id}/sessions", response_model=schemas.MeditationSessionOut)
 def create_session(user_id: int, session: schemas.MeditationSessionCreate, db: Session = Depends(get_db)):
     return crud.create_meditation_session(db, user_id, session)
 
-@router.get("/{user_id}/sessions", response_model=List[schemas.MeditationSessionOut])
-def get_sessions(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}/sessions", response_model=List[schemas.MeditationSessionOut], dependencies=[Depends(user_cache)])
+def get_sessions(user_id: int, response: Response, db: Session = Depends(get_user_read_db)):
+    if config.FAST_JSON:
+        return json_response(schemas.MeditationSessionOut, crud.get_meditation_session_rows(db, user_id), headers=response.headers)
     return crud.get_meditation_sessions(db, user_id)
@@ -1,26 +1,27 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from sqlalchemy.orm import Session
 import models, schemas, crud
-from database import SessionLocal
+from database import get_db, get_read_db, get_user_read_db
+from http_cache import user_cache
+from serializers import json_response
+import config
 from typing import List
 
 router = APIRouter(prefix="/share", tags=["share"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/tasks", response_model=List[schemas.ShareTaskOut])
-def get_share_tasks(db: Session = Depends(get_db)):
+def get_share_tasks(response: Response, db: Session = Depends(get_read_db)):
+    """分享任务目录，所有用户相同，可由客户端和中间代理缓存（压缩中间件也按内容缓存其压缩结果）"""
+    headers = {"Cache-Control": f"public, max-age={config.CATALOG_MAX_AGE}"}
+    if config.FAST_JSON:
+        return json_response(schemas.ShareTaskOut, crud.get_share_task_rows(db), headers=headers)
+    response.headers.update(headers)
     return crud.get_share_tasks(db)
 
 @router.post("/{user_id}/complete/{task_id}", response_model=schemas.UserShareTaskOut)
 def complete_task(user_id: int, task_id: int, db: Session = Depends(get_db)):
     return crud.complete_share_task(db, user_id, task_id)
 
-@router.get("/{user_id}/user", response_model=List[schemas.UserShareTaskOut])
-def get_user_share_tasks(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}/user", response_model=List[schemas.UserShareTaskOut], dependencies=[Depends(user_cache)])
+def get_user_share_tasks(user_id: int, db: Session = Depends(get_user_read_db)):
     return crud.get_user_share_tasks(db, user_id)
@@ -1,19 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import models, schemas, crud
-from database import SessionLocal
+from database import get_user_read_db
+from http_cache import user_cache
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@router.get("/{user_id}", response_model=schemas.UserStatOut)
-def get_user_stat(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}", response_model=schemas.UserStatOut, dependencies=[Depends(user_cache)])
+def get_user_stat(user_id: int, db: Session = Depends(get_user_read_db)):
     stat = crud.get_user_stat(db, user_id)
     if not stat:
         raise HTTPException(status_code=404, detail="统计数据不存在")
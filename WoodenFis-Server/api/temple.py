@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+import schemas, crud
+from database import get_db, get_read_db
+from serializers import json_response
+import config
+from typing import List
+
+router = APIRouter(prefix="/temples", tags=["temples"])
+
+@router.post("/", response_model=schemas.TempleOut)
+def create_temple(temple: schemas.TempleCreate, db: Session = Depends(get_db)):
+    if crud.get_temple_by_name(db, temple.name):
+        raise HTTPException(status_code=400, detail="寺庙名称已存在")
+    return crud.create_temple(db, temple)
+
+@router.get("/leaderboard", response_model=List[schemas.TempleOut])
+def get_temple_leaderboard(limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+                           db: Session = Depends(get_read_db)):
+    """按总敲击数排名，读取已维护的总数，不汇总成员"""
+    if config.FAST_JSON:
+        return json_response(schemas.TempleOut, crud.get_temple_leaderboard_rows(db, limit, offset))
+    return crud.get_temple_leaderboard(db, limit, offset)
+
+@router.get("/{temple_id}", response_model=schemas.TempleOut)
+def get_temple(temple_id: int, db: Session = Depends(get_read_db)):
+    temple = crud.get_temple(db, temple_id)
+    if not temple:
+        raise HTTPException(status_code=404, detail="寺庙不存在")
+    return temple
+
+@router.get("/{temple_id}/members", response_model=List[schemas.TempleMemberOut])
+def get_temple_members(temple_id: int, limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                       db: Session = Depends(get_read_db)):
+    return crud.get_temple_members(db, temple_id, limit, offset)
+
+@router.post("/{temple_id}/members/{user_id}", response_model=schemas.TempleMemberOut)
+def join_temple(temple_id: int, user_id: int, db: Session = Depends(get_db)):
+    """加入寺庙；已在其他寺庙时转入"""
+    if not crud.get_temple(db, temple_id):
+        raise HTTPException(status_code=404, detail="寺庙不存在")
+    if not crud.get_user(db, user_id):
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return crud.join_temple(db, user_id, temple_id)
+
+@router.delete("/{temple_id}/members/{user_id}", status_code=204)
+def leave_temple(temple_id: int, user_id: int, db: Session = Depends(get_db)):
+    if not crud.leave_temple(db, user_id, temple_id):
+        raise HTTPException(status_code=404, detail="不是该寺庙的成员")
+    return Response(status_code=204)
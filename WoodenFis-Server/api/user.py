@@ -1,21 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 import models, schemas, crud
-from database import SessionLocal
-from typing import List
+from database import SessionLocal, get_db, get_read_db, get_user_read_db
+from http_cache import user_cache
+from serializers import json_response
+from typing import List, Optional
+import asyncio
 import random
 import string
+import time
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def generate_verification_code() -> str:
     """生成6位数字验证码"""
     return ''.join(random.choices(string.digits, k=6))
@@ -101,8 +100,8 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     
     return crud.create_user(db, user, hashed_password)
 
-@router.get("/{user_id}", response_model=schemas.UserOut)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}", response_model=schemas.UserOut, dependencies=[Depends(user_cache)])
+def get_user(user_id: int, db: Session = Depends(get_user_read_db)):
     """
     获取用户信息
     """
@@ -110,3 +109,104 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     return user
+
+
+@router.post("/{user_id}/following/{followee_id}", response_model=schemas.FollowOut)
+def follow_user(user_id: int, followee_id: int, db: Session = Depends(get_db)):
+    """
+    关注用户（重复关注返回原记录）
+    """
+    if followee_id == user_id:
+        raise HTTPException(status_code=400, detail="不能关注自己")
+    if crud.get_user(db, user_id) is None or crud.get_user(db, followee_id) is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    relation = crud.follow(db, user_id, followee_id)
+    return schemas.FollowOut(user_id=relation.followee_id, created_at=relation.created_at)
+
+@router.delete("/{user_id}/following/{followee_id}", status_code=204)
+def unfollow_user(user_id: int, followee_id: int, db: Session = Depends(get_db)):
+    """
+    取消关注
+    """
+    if not crud.unfollow(db, user_id, followee_id):
+        raise HTTPException(status_code=404, detail="未关注该用户")
+    return Response(status_code=204)
+
+@router.get("/{user_id}/following", response_model=List[schemas.FollowOut], dependencies=[Depends(user_cache)])
+def get_following(user_id: int, limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                  db: Session = Depends(get_user_read_db)):
+    """
+    关注列表，按用户ID排序分页
+    """
+    return json_response(schemas.FollowOut, crud.get_following(db, user_id, limit, offset))
+
+@router.get("/{user_id}/followers", response_model=List[schemas.FollowOut])
+def get_followers(user_id: int, limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                  db: Session = Depends(get_read_db)):
+    """
+    粉丝列表，按用户ID排序分页
+    """
+    return json_response(schemas.FollowOut, crud.get_followers(db, user_id, limit, offset))
+
+
+# 首页聚合：分区名 -> (查询函数, 输出模型)
+DASHBOARD_SECTIONS = {
+    "user": (crud.get_user, schemas.UserOut),
+    "stat": (crud.get_user_stat, schemas.UserStatOut),
+    "sessions": (crud.get_meditation_sessions, schemas.MeditationSessionOut),
+    "achievements": (crud.get_user_achievements, schemas.UserAchievementOut),
+    "share_tasks": (crud.get_user_share_tasks, schemas.UserShareTaskOut),
+}
+
+def _concurrent_reads(db: Session) -> bool:
+    """
+    请求会话直接绑定到文件数据库引擎（主库或只读副本）时，各分区可使用同一引擎的独立会话并发查询；
+    会话绑定在外部连接/事务上（如测试）或使用内存库时只能共用请求会话顺序查询
+    """
+    bind = db.get_bind()
+    return isinstance(bind, Engine) and bind.url.database not in (None, "", ":memory:")
+
+def _load_section(name: str, user_id: int, db: Optional[Session] = None, bind: Optional[Engine] = None):
+    """查询单个分区并转换为输出模型，返回 (数据, 耗时毫秒)；未传入会话时在 bind 上新建会话"""
+    query, schema = DASHBOARD_SECTIONS[name]
+    start = time.perf_counter()
+    own_session = db is None
+    if own_session:
+        db = SessionLocal(bind=bind)
+    try:
+        result = query(db, user_id)
+        if isinstance(result, list):
+            data = [schema.model_validate(item) for item in result]
+        else:
+            data = schema.model_validate(result) if result is not None else None
+    finally:
+        if own_session:
+            db.close()
+    return data, round((time.perf_counter() - start) * 1000, 3)
+
+@router.get("/{user_id}/dashboard", response_model=schemas.DashboardOut,
+            response_model_exclude_unset=True, dependencies=[Depends(user_cache)])
+async def get_dashboard(user_id: int, fields: Optional[str] = None, db: Session = Depends(get_user_read_db)):
+    """
+    首页聚合数据，一次请求返回用户信息、统计、冥想记录、成就和分享任务
+    fields 为逗号分隔的分区名，缺省返回全部分区
+    """
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(DASHBOARD_SECTIONS)
+    unknown = [name for name in names if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的数据分区: {','.join(unknown)}")
+    names = list(dict.fromkeys(names))
+
+    if _concurrent_reads(db):
+        bind = db.get_bind()
+        results = await asyncio.gather(*(run_in_threadpool(_load_section, name, user_id, bind=bind) for name in names))
+    else:
+        results = await run_in_threadpool(lambda: [_load_section(name, user_id, db) for name in names])
+
+    sections = dict(zip(names, results))
+    if "user" in sections and sections["user"][0] is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return schemas.DashboardOut(
+        **{name: data for name, (data, _) in sections.items()},
+        timings={name: elapsed for name, (_, elapsed) in sections.items()},
+    )
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+批处理任务的数据代数
+
+日切、连续打卡、成就进度重建、分区归档等任务在服务进程之外按批改写用户数据，不经过 crud，
+也不会递增工作进程内存中的用户版本号，条件请求会一直返回旧数据的304。这些任务在每批的事务中调用 bump()，
+递增 batch_generations 中本任务的代数（与数据同时提交）；工作进程启动时和之后每隔 BATCH_POLL_SECONDS 秒
+读取所有任务代数之和（refresh），编入 ETag，Last-Modified 取用户写入时间和最近一批提交时间中较晚的。
+
+批处理提交后，所有用户的条件请求在一个轮询间隔内失效。失效是全量的，但这些任务每天只运行几次、
+每次提交若干批，代价是客户端多拉取一次完整响应。
+"""
+
+import asyncio
+import calendar
+import logging
+from datetime import datetime
+from typing import Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+
+import models
+
+logger = logging.getLogger("woodenfis.batches")
+
+# (代数之和, 最近一批的提交时间戳)
+_state: Tuple[int, int] = (0, 0)
+
+
+def bump(conn, job: str) -> None:
+    """在调用方的事务中递增任务 job 的代数"""
+    table = models.BatchGeneration.__table__
+    now = datetime.utcnow()
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(table).values(job=job, generation=1, updated_at=now)
+    conn.execute(statement.on_conflict_do_update(index_elements=[table.c.job], set_={
+        "generation": table.c.generation + 1, "updated_at": now}))
+
+
+def refresh(engine) -> Tuple[int, int]:
+    """重新读取所有任务的代数之和和最近一批的提交时间"""
+    global _state
+    table = models.BatchGeneration.__table__
+    with engine.connect() as conn:
+        generation, updated_at = conn.execute(
+            select(func.coalesce(func.sum(table.c.generation), 0), func.max(table.c.updated_at))).one()
+    _state = (int(generation), calendar.timegm(updated_at.utctimetuple()) if updated_at else 0)
+    return _state
+
+
+def generation() -> int:
+    return _state[0]
+
+
+def modified() -> int:
+    """最近一批的提交时间戳，没有批处理提交过时为0"""
+    return _state[1]
+
+
+def reset() -> None:
+    global _state
+    _state = (0, 0)
+
+
+async def run_poller(engine, interval: float) -> None:
+    """后台轮询任务，由 lifespan 启动和取消；读取失败时沿用上一次的代数"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(refresh, engine)
+        except Exception:
+            logger.exception("读取批处理代数失败")
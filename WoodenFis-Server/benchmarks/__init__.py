@@ -0,0 +1,4 @@
+"""
+服务端性能基准测试
+在 WoodenFis-Server 目录下以 `python -m benchmarks.<name>` 运行
+"""
@@ -0,0 +1,101 @@
+"""
+好友排行榜基准
+
+在（通常由 benchmarks.seed 生成的百万用户）库上为测试用户写入关注关系（默认分别关注 5000 和 10 个随机用户，
+另有一个用户关注排名最靠后的 5000 人，对应按名次遍历的最坏情况），对比四种取前 --limit 名的方式，输出各自的延迟分位数：
+- cached：缓存的关注列表 + 快照分数缓存上的二分查找和有界选择（接口默认路径）
+- cold：同上，但每次读关注列表（关注/取消关注后的第一次请求）
+- query：沿 (period, rank) 索引按名次遍历并逐行判断关注关系（关闭快照时的路径）
+- join_sort：关注表 JOIN 排行榜后排序
+结束后删除写入的关注关系。分数缓存的读取耗时单独列出（只在排行榜变化时发生）。
+
+用法:
+    python -m benchmarks.friends --database sqlite:///./bench_1m.db
+    python -m benchmarks.friends --database sqlite:///./bench_1m.db --followees 5000 10 --runs 200
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine, delete, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import migrations
+import models
+import snapshots
+
+JOIN_SORT = text(
+    "SELECT l.user_id, l.rank, l.tap_count FROM follows f JOIN leaderboard l "
+    "ON l.user_id = f.followee_id AND l.period = :period "
+    "WHERE f.follower_id = :user_id ORDER BY l.rank LIMIT :limit")
+
+
+def _timed(function, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(statistics.median(samples), 3), "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3),
+            "rows": len(result)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="好友排行榜基准")
+    parser.add_argument("--database", required=True, help="数据库URL，如 sqlite:///./bench_1m.db")
+    parser.add_argument("--period", default="daily")
+    parser.add_argument("--followees", type=int, nargs="+", default=[5000, 10], help="各测试用户关注的人数")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database)
+    migrations.upgrade(engine)
+    db = sessionmaker(bind=engine)()
+    rng = random.Random(args.seed)
+    max_user = db.execute(select(func.max(models.User.id))).scalar()
+    board = models.Leaderboard
+    cases = {f"followees_{count}": rng.sample(range(len(args.followees) + 2, max_user + 1), count)
+             for count in args.followees}
+    cases[f"followees_{max(args.followees)}_low_ranked"] = db.execute(
+        select(board.user_id).where(board.period == args.period).order_by(board.rank.desc())
+        .limit(max(args.followees))).scalars().all()
+    followers = dict(zip(cases, range(1, len(cases) + 1)))
+    with engine.begin() as conn:
+        conn.execute(delete(models.Follow.__table__).where(models.Follow.follower_id.in_(followers.values())))
+        for case, followees in cases.items():
+            conn.execute(insert(models.Follow.__table__),
+                         [{"follower_id": followers[case], "followee_id": followee}
+                          for followee in followees if followee != followers[case]])
+
+    try:
+        start = time.perf_counter()
+        ranking = snapshots.load_ranking(db, args.period, ())
+        report = {"ranking_rows": len(ranking.user_ids),
+                  "ranking_load_seconds": round(time.perf_counter() - start, 3),
+                  "ranking_bytes": ranking.user_ids.nbytes + ranking.ranks.nbytes + ranking.tap_counts.nbytes}
+        for case, follower in followers.items():
+            cached = lambda: ranking.top(crud.get_friend_ids(db, follower), args.limit)
+            cold = lambda: ranking.top([follower, *crud.get_followee_ids(db, follower)], args.limit)
+            query = lambda: crud.get_friend_leaderboard_rows(db, args.period, follower, args.limit)
+            join_sort = lambda: db.execute(JOIN_SORT, {"period": args.period, "user_id": follower,
+                                                       "limit": args.limit}).all()
+            expected = [(user_id, rank) for _, user_id, rank, _ in cached()]
+            assert expected == [(user_id, rank) for user_id, rank, _ in query()]
+            report[case] = {name: _timed(function, args.runs) for name, function in
+                            (("cached", cached), ("cold", cold), ("query", query), ("join_sort", join_sort))}
+    finally:
+        db.close()
+        with engine.begin() as conn:
+            conn.execute(delete(models.Follow.__table__).where(models.Follow.follower_id.in_(followers.values())))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
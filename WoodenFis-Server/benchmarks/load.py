@@ -0,0 +1,282 @@
+"""
+服务端负载基准
+
+在临时数据库上启动本地 uvicorn 服务，用异步HTTP负载生成器依次压测各场景，
+输出吞吐量、延迟分位数和每请求SQL语句数（来自 /metrics），并与保存的基线对比。
+基线记录了采集时的压测参数和机器（CPU数、平台、Python和SQLite版本）：参数不同时跳过对比；
+机器不同时吞吐量和延迟没有可比性，只对比每请求SQL语句数和错误数。
+
+场景：
+- login_storm：发送验证码 + 验证码登录（新用户自动注册）
+- tap_flush：上报冥想会话（敲击数落库）
+- leaderboard_read：读取日排行榜
+- catalog_read：读取成就目录（并发的相同请求合并为一次查询）
+- dashboard_fetch：读取首页聚合数据
+
+用法:
+    python -m benchmarks.load                      # 运行全部场景并与基线对比
+    python -m benchmarks.load --scenarios leaderboard_read --duration 10
+    python -m benchmarks.load --update-baseline    # 用本次结果覆盖基线
+    python -m benchmarks.load --database bench_1m.db --users 1000000   # 在 benchmarks.seed 生成的大库上压测
+回归超过阈值时退出码为1。
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+from benchmarks import seed
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+DB_QUERIES_METRIC = re.compile(r"^woodenfis_db_queries_total (\S+)$", re.MULTILINE)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """通过 main.py 在子进程中启动服务（多工作进程时带协调端），退出时终止"""
+
+    def __init__(self, database_url: str, workers: int = 1, extra_env: Dict[str, str] = None):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        # 压测流量都来自本机地址，且衡量的是满载吞吐量，关闭限流和过载保护
+        self.env = {**os.environ, "WOODENFIS_DATABASE_URL": database_url, "WOODENFIS_RATE_LIMIT": "0",
+                    "WOODENFIS_LOAD_SHEDDING": "0", **(extra_env or {})}
+        self.workers = workers
+        self.process = None
+
+    def __enter__(self) -> "LocalServer":
+        self.process = subprocess.Popen(
+            [sys.executable, "main.py", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=SERVER_DIR, env=self.env,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/", timeout=1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError("服务启动超时")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# 场景：接收 (client, worker_id, iteration)，完成一次业务操作，返回HTTP状态码是否成功
+Scenario = Callable[[httpx.AsyncClient, int, int], Awaitable[bool]]
+
+
+def make_scenarios(users: int) -> Dict[str, Scenario]:
+    logins = itertools.count()
+
+    async def login_storm(client, worker, iteration):
+        # 新用户名取手机号后4位，保证后4位不重复以免用户名冲突
+        phone = f"138{next(logins) % 10000:08d}"
+        sent = await client.post("/users/send-code", json={"phone": phone})
+        if sent.status_code != 200:
+            return False
+        code = sent.json()["message"].split("测试用验证码: ")[1]
+        return (await client.post("/users/login", json={"phone": phone, "code": code})).status_code == 200
+
+    async def tap_flush(client, worker, iteration):
+        user_id = random.randint(1, users)
+        response = await client.post(f"/meditation/{user_id}/sessions",
+                                     json={"duration": 60, "tap_count": random.randint(1, 300)})
+        return response.status_code == 200
+
+    async def leaderboard_read(client, worker, iteration):
+        return (await client.get("/leaderboard/daily")).status_code == 200
+
+    async def catalog_read(client, worker, iteration):
+        return (await client.get("/achievements/")).status_code == 200
+
+    async def dashboard_fetch(client, worker, iteration):
+        return (await client.get(f"/users/{random.randint(1, users)}/dashboard")).status_code == 200
+
+    return {
+        "login_storm": login_storm,
+        "tap_flush": tap_flush,
+        "leaderboard_read": leaderboard_read,
+        "catalog_read": catalog_read,
+        "dashboard_fetch": dashboard_fetch,
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def _db_queries(client: httpx.AsyncClient) -> float:
+    match = DB_QUERIES_METRIC.search((await client.get("/metrics")).text)
+    return float(match.group(1)) if match else 0.0
+
+
+async def run_scenario(base_url: str, scenario: Scenario, concurrency: int, duration: float) -> dict:
+    """以固定并发持续压测 duration 秒"""
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        queries_before = await _db_queries(client)
+        deadline = time.perf_counter() + duration
+
+        async def worker(worker_id: int):
+            nonlocal errors
+            iteration = 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = await scenario(client, worker_id, iteration)
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+                iteration += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        queries = await _db_queries(client) - queries_before
+
+    latencies.sort()
+    operations = len(latencies)
+    return {
+        "operations": operations,
+        "errors": errors,
+        "throughput_ops": round(operations / elapsed, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(percentile(latencies, 0.90) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "db_queries_per_op": round(max(queries, 0) / operations, 2) if operations else 0.0,
+    }
+
+
+def machine() -> dict:
+    """压测机器的描述，吞吐量和延迟只在相同机器上可比"""
+    return {"cpus": os.cpu_count(), "system": platform.system(), "arch": platform.machine(),
+            "processor": platform.processor() or None, "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float,
+            same_machine: bool = True) -> List[str]:
+    """返回超过阈值的回归项；不是同一台机器时只对比每请求SQL语句数和错误数"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if same_machine and result["throughput_ops"] < base["throughput_ops"] * (1 - threshold):
+            regressions.append(f"{name}: 吞吐量 {result['throughput_ops']} < 基线 {base['throughput_ops']}")
+        if same_machine and result["latency_ms"]["p99"] > base["latency_ms"]["p99"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {result['latency_ms']['p99']}ms > 基线 {base['latency_ms']['p99']}ms")
+        if result["db_queries_per_op"] > base["db_queries_per_op"] * (1 + threshold) + 0.5:
+            regressions.append(f"{name}: 每请求SQL {result['db_queries_per_op']} > 基线 {base['db_queries_per_op']}")
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: 错误数 {result['errors']} > 基线 {base.get('errors', 0)}")
+    return regressions
+
+
+def main():
+    scenario_names = list(make_scenarios(0))
+    parser = argparse.ArgumentParser(description="服务端负载基准")
+    parser.add_argument("--scenarios", default=",".join(scenario_names), help="逗号分隔的场景名")
+    parser.add_argument("--duration", type=float, default=5.0, help="每个场景的压测时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000, help="预置用户数（使用 --database 时为该库的用户数）")
+    parser.add_argument("--database", type=Path, help="预先生成的SQLite库文件，压测在其副本上进行")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的回归比例")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--output", type=Path, help="结果JSON输出路径")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    scenarios = make_scenarios(args.users)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"未知场景: {','.join(unknown)}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = Path(tmp) / "bench.db"
+        if args.database:
+            shutil.copyfile(args.database, database_path)
+        else:
+            seed.generate(f"sqlite:///{database_path}", args.users, sessions_per_user=2)
+        database_url = f"sqlite:///{database_path}"
+        with LocalServer(database_url, workers=args.workers) as server:
+            for name in selected:
+                results[name] = asyncio.run(run_scenario(server.base_url, scenarios[name], args.concurrency, args.duration))
+                print(f"{name}: {json.dumps(results[name], ensure_ascii=False)}", file=sys.stderr)
+
+    report = {
+        "config": {"duration": args.duration, "concurrency": args.concurrency,
+                   "users": args.users, "workers": args.workers,
+                   "database": args.database.name if args.database else None},
+        "machine": machine(),
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding="utf-8")
+    print(output)
+
+    if args.update_baseline:
+        args.baseline.write_text(output + "\n", encoding="utf-8")
+        return
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline["config"] != report["config"]:
+            print("基线的压测参数与本次不同，跳过对比", file=sys.stderr)
+            return
+        same_machine = baseline.get("machine") == report["machine"]
+        if not same_machine:
+            print("基线不是在本机采集的，只对比每请求SQL语句数和错误数；"
+                  "在本机用 --update-baseline 重新生成后才对比吞吐量和延迟", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold, same_machine)
+        for line in regressions:
+            print(f"性能回归 {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
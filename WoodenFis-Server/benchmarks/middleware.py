@@ -0,0 +1,61 @@
+"""
+指标中间件单请求开销微基准
+
+直接以ASGI方式调用一个空应用，对比挂载 MetricsMiddleware 前后的单请求耗时差。
+
+用法: python -m benchmarks.middleware --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from starlette.routing import Route
+
+from metrics import MetricsMiddleware
+
+
+async def empty_app(scope, receive, send):
+    """模拟已完成路由匹配的最小应用"""
+    scope["route"] = ROUTE
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+ROUTE = Route("/bench/{item_id}", endpoint=empty_app)
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    """返回单请求平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/bench/1"}, receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标中间件单请求开销微基准")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    bare = asyncio.run(run(empty_app, args.requests))
+    instrumented = asyncio.run(run(MetricsMiddleware(empty_app), args.requests))
+    print(json.dumps({
+        "requests": args.requests,
+        "bare_us": round(bare, 3),
+        "instrumented_us": round(instrumented, 3),
+        "overhead_us": round(instrumented - bare, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
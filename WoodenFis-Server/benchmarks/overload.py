@@ -0,0 +1,70 @@
+"""
+过载保护基准
+
+在临时数据库上分别以开启和关闭过载保护启动本地服务，让少量客户端持续上报敲击的同时，
+用大量并发的首页聚合（普通优先级）和排行榜读取（低优先级）把服务压到过载，
+输出各场景的吞吐量、延迟分位数和失败数（被拒绝的503计为失败）。读取客户端收到503后按 Retry-After 等待再重试，
+与正常客户端的行为一致。用于观察开启时被拒绝的是否集中在排行榜读取、敲击上报的延迟是否比关闭时低。限流在两种情况下都关闭。
+负载生成器与服务在同一台机器上时会和服务争用CPU，应在多核机器上运行，否则瓶颈在客户端，服务端并发上不去。
+
+用法:
+    python -m benchmarks.overload --duration 10
+    python -m benchmarks.overload --tap-concurrency 4 --flood-concurrency 60
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import seed
+from benchmarks.load import LocalServer, make_scenarios, run_scenario
+
+
+def _backing_off(path: str):
+    """GET path 的场景，被拒绝时按 Retry-After 等待"""
+    async def scenario(client, worker, iteration):
+        response = await client.get(path.format(user_id=random.randint(1, scenario.users)))
+        if response.status_code in (429, 503):
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+        return response.status_code == 200
+    return scenario
+
+
+async def _run(base_url: str, args) -> dict:
+    flood = args.flood_concurrency // 2
+    dashboard, leaderboard = _backing_off("/users/{user_id}/dashboard"), _backing_off("/leaderboard/daily")
+    dashboard.users = leaderboard.users = args.users
+    names = ("tap_flush", "dashboard_fetch", "leaderboard_read")
+    results = await asyncio.gather(
+        run_scenario(base_url, make_scenarios(args.users)["tap_flush"], args.tap_concurrency, args.duration),
+        run_scenario(base_url, dashboard, flood, args.duration),
+        run_scenario(base_url, leaderboard, args.flood_concurrency - flood, args.duration))
+    return {name: {key: result[key] for key in ("operations", "errors", "throughput_ops", "latency_ms")}
+            for name, result in zip(names, results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="过载保护基准")
+    parser.add_argument("--duration", type=float, default=10.0, help="每轮压测时长（秒）")
+    parser.add_argument("--tap-concurrency", type=int, default=4, help="上报敲击的并发数")
+    parser.add_argument("--flood-concurrency", type=int, default=60, help="首页和排行榜读取的总并发数")
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        seed.generate(database_url, args.users, sessions_per_user=2)
+        for name, shedding in (("shedding_off", "0"), ("shedding_on", "1")):
+            with LocalServer(database_url, extra_env={"WOODENFIS_LOAD_SHEDDING": shedding}) as server:
+                report[name] = asyncio.run(_run(server.base_url, args))
+            print(f"{name}: {json.dumps(report[name], ensure_ascii=False)}", file=sys.stderr)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+热点查询执行计划检查
+
+在（通常由 benchmarks.seed 生成的大规模）SQLite 库上执行 crud 中的热点查询，
+捕获实际发出的SQL并逐条 EXPLAIN QUERY PLAN，标出全表扫描和临时排序。
+
+用法:
+    python -m benchmarks.query_plans --database sqlite:///./bench_1m.db
+    python -m benchmarks.query_plans --database sqlite:///./bench_1m.db --fail-on-scan
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+
+# 查询名 -> 在会话上执行查询的函数（user_id 取库中的一个真实用户）
+HOT_QUERIES: Dict[str, Callable] = {
+    "get_user": lambda db, uid: crud.get_user(db, uid),
+    "get_user_stat": lambda db, uid: crud.get_user_stat(db, uid),
+    "get_meditation_sessions": lambda db, uid: crud.get_meditation_sessions(db, uid),
+    "get_user_achievements": lambda db, uid: crud.get_user_achievements(db, uid),
+    "get_user_share_tasks": lambda db, uid: crud.get_user_share_tasks(db, uid),
+    "get_leaderboard": lambda db, uid: crud.get_leaderboard(db, "daily"),
+    "get_user_by_phone": lambda db, uid: crud.get_user_by_phone(db, f"1{uid:010d}"),
+}
+
+
+def _problems(plan: List[str]) -> List[str]:
+    """全表扫描（SCAN 且未使用索引）或需要临时B树排序；逐行读取子查询（协程）的结果不算全表扫描"""
+    coroutines = {detail.split()[-1] for detail in plan if detail.startswith("CO-ROUTINE")}
+    return [detail for detail in plan
+            if (detail.startswith("SCAN") and "USING" not in detail and detail.split()[1] not in coroutines)
+            or "USE TEMP B-TREE" in detail]
+
+
+def explain(url: str, user_id: int) -> List[dict]:
+    engine = create_engine(url)
+    captured: List[tuple] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    db = sessionmaker(bind=engine)()
+    report = []
+    for name, query in HOT_QUERIES.items():
+        captured.clear()
+        start = time.perf_counter()
+        query(db, user_id)
+        elapsed = time.perf_counter() - start
+        statements = list(captured)
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                report.append({
+                    "query": name,
+                    "ms": round(elapsed * 1000, 3),
+                    "plan": plan,
+                    "problems": _problems(plan),
+                })
+        db.expunge_all()
+    db.close()
+    engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点查询执行计划检查")
+    parser.add_argument("--database", required=True, help="SQLite数据库URL")
+    parser.add_argument("--user-id", type=int, help="用于参数化查询的用户ID，默认取中位ID")
+    parser.add_argument("--fail-on-scan", action="store_true", help="存在全表扫描或临时排序时退出码为1")
+    args = parser.parse_args()
+
+    user_id = args.user_id
+    if user_id is None:
+        engine = create_engine(args.database)
+        with engine.connect() as conn:
+            user_id = max(1, (conn.execute(text("SELECT MAX(id) FROM users")).scalar() or 2) // 2)
+        engine.dispose()
+
+    report = explain(args.database, user_id)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.fail_on_scan and any(item["problems"] for item in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
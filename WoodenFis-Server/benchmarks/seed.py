@@ -0,0 +1,285 @@
+"""
+大规模测试数据生成
+
+按接近线上的分布批量生成用户、统计、冥想会话、成就和排行榜数据：
+- 累计敲击数服从幂律分布（少数重度用户贡献大部分敲击）
+- 连续打卡天数服从几何分布，活跃度越高的用户会话和成就越多
+- 会话时间集中在最近一段时间
+
+SQLite 直接使用 sqlite3 executemany 写入（关闭日志与同步、写入期间去掉二级索引、写完后重建），
+其他数据库使用 SQLAlchemy Core 批量 executemany。百万用户（约1000万行）可在几分钟内生成。
+
+用法:
+    python -m benchmarks.seed --database sqlite:///./bench_1m.db --users 1000000
+    python -m benchmarks.seed --database sqlite:///./bench_small.db --users 10000 --sessions-per-user 3
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sqlite3
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+BATCH_SIZE = 50_000
+PERIODS = ("daily", "weekly")
+
+ACHIEVEMENTS = [
+    ("初心", "第一次敲木鱼", "star", "total_taps", 1),
+    ("百八", "累计敲击108次", "beads", "total_taps", 108),
+    ("千声", "累计敲击1000次", "bell", "total_taps", 1_000),
+    ("万念", "累计敲击10000次", "lotus", "total_taps", 10_000),
+    ("十万功德", "累计敲击100000次", "temple", "total_taps", 100_000),
+    ("三日不辍", "连续打卡3天", "calendar", "longest_streak", 3),
+    ("七日精进", "连续打卡7天", "calendar", "longest_streak", 7),
+    ("月满", "连续打卡30天", "moon", "longest_streak", 30),
+]
+SHARE_TASKS = [
+    ("分享到朋友圈", "把今日功德分享到朋友圈", 10, "moments"),
+    ("邀请好友", "邀请一位好友一起敲木鱼", 50, "invite"),
+    ("分享成就", "分享一枚已解锁的成就", 20, "trophy"),
+]
+
+
+def sqlite_datetime(value: datetime) -> str:
+    """与 SQLAlchemy SQLite DateTime 一致的存储格式"""
+    return f"{value:%Y-%m-%d %H:%M:%S}.{value.microsecond:06d}"
+
+
+class Distributions:
+    """可复现的随机分布"""
+
+    def __init__(self, seed: int, now: datetime, days: int):
+        self.rng = random.Random(seed)
+        self.now = now
+        self.days = days
+
+    def total_taps(self) -> int:
+        # 帕累托分布 alpha≈1.16 对应 80/20 法则
+        return min(int((self.rng.paretovariate(1.16) - 1) * 200), 5_000_000)
+
+    def streak(self, activity: float) -> int:
+        return min(int(self.rng.expovariate(1 / (2 + activity * 10))), self.days)
+
+    def moment(self, recency: float = 3.0) -> datetime:
+        # 越接近现在越密集
+        offset = self.days * 86400 * (self.rng.random() ** recency)
+        return self.now - timedelta(seconds=offset)
+
+
+def generate(url: str, users: int, sessions_per_user: float = 5.0, days: int = 365,
+             seed: int = 42, batch_size: int = BATCH_SIZE) -> Dict[str, dict]:
+    """生成数据并返回各表的行数与写入耗时"""
+    import migrations
+
+    engine = create_engine(url)
+    migrations.upgrade(engine)
+    dist = Distributions(seed, datetime.utcnow().replace(microsecond=0), days)
+    is_sqlite = make_url(url).get_backend_name() == "sqlite"
+    fmt: Callable = sqlite_datetime if is_sqlite else (lambda value: value)
+    writer = SQLiteWriter(make_url(url).database, batch_size) if is_sqlite else CoreWriter(engine, batch_size)
+
+    stats: Dict[str, dict] = {}
+    # 每个用户的累计敲击数，用于排行榜、成就和会话数的相关性
+    taps = array("q")
+
+    with writer:
+        stats["achievements"] = writer.write("achievements", ("name", "description", "icon"),
+                                             ((name, desc, icon) for name, desc, icon, _, _ in ACHIEVEMENTS))
+        stats["achievement_rules"] = writer.write("achievement_rules", ("achievement_id", "metric", "threshold"), (
+            (achievement_id, metric, threshold)
+            for achievement_id, (_, _, _, metric, threshold) in enumerate(ACHIEVEMENTS, start=1)))
+        stats["share_tasks"] = writer.write("share_tasks", ("title", "description", "merit", "icon"), iter(SHARE_TASKS))
+
+        def user_rows():
+            for user_id in range(1, users + 1):
+                total = dist.total_taps()
+                taps.append(total)
+                created = dist.moment(recency=1.0)
+                is_vip = dist.rng.random() < 0.05
+                yield (user_id, f"u{user_id}", None, f"1{user_id:010d}", None, None, is_vip,
+                       fmt(created + timedelta(days=365)) if is_vip else None, total // 10, fmt(created))
+
+        stats["users"] = writer.write("users", (
+            "id", "username", "email", "phone", "hashed_password", "avatar",
+            "is_vip", "vip_expire_date", "merit_points", "created_at"), user_rows())
+
+        # 活跃度：累计敲击数的对数归一化到 [0, 1]
+        max_log = max(1.0, max((t.bit_length() for t in taps), default=1))
+
+        def activity(user_id: int) -> float:
+            return taps[user_id - 1].bit_length() / max_log
+
+        def stat_rows():
+            for user_id in range(1, users + 1):
+                total = taps[user_id - 1]
+                today = min(total, int(dist.rng.expovariate(1 / 30))) if dist.rng.random() < 0.3 else 0
+                last_tap = dist.moment()
+                yield (user_id, total, today, dist.streak(activity(user_id)), fmt(last_tap))
+
+        stats["user_stats"] = writer.write("user_stats", (
+            "user_id", "total_taps", "today_taps", "consecutive_days", "last_tap_date"), stat_rows())
+
+        def session_rows():
+            for user_id in range(1, users + 1):
+                count = int(dist.rng.expovariate(1 / (sessions_per_user * (0.2 + 1.6 * activity(user_id)))))
+                for _ in range(count):
+                    duration = int(dist.rng.lognormvariate(5.5, 0.8))  # 中位数约4分钟
+                    yield (user_id, duration, max(1, int(duration * dist.rng.uniform(0.5, 2.0))), fmt(dist.moment()))
+
+        stats["meditation_sessions"] = writer.write("meditation_sessions", (
+            "user_id", "duration", "tap_count", "created_at"), session_rows())
+
+        def user_achievement_rows():
+            for user_id in range(1, users + 1):
+                total = taps[user_id - 1]
+                for achievement_id, (_, _, _, _, threshold) in enumerate(ACHIEVEMENTS[:5], start=1):
+                    if total >= threshold:
+                        yield (user_id, achievement_id, fmt(dist.moment()))
+
+        stats["user_achievements"] = writer.write("user_achievements", (
+            "user_id", "achievement_id", "unlocked_at"), user_achievement_rows())
+
+        def share_task_rows():
+            for user_id in range(1, users + 1):
+                for task_id in range(1, len(SHARE_TASKS) + 1):
+                    if dist.rng.random() < 0.1 * (1 + activity(user_id)):
+                        yield (user_id, task_id, True, fmt(dist.moment()))
+
+        stats["user_share_tasks"] = writer.write("user_share_tasks", (
+            "user_id", "task_id", "completed", "completed_at"), share_task_rows())
+
+        def leaderboard_rows():
+            created = fmt(dist.now)
+            for period, scale in zip(PERIODS, (0.01, 0.05)):
+                scores = sorted(((int(taps[i] * scale * dist.rng.uniform(0.5, 1.5)), i + 1) for i in range(users)),
+                                reverse=True)
+                for rank, (score, user_id) in enumerate(scores, start=1):
+                    yield (user_id, period, rank, score, created)
+
+        stats["leaderboard"] = writer.write("leaderboard", (
+            "user_id", "period", "rank", "tap_count", "created_at"), leaderboard_rows())
+
+    if is_sqlite:
+        # 与线上布局一致：会话按月份搬进分区表
+        import partitions
+
+        start = time.perf_counter()
+        partitions.SESSIONS.split_default(engine, batch_size)
+        stats["meditation_sessions"]["partition_seconds"] = round(time.perf_counter() - start, 2)
+
+    # 与上线后一致：进度行已由 progress.py 回填，敲击上报只做增量更新
+    import progress
+
+    start = time.perf_counter()
+    rebuilt = progress.rebuild(engine, batch_size)
+    stats["achievement_progress"] = _stat(rebuilt["users"], time.perf_counter() - start)
+
+    engine.dispose()
+    return stats
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class SQLiteWriter:
+    """sqlite3 直写：写入期间关闭日志和同步，并临时去掉二级索引"""
+
+    def __init__(self, path: str, batch_size: int):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.batch_size = batch_size
+        self.dropped_indexes = []
+
+    def __enter__(self):
+        for pragma in ("journal_mode = OFF", "synchronous = OFF", "locking_mode = EXCLUSIVE",
+                       "temp_store = MEMORY", "cache_size = -262144"):
+            self.conn.execute(f"PRAGMA {pragma}")
+        self.dropped_indexes = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+        for name, _ in self.dropped_indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        return self
+
+    def write(self, table: str, columns: tuple, rows: Iterable[tuple]) -> dict:
+        start = time.perf_counter()
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        count = 0
+        self.conn.execute("BEGIN")
+        for batch in _batches(rows, self.batch_size):
+            self.conn.executemany(sql, batch)
+            count += len(batch)
+        self.conn.execute("COMMIT")
+        return _stat(count, time.perf_counter() - start)
+
+    def __exit__(self, *exc_info):
+        start = time.perf_counter()
+        for _, sql in self.dropped_indexes:
+            self.conn.execute(sql)
+        self.conn.execute("ANALYZE")
+        self.conn.close()
+        print(f"重建索引 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+class CoreWriter:
+    """通用数据库：SQLAlchemy Core 批量 executemany"""
+
+    def __init__(self, engine, batch_size: int):
+        from database import Base
+        import models  # noqa: F401  注册表结构
+        self.engine = engine
+        self.tables = Base.metadata.tables
+        self.batch_size = batch_size
+
+    def __enter__(self):
+        return self
+
+    def write(self, table: str, columns: tuple, rows: Iterable[tuple]) -> dict:
+        start = time.perf_counter()
+        insert = self.tables[table].insert()
+        count = 0
+        for batch in _batches(rows, self.batch_size):
+            with self.engine.begin() as conn:
+                conn.execute(insert, [dict(zip(columns, row)) for row in batch])
+            count += len(batch)
+        return _stat(count, time.perf_counter() - start)
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def _stat(rows: int, seconds: float) -> dict:
+    return {"rows": rows, "seconds": round(seconds, 2), "rows_per_second": int(rows / seconds) if seconds else rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大规模测试数据生成")
+    parser.add_argument("--database", required=True, help="目标数据库URL，如 sqlite:///./bench_1m.db（应为空库）")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--sessions-per-user", type=float, default=5.0, help="人均冥想会话数")
+    parser.add_argument("--days", type=int, default=365, help="数据覆盖的天数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = generate(args.database, args.users, args.sessions_per_user, args.days, args.seed, args.batch_size)
+    total = sum(item["rows"] for item in stats.values())
+    print(json.dumps({"tables": stats, "total_rows": total,
+                      "seconds": round(time.perf_counter() - start, 2)}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+逐行序列化开销微基准
+
+对比两条路径在相同排行榜数据上的逐行耗时：
+- 默认路径：ORM对象查询 → from_attributes 校验 → 通用JSON编码
+- 快速路径：列投影查询 → 预编译序列化器
+
+用法: python -m benchmarks.serialization --rows 1000 --repeat 20
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+import models
+import schemas
+from database import Base
+from serializers import dump_rows
+
+
+def build_session(rows: int):
+    """构建内存数据库并写入排行榜数据"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(models.Leaderboard, [
+        {"user_id": i, "period": "daily", "rank": i, "tap_count": rows - i, "created_at": now}
+        for i in range(1, rows + 1)
+    ])
+    db.commit()
+    return db
+
+
+def default_path(db, rows: int) -> bytes:
+    """与 FastAPI response_model 一致的默认序列化流程"""
+    adapter = TypeAdapter(List[schemas.LeaderboardOut])
+    items = adapter.validate_python(crud.get_leaderboard(db, "daily", limit=rows), from_attributes=True)
+    content = adapter.dump_python(items, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(db, rows: int) -> bytes:
+    """列投影 + 预编译序列化器"""
+    return dump_rows(schemas.LeaderboardOut, crud.get_leaderboard_rows(db, "daily", limit=rows))
+
+
+def measure(fn: Callable, db, rows: int, repeat: int) -> float:
+    """返回多次运行中最快一次的逐行耗时（微秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        db.expunge_all()
+        start = time.perf_counter()
+        fn(db, rows)
+        best = min(best, time.perf_counter() - start)
+    return best / rows * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐行序列化开销微基准")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db = build_session(args.rows)
+    assert json.loads(default_path(db, args.rows)) == json.loads(fast_path(db, args.rows))
+
+    before = measure(default_path, db, args.rows, args.repeat)
+    after = measure(fast_path, db, args.rows, args.repeat)
+    print(json.dumps({
+        "rows": args.rows,
+        "default_us_per_row": round(before, 3),
+        "fast_us_per_row": round(after, 3),
+        "speedup": round(before / after, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+启动耗时基准
+
+衡量单个工作进程的冷启动开销，用于控制扩容时新实例的就绪时间：
+- import_ms：python -X importtime 统计的 import main 总耗时，并列出耗时最多的直接依赖
+- ready_ms：启动 uvicorn 子进程到第一个成功的数据库读请求返回的时间
+- first_request_ms / steady_request_ms：就绪后首个首页聚合请求与之后请求的延迟中位数
+
+每项取多次冷启动的中位数，与 benchmarks/startup_budget.json 中的预算对比，超出时以退出码1结束。
+
+用法:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --output startup_report.json
+    python -m benchmarks.startup --update-budget      # 以本次结果加余量重写预算
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks import seed
+from benchmarks.load import SERVER_DIR, _free_port
+
+BUDGET_FILE = Path(__file__).with_name("startup_budget.json")
+READY_PATH = "/leaderboard/daily"
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """解析 -X importtime 输出，返回 (import main 总耗时ms, 按累计耗时排序的直接依赖)"""
+    total = 0.0
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        # 模块名前的缩进表示嵌套深度（每层两个空格，另有一个分隔空格）
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        module = raw_name.strip()
+        cumulative_ms = int(cumulative_us) / 1000
+        if module == "main":
+            total = cumulative_ms
+        elif depth == 1:
+            children.append((module, cumulative_ms))
+    return total, sorted(children, key=lambda item: -item[1])
+
+
+def measure_import(env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float]]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def measure_cold_start(env: Dict[str, str], requests: int) -> Dict[str, float]:
+    """启动服务，轮询到首个成功请求，再测就绪后的请求延迟"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"], cwd=SERVER_DIR, env=env)
+    try:
+        with httpx.Client(base_url=base_url, timeout=5) as client:
+            deadline = start + 30
+            while True:
+                try:
+                    if client.get(READY_PATH).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("服务启动超时")
+                time.sleep(0.005)
+            ready_ms = (time.perf_counter() - start) * 1000
+
+            latencies = []
+            for i in range(requests):
+                request_start = time.perf_counter()
+                client.get(f"/users/{i % 50 + 1}/dashboard").raise_for_status()
+                latencies.append((time.perf_counter() - request_start) * 1000)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"ready_ms": ready_ms, "first_request_ms": latencies[0],
+            "steady_request_ms": statistics.median(latencies[1:])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=3, help="冷启动次数，各项取中位数")
+    parser.add_argument("--requests", type=int, default=20, help="就绪后发送的请求数")
+    parser.add_argument("--headroom", type=float, default=0.5, help="--update-budget 时在实测值上增加的余量比例")
+    parser.add_argument("--output", type=Path, help="结果写入JSON文件")
+    parser.add_argument("--update-budget", action="store_true", help="以本次结果加余量重写预算")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/startup.db"
+        seed.generate(database_url, 1000, sessions_per_user=2)
+        env = {**os.environ, "WOODENFIS_DATABASE_URL": database_url}
+
+        runs = []
+        top_imports = []
+        for _ in range(args.runs):
+            import_ms, top_imports = measure_import(env)
+            runs.append({"import_ms": import_ms, **measure_cold_start(env, args.requests)})
+
+    metrics = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    report = {"metrics": metrics, "runs": runs,
+              "top_imports": [{"module": name, "ms": round(ms, 1)} for name, ms in top_imports[:10]]}
+
+    if args.update_budget:
+        budget = {key: round(metrics[key] * (1 + args.headroom), 1)
+                  for key in ("import_ms", "ready_ms", "first_request_ms")}
+        BUDGET_FILE.write_text(json.dumps(budget, indent=2) + "\n")
+        report["budget"] = budget
+    elif BUDGET_FILE.exists():
+        budget = json.loads(BUDGET_FILE.read_text())
+        report["budget"] = budget
+        report["over_budget"] = {key: metrics[key] for key, limit in budget.items() if metrics[key] > limit}
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+    if report.get("over_budget"):
+        print("启动耗时超出预算: " + ", ".join(report["over_budget"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
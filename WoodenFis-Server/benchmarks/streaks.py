@@ -0,0 +1,96 @@
+"""
+连续打卡与留存批处理基准
+
+- 计算：随机生成 --users 个用户的活跃日期（每人活跃天数服从几何分布，按天连续打卡的概率为 --continue-rate），
+  对比向量化计算与逐用户 Python 循环（在 --loop-users 个用户的子集上测量后按用户数折算）
+- 完整任务：指定 --database 时在该库（如 benchmarks.seed 生成的百万用户库）上运行 streaks.run，
+  输出读取、计算、写回各阶段耗时
+
+用法:
+    python -m benchmarks.streaks --users 1000000
+    python -m benchmarks.streaks --database sqlite:///./bench_1m.db
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import streaks
+
+
+def generate(users: int, days: int, mean_active_days: float, continue_rate: float, seed: int = 42):
+    """返回 (users, days)，同一用户的活跃日期以一定概率紧接前一天，否则随机跳过若干天"""
+    rng = np.random.default_rng(seed)
+    counts = rng.geometric(1 / mean_active_days, users)
+    user_ids = np.repeat(np.arange(1, users + 1), counts)
+    gaps = np.where(rng.random(len(user_ids)) < continue_rate, 1, rng.integers(2, 15, len(user_ids)))
+    starts = np.repeat(rng.integers(0, days, users), counts)
+    # 每个用户内累加间隔得到日期
+    offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[np.cumsum(counts) - counts], counts)
+    return user_ids, 20_000 + starts + offsets
+
+
+def python_loop(users: np.ndarray, days: np.ndarray, today: int) -> dict:
+    """逐用户逐日计算，作为对照"""
+    by_user = {}
+    for user_id, day in zip(users.tolist(), days.tolist()):
+        by_user.setdefault(user_id, set()).add(day)
+    result = {}
+    for user_id, active in by_user.items():
+        ordered = sorted(active)
+        longest = run = 0
+        for i, day in enumerate(ordered):
+            run = run + 1 if i and day - ordered[i - 1] == 1 else 1
+            longest = max(longest, run)
+        result[user_id] = (run if ordered[-1] >= today - 1 else 0, longest)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连续打卡与留存批处理基准")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--mean-active-days", type=float, default=10.0)
+    parser.add_argument("--continue-rate", type=float, default=0.6)
+    parser.add_argument("--loop-users", type=int, default=50_000)
+    parser.add_argument("--database", help="在该库上运行完整任务（读取、计算、写回）")
+    args = parser.parse_args()
+
+    if args.database:
+        from sqlalchemy import create_engine
+
+        print(json.dumps(streaks.run(create_engine(args.database)), indent=2))
+        return
+
+    users, days = generate(args.users, args.days, args.mean_active_days, args.continue_rate)
+    today = int(days.max())
+
+    start = time.perf_counter()
+    sorted_users, sorted_days = streaks.unique_days(users, days)
+    ids, current, longest, _ = streaks.compute_streaks(sorted_users, sorted_days, today)
+    streak_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    streaks.compute_retention(sorted_users, sorted_days)
+    retention_seconds = time.perf_counter() - start
+
+    sample = users <= args.loop_users
+    start = time.perf_counter()
+    expected = python_loop(users[sample], days[sample], today)
+    loop_seconds = (time.perf_counter() - start) * args.users / args.loop_users
+    subset = ids <= args.loop_users
+    assert expected == dict(zip(ids[subset].tolist(), zip(current[subset].tolist(), longest[subset].tolist())))
+
+    print(json.dumps({
+        "users": args.users,
+        "activity_rows": len(users),
+        "vectorized_streak_seconds": round(streak_seconds, 3),
+        "vectorized_retention_seconds": round(retention_seconds, 3),
+        "python_loop_seconds_estimated": round(loop_seconds, 3),
+        "speedup": round(loop_seconds / streak_seconds, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
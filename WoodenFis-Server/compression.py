@@ -0,0 +1,219 @@
+"""
+响应压缩
+
+CompressionMiddleware 按请求的 Accept-Encoding 选择 br（安装了 brotli 时）或 gzip 压缩响应：
+- 只压缩 JSON 和文本类型、且不小于 COMPRESSION_MIN_SIZE 字节的响应；已带 Content-Encoding 的响应原样通过
+- 一次性返回的响应整体压缩并改写 Content-Length，分块返回的（StreamingResponse）逐块压缩
+- Cache-Control 含 public 的响应（成就/分享任务目录等所有用户相同的内容）按内容摘要缓存压缩结果，
+  内容不变时不重复压缩，只多一次摘要计算
+
+排行榜快照等不可变的预编码内容在生成时用 precompress() 以最高压缩级别预先压缩，随原始字节一起保存，
+由接口用 precompressed_response() 按 Accept-Encoding 直接返回对应的字节串。
+"""
+
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional
+
+from fastapi import Request, Response
+
+import config
+import metrics
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只支持 gzip
+    brotli = None
+
+# 优先顺序：同等权重时选前面的
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# 预压缩只在内容变化时做一次，使用最高压缩级别
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 11
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript", b"image/svg+xml")
+
+
+def negotiate(accept_encoding: str, available=ENCODINGS) -> Optional[str]:
+    """按 Accept-Encoding 的权重从 available 中选择编码，都不接受时为None"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """整体压缩；level 为空时使用配置的压缩级别"""
+    if encoding == "br":
+        return brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY if level is None else level)
+    # wbits=31 输出 gzip 格式，头部不含时间戳，相同内容的压缩结果相同
+    return zlib.compress(body, config.COMPRESSION_GZIP_LEVEL if level is None else level, wbits=31)
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """以最高压缩级别预先压缩为各编码，小于 COMPRESSION_MIN_SIZE 或关闭压缩时为空"""
+    if not config.COMPRESSION or len(body) < config.COMPRESSION_MIN_SIZE:
+        return {}
+    levels = {"br": PRECOMPRESS_BROTLI_QUALITY, "gzip": PRECOMPRESS_GZIP_LEVEL}
+    return {encoding: compress(body, encoding, levels[encoding]) for encoding in ENCODINGS}
+
+
+def precompressed_response(request: Request, body: bytes, variants: Mapping[str, bytes],
+                           headers: Dict[str, str]) -> Response:
+    """按 Accept-Encoding 返回预先压缩的字节串，客户端不接受压缩时返回原始字节"""
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    encoding = negotiate(request.headers.get("accept-encoding", ""), tuple(variants)) if variants else None
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        body = variants[encoding]
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _compressible(headers: list) -> bool:
+    content_type = next((value for name, value in headers if name == b"content-type"), b"")
+    return (content_type.startswith(COMPRESSIBLE_TYPES) or b"+json" in content_type) and \
+        not any(name == b"content-encoding" for name, _ in headers)
+
+
+def _header(headers: list, key: bytes) -> bytes:
+    return next((value for name, value in headers if name == key), b"")
+
+
+class _Cache:
+    """压缩结果的LRU缓存：(内容摘要, 编码) -> 压缩后的字节串"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: bytes) -> None:
+        self._entries[key] = value
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+cache = _Cache(config.COMPRESSION_CACHE_ENTRIES)
+
+
+class CompressionMiddleware:
+    """gzip/brotli 响应压缩ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value for name, value in scope["headers"] if name == b"accept-encoding"), b"")
+        encoding = negotiate(accept_encoding.decode("latin-1"))
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if not _compressible(headers) or message["status"] in (204, 304):
+                    await send(message)
+                    return
+                start = {**message, "headers": _vary(headers)}
+                if encoding is None:
+                    await send(start)
+                    start = None
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = start["headers"]
+            body = message.get("body", b"")
+            if compressor is None and not message.get("more_body", False):
+                # 一次性返回的响应：整体压缩
+                if len(body) < config.COMPRESSION_MIN_SIZE:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                compressed = self._compress(body, encoding, b"public" in _header(headers, b"cache-control"))
+                headers = [(name, value) for name, value in headers if name != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(compressed)).encode())]
+                await send({**start, "headers": _weak_etag(headers)})
+                await send({**message, "body": compressed})
+                start = None
+                return
+
+            if compressor is None:
+                # 分块返回的响应：逐块压缩，去掉 Content-Length
+                compressor = _compressor(encoding)
+                headers = [(name, value) for name, value in headers if name != b"content-length"]
+                await send({**start, "headers": _weak_etag(headers + [(b"content-encoding", encoding.encode())])})
+            process, finish = compressor
+            more_body = message.get("more_body", False)
+            chunk = process(body) + (b"" if more_body else finish())
+            metrics.COMPRESSED_BYTES.inc((encoding, "raw"), len(body))
+            metrics.COMPRESSED_BYTES.inc((encoding, "compressed"), len(chunk))
+            await send({**message, "body": chunk})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compress(body: bytes, encoding: str, shared: bool) -> bytes:
+        metrics.COMPRESSED_BYTES.inc((encoding, "raw"), len(body))
+        if not shared:
+            compressed = compress(body, encoding)
+        else:
+            key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+            compressed = cache.get(key)
+            if compressed is None:
+                compressed = compress(body, encoding)
+                cache.put(key, compressed)
+            else:
+                metrics.COMPRESSION_CACHE_HITS.inc()
+        metrics.COMPRESSED_BYTES.inc((encoding, "compressed"), len(compressed))
+        return compressed
+
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _vary(headers: list) -> list:
+    """在 Vary 中加入 Accept-Encoding（与CORS等写入的 Vary 合并为一个头）"""
+    vary = _header(headers, b"vary")
+    if b"accept-encoding" in vary.lower():
+        return headers
+    value = vary + b", Accept-Encoding" if vary else b"Accept-Encoding"
+    return [(name, v) for name, v in headers if name != b"vary"] + [(b"vary", value)]
+
+
+def _weak_etag(headers: list) -> list:
+    """压缩后内容与原始字节不同，强 ETag 改为弱 ETag"""
+    return [(name, b"W/" + value if name == b"etag" and not value.startswith(b"W/") else value)
+            for name, value in headers]
@@ -0,0 +1,81 @@
+"""
+服务端运行配置
+所有配置项均可通过环境变量覆盖，未设置时使用开发环境默认值
+"""
+
+import os
+
+# 读接口快速序列化：列投影查询 + 预编译序列化器，跳过逐行模型校验
+FAST_JSON = os.getenv("WOODENFIS_FAST_JSON", "0") == "1"
+
+# 慢查询阈值（毫秒），超过阈值的SQL写入慢查询日志
+SLOW_QUERY_MS = float(os.getenv("WOODENFIS_SLOW_QUERY_MS", "100"))
+# 慢查询环形缓冲区容量
+SLOW_QUERY_BUFFER = int(os.getenv("WOODENFIS_SLOW_QUERY_BUFFER", "200"))
+# 随机采样记录完整SQL轨迹的请求比例（0~1）
+TRACE_SAMPLE_RATE = float(os.getenv("WOODENFIS_TRACE_SAMPLE_RATE", "0"))
+# SQL轨迹环形缓冲区容量
+TRACE_BUFFER = int(os.getenv("WOODENFIS_TRACE_BUFFER", "100"))
+
+# 工作进程启动时预热连接池、ORM映射和热点查询，以及预热时建立的连接数
+WARMUP = os.getenv("WOODENFIS_WARMUP", "1") == "1"
+WARMUP_CONNECTIONS = int(os.getenv("WOODENFIS_WARMUP_CONNECTIONS", "4"))
+
+# 多工作进程协调后端，为空时按单进程运行；python main.py --workers N 会自动启动本地协调端并设置该变量
+# 目前支持 unix:/path/to.sock（主进程中的 coordination.Hub）
+COORDINATION_URL = os.getenv("WOODENFIS_COORDINATION_URL", "")
+
+# 工作进程读取批处理任务代数的间隔（秒）：日切等进程外任务提交后，用户数据的 ETag 最迟在这段时间后失效
+BATCH_POLL_SECONDS = float(os.getenv("WOODENFIS_BATCH_POLL_SECONDS", "5"))
+
+# 用户写入后的这段时间内（秒），该用户的读请求走主库而不是只读副本，应大于副本的复制延迟
+READ_YOUR_WRITES_SECONDS = float(os.getenv("WOODENFIS_READ_YOUR_WRITES_SECONDS", "5"))
+
+# 排行榜快照刷新间隔（秒），读接口直接返回内存中预先编码的快照；为0时关闭快照，每次请求查询数据库
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("WOODENFIS_LEADERBOARD_REFRESH_SECONDS", "10"))
+# 快照中每个周期保存的名次数，以及每页条数
+LEADERBOARD_SNAPSHOT_SIZE = int(os.getenv("WOODENFIS_LEADERBOARD_SNAPSHOT_SIZE", "100"))
+LEADERBOARD_PAGE_SIZE = int(os.getenv("WOODENFIS_LEADERBOARD_PAGE_SIZE", "10"))
+# 好友排行榜按用户缓存关注列表的用户数，关注/取消关注时失效
+FOLLOWEE_CACHE_SIZE = int(os.getenv("WOODENFIS_FOLLOWEE_CACHE_SIZE", "10000"))
+
+# user_stats.timezone 为空的用户按该时区日切（IANA 时区名）
+DEFAULT_TIMEZONE = os.getenv("WOODENFIS_DEFAULT_TIMEZONE", "Asia/Shanghai")
+
+# 管理员令牌，/debug 接口需在 X-Admin-Token 请求头中携带；为空时 /debug 接口全部拒绝
+ADMIN_TOKEN = os.getenv("WOODENFIS_ADMIN_TOKEN", "")
+
+# 采样剖析的采样间隔（毫秒）与单次最长采集时间（秒）
+PROFILE_INTERVAL_MS = float(os.getenv("WOODENFIS_PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("WOODENFIS_PROFILE_MAX_SECONDS", "60"))
+
+# 限流：按 (路由类别, IP) 和 (路由类别, 用户) 的令牌桶，超出时返回429；
+# 每项为 类别=每秒补充令牌数/桶容量，类别为 auth（验证码/登录/注册）、tap（敲击上报）、catalog（排行榜和目录）、default，未列出的类别不限流
+RATE_LIMIT = os.getenv("WOODENFIS_RATE_LIMIT", "1") == "1"
+RATE_LIMITS_IP = os.getenv("WOODENFIS_RATE_LIMITS_IP", "auth=0.2/10,tap=50/200,catalog=50/200,default=50/200")
+RATE_LIMITS_USER = os.getenv("WOODENFIS_RATE_LIMITS_USER", "tap=10/30,catalog=20/60,default=20/60")
+# 令牌桶数上限，超出时只保留最近活跃的一半
+RATE_LIMIT_MAX_KEYS = int(os.getenv("WOODENFIS_RATE_LIMIT_MAX_KEYS", "100000"))
+
+# 过载保护：按延迟自适应的并发上限，超出时按优先级返回503（先拒绝排行榜和目录类读接口，最后才是敲击上报和登录）
+LOAD_SHEDDING = os.getenv("WOODENFIS_LOAD_SHEDDING", "1") == "1"
+# 并发上限的初始值、下限和上限
+CONCURRENCY_LIMIT = float(os.getenv("WOODENFIS_CONCURRENCY_LIMIT", "40"))
+CONCURRENCY_LIMIT_MIN = float(os.getenv("WOODENFIS_CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = float(os.getenv("WOODENFIS_CONCURRENCY_LIMIT_MAX", "200"))
+# 近期延迟超过基线延迟的这么多倍时视为过载，收缩并发上限
+LATENCY_TOLERANCE = float(os.getenv("WOODENFIS_LATENCY_TOLERANCE", "2"))
+
+# 响应压缩：按 Accept-Encoding 使用 br（需安装 brotli）或 gzip，小于 COMPRESSION_MIN_SIZE 字节的响应不压缩
+COMPRESSION = os.getenv("WOODENFIS_COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("WOODENFIS_COMPRESSION_MIN_SIZE", "512"))
+# 动态响应的压缩级别（gzip 1~9，brotli 0~11）；预先压缩的快照页固定使用最高级别
+COMPRESSION_GZIP_LEVEL = int(os.getenv("WOODENFIS_COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("WOODENFIS_COMPRESSION_BROTLI_QUALITY", "4"))
+# Cache-Control: public 的响应按内容缓存压缩结果的条数
+COMPRESSION_CACHE_ENTRIES = int(os.getenv("WOODENFIS_COMPRESSION_CACHE_ENTRIES", "256"))
+# 成就和分享任务目录的 Cache-Control: public, max-age（秒）
+CATALOG_MAX_AGE = int(os.getenv("WOODENFIS_CATALOG_MAX_AGE", "60"))
+
+# 合并并发的相同读请求（排行榜页、成就目录）：同一时刻只执行一次查询和序列化，其余请求等待同一个结果
+SINGLE_FLIGHT = os.getenv("WOODENFIS_SINGLE_FLIGHT", "1") == "1"
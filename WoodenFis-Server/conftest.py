@@ -1,27 +1,89 @@
 """
 pytest配置文件
 定义全局fixture和测试配置
+
+数据库隔离：
+- 首次运行时执行全部迁移生成模板库（文件名含表结构和迁移版本的哈希，结构变化后自动重建）
+- 每个进程（pytest-xdist 的每个 worker）复制一份模板库作为自己的数据库，导入应用前通过
+  WOODENFIS_DATABASE_URL 指向它，worker 之间互不干扰
+- 每个测试在外层事务内的一个 SAVEPOINT 中运行，会话的 commit 不会提交，测试结束时整体回滚；
+  需要真实连接池/多连接的测试用 @pytest.mark.no_transaction 退出（需自行清理数据）
+
+并行运行: pytest -n auto
 """
 
 import pytest
 import os
+import shutil
+import hashlib
 import tempfile
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
 from faker import Faker
 import asyncio
 
-from main import app
-from database import Base, engine, SessionLocal, get_db
+TEMPLATE_DIR = os.path.join(tempfile.gettempdir(), "woodenfis-test")
+WORKER_ID = os.getenv("PYTEST_XDIST_WORKER", "main")
+WORKER_DB = os.path.join(TEMPLATE_DIR, f"{WORKER_ID}-{os.getpid()}.db")
+
+# 必须在导入 database/main 之前设置，应用引擎才会指向本 worker 的数据库
+os.environ["WOODENFIS_DATABASE_URL"] = f"sqlite:///{WORKER_DB}"
+# 测试客户端的请求都来自同一个地址，默认关闭限流，限流测试中单独开启
+os.environ.setdefault("WOODENFIS_RATE_LIMIT", "0")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from database import Base, engine, SessionLocal, get_db, get_read_db, get_user_read_db
 from models import User, MeditationSession, Achievement, UserAchievement
+import batches
+import migrations
+import progress
+import snapshots
+
+
+def _schema_hash() -> str:
+    ddl = [f"migrations-{migrations.head()}"]
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=sqlite.dialect())))
+        ddl.extend(sorted(str(CreateIndex(index).compile(dialect=sqlite.dialect())) for index in table.indexes))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()[:16]
+
+
+def _template_db() -> str:
+    """返回当前表结构的模板库路径，不存在时创建（先写临时文件再原子替换，并发 worker 不会读到半成品）"""
+    os.makedirs(TEMPLATE_DIR, exist_ok=True)
+    path = os.path.join(TEMPLATE_DIR, f"template-{_schema_hash()}.db")
+    if not os.path.exists(path):
+        building = f"{path}.{os.getpid()}.tmp"
+        template_engine = create_engine(f"sqlite:///{building}")
+        migrations.upgrade(template_engine)
+        template_engine.dispose()
+        os.replace(building, path)
+    return path
+
+
+shutil.copyfile(_template_db(), WORKER_DB)
+
+
+# pysqlite 默认的事务处理不支持 SAVEPOINT，交由 SQLAlchemy 显式发出 BEGIN
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(engine, "begin")
+def _emit_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+from main import app
 import crud
 import schemas
 
 fake = Faker('zh_CN')
 
-# 测试数据库URL
-TEST_DATABASE_URL = "sqlite:///./test_woodenfish.db"
-
 @pytest.fixture(scope="session")
 def event_loop():
     """创建事件循环"""
@@ -29,31 +91,42 @@ def event_loop():
     yield loop
     loop.close()
 
-@pytest.fixture(scope="session", autouse=True)
-def setup_test_db():
-    """设置测试数据库"""
-    # 创建测试表
-    Base.metadata.create_all(bind=engine)
-    yield
-    # 清理测试数据库
-    Base.metadata.drop_all(bind=engine)
-    # 删除测试数据库文件
-    if os.path.exists("test_woodenfish.db"):
-        os.remove("test_woodenfish.db")
-
 @pytest.fixture
-def db():
-    """提供数据库会话"""
+def db(request):
+    """
+    提供数据库会话：整个测试在外层事务内的 SAVEPOINT 中运行，结束时回滚。
+    SessionLocal 在测试期间绑定到同一连接，应用代码和测试代码新建的会话都会加入该 SAVEPOINT，
+    commit 只刷新不提交；会话回滚时回滚到 SAVEPOINT，即测试开始时的状态
+    """
+    if request.node.get_closest_marker("no_transaction"):
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+
+    session_options = dict(SessionLocal.kw)
+    connection = engine.connect()
+    transaction = connection.begin()
+    connection.begin_nested()
+    SessionLocal.configure(bind=connection, join_transaction_mode="rollback_only")
     db = SessionLocal()
     try:
         yield db
     finally:
-        # 清理测试数据
-        db.query(UserAchievement).delete()
-        db.query(MeditationSession).delete() 
-        db.query(User).delete()
-        db.commit()
         db.close()
+        SessionLocal.kw = session_options
+        transaction.rollback()
+        connection.close()
+
+@pytest.fixture(name="engine")
+def migrated_engine(tmp_path):
+    """tmp_path 下迁移到最新版本的独立数据库，供直接操作引擎的批处理任务测试使用（不经过测试事务）"""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
 
 @pytest.fixture
 def client():
@@ -137,10 +210,31 @@ def enable_db_access_for_all_tests(db):
         finally:
             pass
     
-    app.dependency_overrides[get_db] = override_get_db
+    # 读接口的会话依赖也替换为测试会话，读写在同一事务中
+    for dependency in (get_db, get_read_db, get_user_read_db):
+        app.dependency_overrides[dependency] = override_get_db
     yield
     app.dependency_overrides.clear()
 
+@pytest.fixture(autouse=True)
+def reset_leaderboard_snapshot():
+    """排行榜快照、成就规则缓存、批处理代数和关注列表缓存是进程内状态，每个测试从空状态开始，与数据库回滚保持一致"""
+    snapshots.reset()
+    progress.reset()
+    batches.reset()
+    crud.reset_followees()
+    yield
+    snapshots.reset()
+    progress.reset()
+    batches.reset()
+    crud.reset_followees()
+
+def pytest_unconfigure(config):
+    """删除本进程的数据库副本（模板库保留供下次复用）；xdist 主进程不跑测试，也在这里清理"""
+    engine.dispose()
+    if os.path.exists(WORKER_DB):
+        os.remove(WORKER_DB)
+
 # 测试标记配置
 def pytest_configure(config):
     """配置pytest标记"""
@@ -150,6 +244,7 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "database: 数据库测试")
     config.addinivalue_line("markers", "performance: 性能测试")
     config.addinivalue_line("markers", "slow: 慢速测试")
+    config.addinivalue_line("markers", "no_transaction: 不包裹测试事务，直接读写本 worker 的数据库")
 
 def pytest_collection_modifyitems(config, items):
     """修改测试项目集合"""
@@ -0,0 +1,380 @@
+"""
+多工作进程协调
+
+`python main.py --workers N` 启动多个工作进程时，各进程内存中的状态（用户数据版本号、指标计数等）
+需要在进程之间同步。本模块提供与具体实现无关的协调接口：
+
+- publish(channel, data, key)：广播给其他工作进程，订阅方在后台线程中收到；带 key 的消息由协调端按
+  (channel, key) 保留最后一条，新启动（或重启）的工作进程连上后先收到全部保留消息再开始接收请求。
+  保留消息最多 RETAINED_LIMIT 条，超出时淘汰最久未更新的，evicted() 返回连接时协调端已淘汰的条数
+- report(name, data) / collect(name)：各进程定期上报快照，collect 取回所有进程的最新快照用于合并
+
+后端按 WOODENFIS_COORDINATION_URL 选择：
+- 空（默认）：单进程，publish 不发送，collect 只返回本进程快照
+- unix:/path/to.sock：由 main.py 主进程运行的 Hub 中转，各工作进程通过 Unix 套接字连接。
+  连接断开后每 RECONNECT_SECONDS 秒重连，重连后重新同步保留消息，并重发本进程最近的带 key 消息
+  （断开期间的广播也在其中），重启后的协调端据此恢复保留消息
+
+协调端只转发和保存不透明的JSON消息，不理解业务含义；以后换成 Redis（pub/sub + hash）时只需实现
+同样的 Backend 接口并在 BACKENDS 中注册。
+"""
+
+import itertools
+from collections import OrderedDict
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("woodenfis.coordination")
+
+# 工作进程定期上报快照的间隔（秒）
+REPORT_INTERVAL = 1.0
+# 等待协调端响应的超时（秒）
+TIMEOUT = 5.0
+# 连接断开后的重连间隔（秒）
+RECONNECT_SECONDS = 1.0
+# 协调端保留的消息数上限，工作进程也最多保留这么多条自己发出的带 key 消息用于重连后重发
+RETAINED_LIMIT = 100_000
+
+_handlers: Dict[str, List[Callable[[dict], None]]] = {}
+_reporters: Dict[str, Callable[[], object]] = {}
+
+
+def subscribe(channel: str, handler: Callable[[dict], None]) -> None:
+    """订阅频道，handler 在后台线程中调用，需自行保证线程安全"""
+    _handlers.setdefault(channel, []).append(handler)
+
+
+def register_reporter(name: str, snapshot: Callable[[], object]) -> None:
+    """注册定期上报的快照函数，collect(name) 时汇总所有进程的结果"""
+    _reporters[name] = snapshot
+
+
+def _dispatch(channel: str, data: dict) -> None:
+    for handler in _handlers.get(channel, ()):
+        try:
+            handler(data)
+        except Exception:
+            logger.exception("处理协调消息失败: %s", channel)
+
+
+class Backend:
+    """协调后端接口"""
+    multiprocess = False
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def publish(self, channel: str, data: dict, key: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def collect(self, name: str) -> List[object]:
+        raise NotImplementedError
+
+    def evicted(self) -> int:
+        return 0
+
+
+class LocalBackend(Backend):
+    """单进程：没有其他工作进程需要通知"""
+
+    def publish(self, channel, data, key=None):
+        pass
+
+    def collect(self, name):
+        return [_reporters[name]()]
+
+
+class UnixSocketBackend(Backend):
+    """连接 Hub 的工作进程端，每行一条JSON消息"""
+    multiprocess = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._requests = itertools.count(1)
+        self._pending: Dict[int, list] = {}
+        # 本进程发出的带 key 消息，按 (channel, key) 保留最后一条，重连后重发
+        self._published: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._dropped = 0
+        self._evicted = 0
+
+    def start(self):
+        self._connect()
+        threading.Thread(target=self._read_loop, name="coordination-reader", daemon=True).start()
+        # 先收完保留消息（如其他进程已递增的版本号），再开始接收请求
+        if not self._ready.wait(TIMEOUT):
+            logger.warning("等待协调端同步超时")
+        threading.Thread(target=self._report_loop, name="coordination-reporter", daemon=True).start()
+
+    def _connect(self) -> None:
+        """建立连接并发送 hello，随后重发本进程保留的带 key 消息"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._ready.clear()
+        with self._send_lock:
+            previous, self.sock = self.sock, sock
+            published = list(self._published.values())
+        if previous is not None:
+            previous.close()
+        # 本进程淘汰过的消息在重启后的协调端中已无法恢复，计入其淘汰数
+        self._send({"op": "hello", "pid": os.getpid(), "dropped": self._dropped})
+        for message in published:
+            self._send(message)
+
+    def stop(self):
+        self._stopped.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+    def _send(self, message: dict) -> None:
+        line = json.dumps(message, separators=(",", ":")).encode() + b"\n"
+        with self._send_lock:
+            self.sock.sendall(line)
+
+    def publish(self, channel, data, key=None):
+        message = {"op": "publish", "channel": channel, "data": data, "key": key}
+        if key is not None:
+            with self._send_lock:
+                self._published[(channel, key)] = message
+                self._published.move_to_end((channel, key))
+                if len(self._published) > RETAINED_LIMIT:
+                    self._published.popitem(last=False)
+                    self._dropped += 1
+        try:
+            self._send(message)
+        except OSError:
+            # 带 key 的消息在重连后重发
+            logger.warning("广播失败: %s", channel)
+
+    def evicted(self):
+        return self._evicted
+
+    def report(self, name: str) -> None:
+        self._send({"op": "report", "name": name, "data": _reporters[name]()})
+
+    def collect(self, name):
+        # 先上报本进程的最新快照，其他进程的快照最多滞后 REPORT_INTERVAL
+        request_id = next(self._requests)
+        waiter = [threading.Event(), None]
+        self._pending[request_id] = waiter
+        try:
+            self.report(name)
+            self._send({"op": "collect", "name": name, "id": request_id})
+            if not waiter[0].wait(TIMEOUT):
+                raise TimeoutError("协调端无响应")
+            return waiter[1]
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _read(self, sock: socket.socket) -> None:
+        try:
+            for line in sock.makefile("rb"):
+                message = json.loads(line)
+                op = message["op"]
+                if op == "message":
+                    _dispatch(message["channel"], message["data"])
+                elif op == "ready":
+                    self._evicted = message.get("evicted", 0)
+                    self._ready.set()
+                elif op == "collected":
+                    waiter = self._pending.get(message["id"])
+                    if waiter is not None:
+                        waiter[1] = message["data"]
+                        waiter[0].set()
+        except OSError:
+            pass
+
+    def _read_loop(self):
+        while True:
+            self._read(self.sock)
+            if self._stopped.is_set():
+                return
+            logger.error("与协调端的连接已断开，每 %s 秒重连", RECONNECT_SECONDS)
+            while not self._stopped.wait(RECONNECT_SECONDS):
+                try:
+                    self._connect()
+                    break
+                except OSError:
+                    continue
+            else:
+                return
+            logger.info("已重新连接协调端")
+
+    def _report_loop(self):
+        while not self._stopped.wait(REPORT_INTERVAL):
+            for name in list(_reporters):
+                try:
+                    self.report(name)
+                except OSError:
+                    # 连接断开，等重连后再上报
+                    break
+
+
+class _HubHandler(socketserver.StreamRequestHandler):
+    """Hub 中一个工作进程连接"""
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+
+    def send(self, message: dict) -> None:
+        line = json.dumps(message, separators=(",", ":")).encode() + b"\n"
+        with self.send_lock:
+            try:
+                self.wfile.write(line)
+            except OSError:
+                pass
+
+    def handle(self):
+        hub: Hub = self.server.hub
+        with hub.lock:
+            hub.clients.add(self)
+        try:
+            for line in self.rfile:
+                hub.handle(self, json.loads(line))
+        finally:
+            with hub.lock:
+                hub.clients.discard(self)
+                for reports in hub.reports.values():
+                    reports.pop(self, None)
+
+
+class _HubServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Hub:
+    """主进程中的协调端：转发广播、保存保留消息和各进程上报的快照"""
+
+    def __init__(self, path: Optional[str] = None, limit: int = RETAINED_LIMIT):
+        self.path = path or os.path.join(tempfile.mkdtemp(prefix="woodenfis-"), "coordination.sock")
+        self.lock = threading.Lock()
+        self.clients = set()
+        # 按最后更新时间排序，超出 limit 时淘汰最久未更新的
+        self.retained: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.limit = limit
+        self.evicted = 0
+        self.reports: Dict[str, Dict[object, object]] = {}
+        self.server = _HubServer(self.path, _HubHandler)
+        self.server.hub = self
+
+    @property
+    def url(self) -> str:
+        return f"unix:{self.path}"
+
+    def start(self) -> "Hub":
+        threading.Thread(target=self.server.serve_forever, name="coordination-hub", daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def handle(self, client: _HubHandler, message: dict) -> None:
+        op = message["op"]
+        if op == "publish":
+            relay = {"op": "message", "channel": message["channel"], "data": message["data"]}
+            with self.lock:
+                if message.get("key") is not None:
+                    key = (message["channel"], message["key"])
+                    self.retained[key] = relay
+                    self.retained.move_to_end(key)
+                    if len(self.retained) > self.limit:
+                        self.retained.popitem(last=False)
+                        self.evicted += 1
+                others = [other for other in self.clients if other is not client]
+            for other in others:
+                other.send(relay)
+        elif op == "hello":
+            with self.lock:
+                self.evicted += message.get("dropped", 0)
+                retained = list(self.retained.values())
+                evicted = self.evicted
+            for relay in retained:
+                client.send(relay)
+            client.send({"op": "ready", "evicted": evicted})
+        elif op == "report":
+            with self.lock:
+                self.reports.setdefault(message["name"], {})[client] = message["data"]
+        elif op == "collect":
+            with self.lock:
+                data = list(self.reports.get(message["name"], {}).values())
+            client.send({"op": "collected", "id": message["id"], "data": data})
+
+
+BACKENDS: Dict[str, Callable[[str], Backend]] = {
+    "unix": UnixSocketBackend,
+}
+
+_backend: Backend = LocalBackend()
+
+
+def create_backend(url: str) -> Backend:
+    if not url:
+        return LocalBackend()
+    scheme, _, address = url.partition(":")
+    if scheme not in BACKENDS:
+        raise ValueError(f"不支持的协调后端: {scheme}")
+    return BACKENDS[scheme](address)
+
+
+def start(url: str) -> None:
+    """工作进程启动时连接协调后端"""
+    global _backend
+    backend = create_backend(url)
+    backend.start()
+    _backend = backend
+
+
+def stop() -> None:
+    global _backend
+    _backend.stop()
+    _backend = LocalBackend()
+
+
+def is_multiprocess() -> bool:
+    return _backend.multiprocess
+
+
+def publish(channel: str, data: dict, key: Optional[str] = None) -> None:
+    """广播给其他工作进程（本进程的订阅方不会收到）"""
+    _backend.publish(channel, data, key)
+
+
+def collect(name: str) -> List[object]:
+    """取回所有工作进程对 name 的最新快照（包含本进程）"""
+    return _backend.collect(name)
+
+
+def evicted() -> int:
+    """本进程最近一次连接协调端时，协调端已淘汰的保留消息数；单进程为0"""
+    return _backend.evicted()
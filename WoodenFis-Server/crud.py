@@ -1,11 +1,28 @@
-from sqlalchemy.orm import Session
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session, joinedload
 import models, schemas
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import desc
+from serializers import field_names
+import config
+import coordination
+import partitions
+import progress
+import versions
+
+def _columns(entity, schema) -> list:
+    """按输出模型字段顺序取表列（快速序列化路径的列投影）"""
+    return [getattr(entity, name) for name in field_names(schema)]
 
 # 用户相关
 
+def get_user(db: Session, user_id: int) -> Optional[models.User]:
+    return db.get(models.User, user_id)
+
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
 
@@ -27,6 +44,7 @@ def create_user(db: Session, user: schemas.UserCreate, hashed_password: str) ->
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    versions.bump(db_user.id)
     return db_user
 
 def create_user_by_phone(db: Session, user: schemas.UserCreateByPhone) -> models.User:
@@ -39,6 +57,7 @@ def create_user_by_phone(db: Session, user: schemas.UserCreateByPhone) -> models
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    versions.bump(db_user.id)
     return db_user
 
 # 用户统计
@@ -51,58 +70,278 @@ def create_user_stat(db: Session, user_id: int) -> models.UserStat:
     db.add(stat)
     db.commit()
     db.refresh(stat)
+    versions.bump(user_id)
     return stat
 
+@functools.lru_cache(maxsize=None)
+def _tap_statements():
+    """敲击上报的两条 UPDATE 预先构造，每次只绑定参数，不在写事务中构造语句"""
+    stats, temples, members = models.UserStat.__table__, models.Temple.__table__, models.TempleMember.__table__
+    add_stats = update(stats).where(stats.c.user_id == bindparam("tap_user_id")).values(
+        total_taps=func.coalesce(stats.c.total_taps, 0) + bindparam("taps"),
+        today_taps=func.coalesce(stats.c.today_taps, 0) + bindparam("taps"),
+        last_tap_date=bindparam("tap_at"))
+    temple_id = select(members.c.temple_id).where(members.c.user_id == bindparam("tap_user_id")).scalar_subquery()
+    add_temple = update(temples).where(temples.c.id == temple_id).values(
+        total_taps=temples.c.total_taps + bindparam("taps"))
+    return add_stats, add_temple
+
+def add_taps(db: Session, user_id: int, taps: int, at: datetime) -> None:
+    """
+    敲击数计入用户统计和所在寺庙，在调用方的事务中执行。两条 UPDATE col = col + n：
+    先更新 user_stats（与成员变动在该行上串行），再按成员主键定位寺庙，不读取其他成员
+    """
+    if taps <= 0:
+        return
+    add_stats, add_temple = _tap_statements()
+    parameters = {"tap_user_id": user_id, "taps": taps, "tap_at": at}
+    if not db.execute(add_stats, parameters).rowcount:
+        db.add(models.UserStat(user_id=user_id, total_taps=taps, today_taps=taps, consecutive_days=0, last_tap_date=at))
+        db.flush()
+    db.execute(add_temple, parameters)
+
 # 冥想会话
 
 def create_meditation_session(db: Session, user_id: int, session: schemas.MeditationSessionCreate) -> models.MeditationSession:
-    db_session = models.MeditationSession(
-        user_id=user_id,
-        duration=session.duration,
-        tap_count=session.tap_count
-    )
-    db.add(db_session)
+    """写入会话所在月份的分区并在同一事务中累加统计和成就进度，返回的对象不在会话中"""
+    values = {"user_id": user_id, "duration": session.duration, "tap_count": session.tap_count,
+              "created_at": datetime.utcnow()}
+    # 成就规则在第一条写语句之前读取（缓存过期时），不占用写事务的时间
+    progress.rules(db)
+    session_id = partitions.SESSIONS.insert(db, values)
+    add_taps(db, user_id, session.tap_count, values["created_at"])
+    progress.record(db, user_id, sessions=1, total_taps=max(session.tap_count, 0), total_duration=session.duration)
     db.commit()
-    db.refresh(db_session)
-    return db_session
+    versions.bump(user_id)
+    return models.MeditationSession(id=session_id, **values)
 
 def get_meditation_sessions(db: Session, user_id: int, limit: int = 10) -> List[models.MeditationSession]:
-    return db.query(models.MeditationSession).filter(models.MeditationSession.user_id == user_id).order_by(desc(models.MeditationSession.created_at)).limit(limit).all()
+    return partitions.SESSIONS.latest(db, user_id, limit, entity=models.MeditationSession)
+
+def get_meditation_session_rows(db: Session, user_id: int, limit: int = 10) -> List[tuple]:
+    """冥想会话列投影查询"""
+    return partitions.SESSIONS.latest(db, user_id, limit, columns=field_names(schemas.MeditationSessionOut))
 
 # 成就
 
 def get_achievements(db: Session) -> List[models.Achievement]:
     return db.query(models.Achievement).all()
 
+def get_achievement_rows(db: Session) -> List[tuple]:
+    """成就列表列投影查询"""
+    return db.query(*_columns(models.Achievement, schemas.AchievementOut)).all()
+
 def unlock_achievement(db: Session, user_id: int, achievement_id: int) -> models.UserAchievement:
     ua = models.UserAchievement(user_id=user_id, achievement_id=achievement_id)
     db.add(ua)
+    db.flush()
+    progress.record(db, user_id, unlocked=[achievement_id])
     db.commit()
     db.refresh(ua)
+    versions.bump(user_id)
     return ua
 
+def get_achievement_progress(db: Session, user_id: int) -> dict:
+    """已解锁成就ID和各规则的进度，都由进度行（一次主键读取）和缓存的规则得出"""
+    row = progress.read(db, user_id)
+    return {"user_id": user_id, "unlocked": progress.ids_of(row["unlocked"]), "progress": [
+        {"achievement_id": achievement_id, "metric": metric, "threshold": threshold, "value": row[metric] or 0,
+         "unlocked": progress.has(row["unlocked"], achievement_id)}
+        for achievement_id, metric, threshold in progress.rules(db)]}
+
 def get_user_achievements(db: Session, user_id: int) -> List[models.UserAchievement]:
-    return db.query(models.UserAchievement).filter(models.UserAchievement.user_id == user_id).all()
+    # 一次JOIN带出成就详情，避免序列化时逐条懒加载
+    return db.query(models.UserAchievement).options(joinedload(models.UserAchievement.achievement)).filter(models.UserAchievement.user_id == user_id).all()
 
 # 排行榜
 
-def get_leaderboard(db: Session, period: str, limit: int = 10) -> List[models.Leaderboard]:
-    return db.query(models.Leaderboard).filter(models.Leaderboard.period == period).order_by(models.Leaderboard.rank).limit(limit).all()
+def get_leaderboard(db: Session, period: str, limit: int = 10, offset: int = 0) -> List[models.Leaderboard]:
+    return db.query(models.Leaderboard).filter(models.Leaderboard.period == period).order_by(models.Leaderboard.rank).offset(offset).limit(limit).all()
+
+def get_leaderboard_rows(db: Session, period: str, limit: int = 10, offset: int = 0) -> List[tuple]:
+    """排行榜列投影查询"""
+    return db.query(*_columns(models.Leaderboard, schemas.LeaderboardOut)).filter(models.Leaderboard.period == period).order_by(models.Leaderboard.rank).offset(offset).limit(limit).all()
+
+def get_friend_leaderboard_rows(db: Session, period: str, user_id: int, limit: int = 50) -> List[tuple]:
+    """
+    好友排行榜的查询路径（排行榜快照关闭时使用）：沿 (period, rank) 索引按名次遍历，
+    逐行到关注表主键中判断是否为本人或其关注的用户，取前 limit 个。返回 (user_id, 名次, 敲击数)
+    """
+    board, follows = models.Leaderboard, models.Follow
+    followed = db.query(follows.followee_id).filter(follows.follower_id == user_id,
+                                                    follows.followee_id == board.user_id).exists()
+    return db.query(board.user_id, board.rank, board.tap_count).filter(
+        board.period == period, (board.user_id == user_id) | followed).order_by(board.rank).limit(limit).all()
+
+# 关注关系
+
+def follow(db: Session, follower_id: int, followee_id: int) -> models.Follow:
+    """关注用户，已关注时返回原记录"""
+    relation = db.get(models.Follow, (follower_id, followee_id))
+    if relation is None:
+        relation = models.Follow(follower_id=follower_id, followee_id=followee_id)
+        db.add(relation)
+        db.commit()
+        db.refresh(relation)
+        versions.bump(follower_id)
+        _followees_changed(follower_id)
+    return relation
+
+def unfollow(db: Session, follower_id: int, followee_id: int) -> bool:
+    deleted = db.query(models.Follow).filter(models.Follow.follower_id == follower_id,
+                                             models.Follow.followee_id == followee_id).delete()
+    db.commit()
+    if deleted:
+        versions.bump(follower_id)
+        _followees_changed(follower_id)
+    return bool(deleted)
+
+def get_followee_ids(db: Session, user_id: int) -> List[int]:
+    """关注的全部用户ID（只读主键索引）"""
+    return [row[0] for row in db.query(models.Follow.followee_id).filter(models.Follow.follower_id == user_id)]
+
+# 好友排行榜的候选（本人和关注的用户ID数组）按用户缓存，最近使用的 FOLLOWEE_CACHE_SIZE 个用户；
+# 关注/取消关注时丢弃本进程的缓存并通知其他工作进程
+FOLLOWEES_CHANNEL = "followees"
+_followees: "OrderedDict[int, np.ndarray]" = OrderedDict()
+_followees_lock = threading.Lock()
+
+def get_friend_ids(db: Session, user_id: int) -> np.ndarray:
+    """本人和关注的全部用户ID，命中缓存时不读数据库"""
+    with _followees_lock:
+        ids = _followees.get(user_id)
+        if ids is not None:
+            _followees.move_to_end(user_id)
+            return ids
+    version, _ = versions.get(user_id)
+    ids = np.array([user_id, *get_followee_ids(db, user_id)], dtype=np.int64)
+    with _followees_lock:
+        # 读取期间关注关系有变化（版本号已变）时不缓存，下次请求重新读取
+        if versions.get(user_id)[0] == version:
+            _followees[user_id] = ids
+            if len(_followees) > config.FOLLOWEE_CACHE_SIZE:
+                _followees.popitem(last=False)
+    return ids
+
+def _forget_followees(message: dict) -> None:
+    with _followees_lock:
+        _followees.pop(message["user_id"], None)
+
+def _followees_changed(user_id: int) -> None:
+    _forget_followees({"user_id": user_id})
+    coordination.publish(FOLLOWEES_CHANNEL, {"user_id": user_id}, key=str(user_id))
+
+def reset_followees() -> None:
+    """清空好友候选缓存（测试中随数据库回滚一起重置）"""
+    with _followees_lock:
+        _followees.clear()
+
+coordination.subscribe(FOLLOWEES_CHANNEL, _forget_followees)
+
+def get_following(db: Session, user_id: int, limit: int = 100, offset: int = 0) -> List[tuple]:
+    follows = models.Follow
+    return db.query(follows.followee_id, follows.created_at).filter(follows.follower_id == user_id) \
+        .order_by(follows.followee_id).offset(offset).limit(limit).all()
+
+def get_followers(db: Session, user_id: int, limit: int = 100, offset: int = 0) -> List[tuple]:
+    """粉丝列表（读 (followee_id, follower_id) 反向索引）"""
+    follows = models.Follow
+    return db.query(follows.follower_id, follows.created_at).filter(follows.followee_id == user_id) \
+        .order_by(follows.follower_id).offset(offset).limit(limit).all()
+
+# 寺庙
+
+def create_temple(db: Session, temple: schemas.TempleCreate) -> models.Temple:
+    db_temple = models.Temple(name=temple.name, goal=temple.goal, total_taps=0, member_count=0)
+    db.add(db_temple)
+    db.commit()
+    db.refresh(db_temple)
+    return db_temple
+
+def get_temple(db: Session, temple_id: int) -> Optional[models.Temple]:
+    return db.get(models.Temple, temple_id)
+
+def get_temple_by_name(db: Session, name: str) -> Optional[models.Temple]:
+    return db.query(models.Temple).filter(models.Temple.name == name).first()
+
+def get_temple_leaderboard(db: Session, limit: int = 50, offset: int = 0) -> List[models.Temple]:
+    """按总敲击数排名（沿 ix_temples_total_taps 倒序读取，不汇总成员）"""
+    return db.query(models.Temple).order_by(models.Temple.total_taps.desc(), models.Temple.id.desc()) \
+        .offset(offset).limit(limit).all()
+
+def get_temple_leaderboard_rows(db: Session, limit: int = 50, offset: int = 0) -> List[tuple]:
+    """寺庙排行榜列投影查询"""
+    return db.query(*_columns(models.Temple, schemas.TempleOut)) \
+        .order_by(models.Temple.total_taps.desc(), models.Temple.id.desc()).offset(offset).limit(limit).all()
+
+def get_temple_members(db: Session, temple_id: int, limit: int = 100, offset: int = 0) -> List[models.TempleMember]:
+    return db.query(models.TempleMember).filter(models.TempleMember.temple_id == temple_id) \
+        .order_by(models.TempleMember.user_id).offset(offset).limit(limit).all()
+
+def _member_taps(db: Session, user_id: int) -> int:
+    """锁住成员的 user_stats 行并读出总敲击数，与同一用户的敲击上报串行"""
+    stats = models.UserStat.__table__
+    return db.execute(select(stats.c.total_taps).where(stats.c.user_id == user_id).with_for_update()).scalar() or 0
+
+def _adjust_temple(db: Session, temple_id: int, taps: int, members: int) -> None:
+    temples = models.Temple.__table__
+    db.execute(update(temples).where(temples.c.id == temple_id).values(
+        total_taps=temples.c.total_taps + taps, member_count=temples.c.member_count + members))
+
+def join_temple(db: Session, user_id: int, temple_id: int) -> models.TempleMember:
+    """
+    加入寺庙，已在其他寺庙时转入：原寺庙减去、新寺庙加上该成员的总敲击数，各一条 UPDATE，与成员数无关
+    """
+    member = db.get(models.TempleMember, user_id)
+    if member is not None and member.temple_id == temple_id:
+        return member
+    taps = _member_taps(db, user_id)
+    if member is None:
+        member = models.TempleMember(user_id=user_id, temple_id=temple_id)
+        db.add(member)
+    else:
+        _adjust_temple(db, member.temple_id, -taps, -1)
+        member.temple_id = temple_id
+        member.joined_at = datetime.utcnow()
+    _adjust_temple(db, temple_id, taps, 1)
+    db.commit()
+    db.refresh(member)
+    versions.bump(user_id)
+    return member
+
+def leave_temple(db: Session, user_id: int, temple_id: int) -> bool:
+    """退出寺庙，寺庙减去该成员的总敲击数"""
+    member = db.get(models.TempleMember, user_id)
+    if member is None or member.temple_id != temple_id:
+        return False
+    taps = _member_taps(db, user_id)
+    db.delete(member)
+    _adjust_temple(db, temple_id, -taps, -1)
+    db.commit()
+    versions.bump(user_id)
+    return True
 
 # 分享任务
 
 def get_share_tasks(db: Session) -> List[models.ShareTask]:
     return db.query(models.ShareTask).all()
 
+def get_share_task_rows(db: Session) -> List[tuple]:
+    """分享任务列投影查询"""
+    return db.query(*_columns(models.ShareTask, schemas.ShareTaskOut)).all()
+
 def complete_share_task(db: Session, user_id: int, task_id: int) -> models.UserShareTask:
     ust = models.UserShareTask(user_id=user_id, task_id=task_id, completed=True, completed_at=datetime.utcnow())
     db.add(ust)
+    db.flush()
+    progress.record(db, user_id, shares=1)
     db.commit()
     db.refresh(ust)
+    versions.bump(user_id)
     return ust
 
 def get_user_share_tasks(db: Session, user_id: int) -> List[models.UserShareTask]:
-    return db.query(models.UserShareTask).filter(models.UserShareTask.user_id == user_id).all()
+    return db.query(models.UserShareTask).options(joinedload(models.UserShareTask.task)).filter(models.UserShareTask.user_id == user_id).all()
 
 # 验证码相关
 
@@ -1,11 +1,147 @@
+import itertools
+import math
+import os
+import sqlite3
+import time
+from typing import List
+
+from fastapi import Request
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-# SQLite数据库URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./woodenfis.db"
+import config
+import versions
+
+# SQLite数据库URL（可通过环境变量指向其他数据库，如基准测试使用的临时库）
+SQLALCHEMY_DATABASE_URL = os.getenv("WOODENFIS_DATABASE_URL", "sqlite:///./woodenfis.db")
+# 只读副本URL，逗号分隔；为空时所有读写都走主库
+REPLICA_URLS = [url for url in os.getenv("WOODENFIS_REPLICA_URLS", "").split(",") if url]
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base() 
\ No newline at end of file
+Base = declarative_base() 
+
+# 只读副本引擎及对应的会话工厂，由 configure_replicas 设置
+replica_engines: List = []
+_replica_sessions: List[sessionmaker] = []
+_next_replica = itertools.count()
+
+# 写请求成功后下发的写入标记，值为写入时间；客户端在请求头（或 Cookie）中带回时，该客户端的按用户读请求走主库。
+# 不保存 Cookie 的客户端（如 Flutter 的 package:http）保存响应头并在之后的请求中原样带回
+WROTE_HEADER = "X-Woodenfis-Wrote"
+WROTE_COOKIE = "woodenfis_wrote"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def configure_replicas(urls: List[str]) -> None:
+    """设置只读副本（替换已有配置），传入空列表时读请求回到主库"""
+    for replica in replica_engines:
+        replica.dispose()
+    replica_engines[:] = [
+        create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+        for url in urls
+    ]
+    _replica_sessions[:] = [sessionmaker(autocommit=False, autoflush=False, bind=replica)
+                            for replica in replica_engines]
+
+
+def ReadSession():
+    """只读会话：轮流使用各只读副本，未配置副本时为主库会话"""
+    if not _replica_sessions:
+        return SessionLocal()
+    return _replica_sessions[next(_next_replica) % len(_replica_sessions)]()
+
+
+def modified_recently(user_id: int) -> bool:
+    """
+    用户数据在 READ_YOUR_WRITES_SECONDS 内被改写过：本进程 versions 中的写入，或批处理任务最近一批的提交。
+    这些改写已编入 ETag（http_cache），副本可能还没有应用，此时读主库，避免把旧数据缓存在新 ETag 下。
+    其他工作进程的写入经异步广播才可见，广播到达前 ETag 也不包含它
+    """
+    import batches  # batches 依赖 models，models 依赖本模块
+
+    now = time.time()
+    version, modified = versions.get(user_id)
+    return ((bool(version) and now - modified < config.READ_YOUR_WRITES_SECONDS)
+            or now - batches.modified() < config.READ_YOUR_WRITES_SECONDS)
+
+
+class WriteMarkerMiddleware:
+    """写请求成功时在响应头和 Cookie 中下发写入标记，有效期 READ_YOUR_WRITES_SECONDS"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or config.READ_YOUR_WRITES_SECONDS <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_marker(message):
+            if message["type"] == "http.response.start" and 200 <= message["status"] < 300:
+                wrote_at = f"{time.time():.3f}"
+                cookie = (f"{WROTE_COOKIE}={wrote_at}; Max-Age={math.ceil(config.READ_YOUR_WRITES_SECONDS)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (WROTE_HEADER.lower().encode(), wrote_at.encode()),
+                                                  (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_marker)
+
+
+def copy_sqlite(source_url: str, target_url: str) -> None:
+    """用 SQLite 在线备份把主库复制为副本文件，开发和测试中代替数据库复制"""
+    source = sqlite3.connect(make_url(source_url).database)
+    target = sqlite3.connect(make_url(target_url).database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+configure_replicas(REPLICA_URLS)
+
+
+def get_db():
+    """请求级数据库会话依赖，测试中通过 app.dependency_overrides 替换"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db():
+    """只读会话依赖，用于目录、排行榜等不区分用户的读接口"""
+    db = ReadSession()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def wrote_marker_fresh(request: Request) -> bool:
+    """请求带回的写入标记（请求头优先，其次 Cookie）仍在 READ_YOUR_WRITES_SECONDS 内"""
+    try:
+        wrote_at = float(request.headers.get(WROTE_HEADER) or request.cookies.get(WROTE_COOKIE, ""))
+    except ValueError:
+        return False
+    return 0 <= time.time() - wrote_at < config.READ_YOUR_WRITES_SECONDS
+
+
+def get_user_read_db(user_id: int, request: Request):
+    """
+    按用户的只读会话依赖。客户端带回了仍在窗口内的写入标记时读主库，保证读到自己的写入
+    （与处理写请求的工作进程无关）；该用户的数据最近在本进程可见的改写也读主库
+    """
+    db = SessionLocal() if wrote_marker_fresh(request) or modified_recently(user_id) else ReadSession()
+    try:
+        yield db
+    finally:
+        db.close()
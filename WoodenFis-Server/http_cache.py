@@ -0,0 +1,71 @@
+"""
+按用户版本号的HTTP条件请求
+
+响应携带由用户版本号生成的弱 ETag 和 Last-Modified，
+客户端带 If-None-Match / If-Modified-Since 再次请求且数据未变时直接返回304，
+整个过程只查询版本号，不读数据库。进程外批处理任务改写用户数据后，其代数（batches.py）也编入 ETag 和 Last-Modified。
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict
+
+from fastapi import HTTPException, Request, Response
+
+import batches
+import versions
+
+
+def etag(user_id: int) -> str:
+    """生成用户数据的弱 ETag，批处理提交过时带上批处理代数"""
+    version, _ = versions.get(user_id)
+    generation = batches.generation()
+    suffix = f"-b{generation}" if generation else ""
+    return f'W/"{versions.EPOCH}-{user_id}-{versions.token(version)}{suffix}"'
+
+
+def last_modified(user_id: int) -> int:
+    """用户写入时间和最近一批批处理提交时间中较晚的"""
+    _, modified = versions.get(user_id)
+    return max(modified, batches.modified())
+
+
+def cache_headers(user_id: int) -> Dict[str, str]:
+    """生成缓存相关响应头"""
+    return {
+        "ETag": etag(user_id),
+        "Last-Modified": formatdate(last_modified(user_id), usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def etag_matches(header: str, tag: str) -> bool:
+    """弱比较：忽略 W/ 前缀"""
+    if header.strip() == "*":
+        return True
+    opaque = tag[2:]
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def _not_modified_since(header: str, modified: int) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return modified <= since.timestamp()
+
+
+def user_cache(user_id: int, request: Request, response: Response) -> None:
+    """
+    路由依赖：条件请求命中时抛出304，否则为响应写入缓存头
+    If-None-Match 优先于 If-Modified-Since（Last-Modified 精度为秒，只有 ETag 能区分同一秒内的多次写入）
+    """
+    headers = cache_headers(user_id)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, headers["ETag"])
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = if_modified_since is not None and _not_modified_since(if_modified_since, last_modified(user_id))
+    if fresh:
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
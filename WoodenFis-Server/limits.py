@@ -0,0 +1,245 @@
+"""
+限流与过载保护
+
+LimitMiddleware 在路由之前按方法和路径把请求分到路由类别，每个类别对应一个优先级：
+- auth：发送验证码、登录、注册（高优先级，按IP限流最严，防止短信轰炸和撞库）
+- tap：敲击上报（高优先级）
+- catalog：排行榜、成就/分享任务目录、寺庙排行榜等可缓存的读接口（低优先级）
+- default：其余接口（普通优先级）
+/metrics、/debug 和文档页不限流，也不计入并发。
+
+限流：每个 (类别, IP) 和 (类别, 用户) 各有一个令牌桶，速率和容量分别由 RATE_LIMITS_IP / RATE_LIMITS_USER 配置，
+任一个桶取不到令牌时返回429，Retry-After 为攒够一个令牌需要的秒数。用户ID取自路径。
+每个桶只存 (令牌数, 上次更新时间) 两个浮点数；空闲到已经补满的桶与新桶没有区别，每隔 EVICT_SECONDS 秒整体清理一次，
+桶数超过 RATE_LIMIT_MAX_KEYS 时只保留最近活跃的一半，内存只与最近活跃的IP和用户数有关。
+
+过载保护：ConcurrencyLimit 按 AIMD 调整并发上限。每个类别维护近期延迟（快速EWMA）和基线延迟（最低延迟，缓慢上漂），
+近期延迟超过基线的 LATENCY_TOLERANCE 倍且并发已占上限一半以上时，上限乘以 DECREASE_FACTOR（每个近期延迟内最多一次），
+否则在上限接近用满时每完成一个请求增加 1/上限。低/普通/高优先级分别只能用到上限的 50%/80%/100%，
+过载时先拒绝排行榜和目录类读请求，敲击上报和登录最后才受影响；被拒绝的请求返回503和 Retry-After。
+
+状态只在事件循环线程中读写，不加锁；多工作进程时各进程独立计数，实际限额约为配置值乘以进程数。
+"""
+
+import functools
+import json
+import math
+import re
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import config
+import metrics
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+
+# (方法, 路径, 类别)，按顺序匹配，都不匹配时为 default
+ROUTE_CLASSES = (
+    ("POST", re.compile(r"^/users/(?:send-code|login|register)$"), "auth"),
+    ("POST", re.compile(r"^/meditation/\d+/sessions$"), "tap"),
+    ("GET", re.compile(r"^/(?:leaderboard/|achievements/?$|share/tasks$|temples/leaderboard$)"), "catalog"),
+)
+PRIORITIES = {"auth": HIGH, "tap": HIGH, "catalog": LOW, "default": NORMAL}
+# 各优先级可以占用的并发上限比例
+SHARES = {HIGH: 1.0, NORMAL: 0.8, LOW: 0.5}
+
+EXEMPT_PATHS = re.compile(r"^/(?:$|metrics$|debug/|docs|redoc|openapi\.json$)")
+# 路径中的用户ID
+USER_PATHS = re.compile(r"^/(?:users|meditation|stats|achievements|share)/(\d+)(?:/|$)"
+                        r"|^/leaderboard/[^/]+/friends/(\d+)$|^/temples/\d+/members/(\d+)$")
+
+# 空闲令牌桶的清理间隔（秒）
+EVICT_SECONDS = 60
+# 近期延迟的EWMA系数和基线延迟的上漂系数
+RECENT_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.01
+# 近期延迟比基线高出不到这么多秒时不算过载（避免亚毫秒级接口的抖动触发收缩）
+LATENCY_SLACK = 0.005
+DECREASE_FACTOR = 0.9
+# 过载拒绝时建议客户端等待的秒数
+SHED_RETRY_AFTER = 1
+
+
+def classify(method: str, path: str) -> Tuple[Optional[str], Optional[int]]:
+    """请求的 (路由类别, 路径中的用户ID)；不限流的运维接口类别为None"""
+    if EXEMPT_PATHS.match(path):
+        return None, None
+    route_class = "default"
+    for route_method, pattern, name in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            route_class = name
+            break
+    match = USER_PATHS.match(path)
+    user_id = next((int(group) for group in match.groups() if group), None) if match else None
+    return route_class, user_id
+
+
+@functools.lru_cache(maxsize=8)
+def parse_rates(spec: str) -> Dict[str, Tuple[float, float]]:
+    """解析 "类别=每秒补充数/桶容量,..."，未列出的类别不限流"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        rates[name.strip()] = (float(rate), float(burst or rate))
+    return rates
+
+
+class TokenBuckets:
+    """令牌桶表：键 -> (令牌数, 上次更新时间)"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: Dict[tuple, Tuple[float, float]] = {}
+        self._rates: Dict[tuple, Tuple[float, float]] = {}
+        self._evicted_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, keys: Iterable[Tuple[tuple, Tuple[float, float]]], now: float) -> float:
+        """
+        从 (键, (速率, 容量)) 的每个桶各取一个令牌；都够时扣除并返回0，
+        否则不扣除任何桶，返回还需等待的秒数
+        """
+        refilled = []
+        wait = 0.0
+        for key, (rate, burst) in keys:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            refilled.append((key, tokens))
+            self._rates[key] = (rate, burst)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate if rate > 0 else math.inf)
+        for key, tokens in refilled:
+            self._buckets[key] = (tokens if wait else tokens - 1, now)
+        if now - self._evicted_at >= EVICT_SECONDS or len(self._buckets) > self.max_keys:
+            self.evict(now)
+        return wait
+
+    def evict(self, now: float) -> None:
+        """删除已经补满的桶；仍超过 max_keys 时只保留最近更新的一半"""
+        self._evicted_at = now
+        buckets, rates = self._buckets, self._rates
+        for key in [key for key, (tokens, last) in buckets.items()
+                    if tokens + (now - last) * rates[key][0] >= rates[key][1]]:
+            del buckets[key], rates[key]
+        if len(buckets) > self.max_keys:
+            keep = sorted(buckets, key=lambda key: buckets[key][1], reverse=True)[:self.max_keys // 2]
+            self._buckets = {key: buckets[key] for key in keep}
+            self._rates = {key: rates[key] for key in keep}
+
+
+class ConcurrencyLimit:
+    """按延迟自适应的并发上限（AIMD）"""
+
+    def __init__(self, initial: float, minimum: float, maximum: float, tolerance: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self._latency: Dict[str, Tuple[float, float]] = {}
+        self._decreased_at = 0.0
+
+    def admit(self, priority: str) -> bool:
+        return self.in_flight < max(1.0, self.limit * SHARES[priority])
+
+    def record(self, route_class: str, latency: float, now: float) -> None:
+        """一个请求完成（调用时仍计入 in_flight）"""
+        recent, baseline = self._latency.get(route_class, (latency, latency))
+        recent += RECENT_WEIGHT * (latency - recent)
+        # 基线取见过的最低延迟并缓慢向上漂移：启动时已经过载也能学到空载水平，持续变慢的接口最终会抬高基线
+        baseline = min(baseline, latency)
+        baseline += BASELINE_WEIGHT * (latency - baseline)
+        if recent > baseline * self.tolerance and recent - baseline > LATENCY_SLACK:
+            # 并发远低于上限时变慢与并发无关（如单个慢查询），不收缩
+            if self.in_flight >= self.limit * SHARES[LOW] and now - self._decreased_at >= recent:
+                self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+                self._decreased_at = now
+        elif self.in_flight >= self.limit * SHARES[NORMAL]:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._latency[route_class] = (recent, baseline)
+
+
+def _new_limit() -> ConcurrencyLimit:
+    return ConcurrencyLimit(config.CONCURRENCY_LIMIT, config.CONCURRENCY_LIMIT_MIN,
+                            config.CONCURRENCY_LIMIT_MAX, config.LATENCY_TOLERANCE)
+
+
+buckets = TokenBuckets(config.RATE_LIMIT_MAX_KEYS)
+concurrency = _new_limit()
+
+metrics.REGISTRY.register(metrics.GaugeFunction(
+    "woodenfis_concurrency_limit", "过载保护当前的并发上限", lambda: concurrency.limit))
+metrics.REGISTRY.register(metrics.GaugeFunction(
+    "woodenfis_rate_limit_buckets", "限流令牌桶数", lambda: len(buckets)))
+
+
+def reset() -> None:
+    """清空令牌桶并按当前配置重建并发上限"""
+    global buckets, concurrency
+    buckets = TokenBuckets(config.RATE_LIMIT_MAX_KEYS)
+    concurrency = _new_limit()
+
+
+def _rate_limit_wait(scope: dict, route_class: str, user_id: Optional[int], now: float) -> float:
+    keys = []
+    ip_rate = parse_rates(config.RATE_LIMITS_IP).get(route_class)
+    if ip_rate is not None:
+        client = scope.get("client")
+        keys.append(((route_class, "ip", client[0] if client else ""), ip_rate))
+    user_rate = parse_rates(config.RATE_LIMITS_USER).get(route_class)
+    if user_rate is not None and user_id is not None:
+        keys.append(((route_class, "user", user_id), user_rate))
+    return buckets.take(keys, now) if keys else 0.0
+
+
+async def _reject(send, status: int, retry_after: float, detail: str) -> None:
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(min(retry_after, 86400)))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class LimitMiddleware:
+    """限流（429）与按优先级的过载保护（503）ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (config.RATE_LIMIT or config.LOAD_SHEDDING):
+            await self.app(scope, receive, send)
+            return
+        route_class, user_id = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        now = time.monotonic()
+        if config.RATE_LIMIT:
+            wait = _rate_limit_wait(scope, route_class, user_id, now)
+            if wait:
+                metrics.RATE_LIMITED.inc((route_class,))
+                await _reject(send, 429, wait, "请求过于频繁，请稍后再试")
+                return
+        if not config.LOAD_SHEDDING:
+            await self.app(scope, receive, send)
+            return
+
+        limit = concurrency
+        if not limit.admit(PRIORITIES[route_class]):
+            metrics.LOAD_SHED.inc((route_class,))
+            await _reject(send, 503, SHED_RETRY_AFTER, "服务繁忙，请稍后再试")
+            return
+        limit.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end = time.monotonic()
+            limit.record(route_class, end - now, end)
+            limit.in_flight -= 1
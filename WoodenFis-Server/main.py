@@ -1,12 +1,72 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from database import Base, engine
-from api import user, stat, meditation, achievement, leaderboard, share
+from fastapi.responses import PlainTextResponse
+from database import WROTE_HEADER, WriteMarkerMiddleware, engine, replica_engines
+from api import user, stat, meditation, achievement, leaderboard, share, temple, debug
+import batches
+import compression
+import config
+import coordination
+import limits
+import metrics
+import migrations
+import partitions
+import snapshots
+import sqltrace
+import versions
+import warmup
 
-# 初始化数据库表
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger("woodenfis.main")
 
-app = FastAPI(title="WoodenFis Python Server", description="木鱼App后端API服务", version="1.0.0")
+# SQL执行与连接池等待计时、慢查询日志与SQL轨迹（只注册事件，不访问数据库）
+for instrumented in (engine, *replica_engines):
+    metrics.instrument_engine(instrumented)
+    sqltrace.instrument_engine(instrumented)
+# 多工作进程时定期上报本进程指标，/metrics 汇总所有进程
+coordination.register_reporter("metrics", metrics.REGISTRY.snapshot)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    工作进程启动：导入 main 不访问数据库，表结构检查和预热都在这里完成，
+    结束后才开始接收请求
+    """
+    start = time.perf_counter()
+    # 连接协调后端并同步其他工作进程已广播的版本号
+    await run_in_threadpool(coordination.start, config.COORDINATION_URL)
+    # 升级数据库结构（版本已是最新时只读取一次版本号）
+    await run_in_threadpool(migrations.ensure_current, engine)
+    # 预先创建本月和下月的分区
+    await run_in_threadpool(partitions.maintain_all, engine)
+    # 读取批处理任务代数后再开始接收请求，之后定期轮询
+    await run_in_threadpool(batches.refresh, engine)
+    poller = asyncio.create_task(batches.run_poller(engine, config.BATCH_POLL_SECONDS))
+    metrics.STARTUP_SECONDS.set(("migrations",), time.perf_counter() - start)
+    if config.WARMUP:
+        for phase, seconds in (await warmup.warm_up(engine)).items():
+            metrics.STARTUP_SECONDS.set((f"warmup_{phase}",), seconds)
+    # 发布第一版排行榜快照后再开始刷新；失败时由首个读请求重建
+    refresher = None
+    if config.LEADERBOARD_REFRESH_SECONDS > 0:
+        try:
+            await run_in_threadpool(snapshots.refresh)
+        except Exception:
+            logger.exception("排行榜快照生成失败")
+        refresher = asyncio.create_task(snapshots.run_refresher(config.LEADERBOARD_REFRESH_SECONDS))
+    metrics.STARTUP_SECONDS.set(("lifespan",), time.perf_counter() - start)
+    yield
+    poller.cancel()
+    if refresher is not None:
+        refresher.cancel()
+    coordination.stop()
+
+app = FastAPI(title="WoodenFis Python Server", description="木鱼App后端API服务", version="1.0.0",
+              lifespan=lifespan)
 
 # 允许所有来源跨域（开发环境）
 app.add_middleware(
@@ -15,8 +75,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[WROTE_HEADER],
 )
 
+# 响应压缩（在CORS之外，压缩最终的响应）
+app.add_middleware(compression.CompressionMiddleware)
+
+# 采样请求的SQL轨迹
+app.add_middleware(sqltrace.SQLTraceMiddleware)
+
+# 写请求成功后下发写入标记，按用户的读请求据此读主库
+app.add_middleware(WriteMarkerMiddleware)
+
+# 限流与过载保护（在指标中间件之内，被拒绝的请求也计入请求指标）
+app.add_middleware(limits.LimitMiddleware)
+
+# 请求指标（最外层，覆盖其他中间件的耗时）
+app.add_middleware(metrics.MetricsMiddleware)
+
 # 注册路由
 app.include_router(user.router)
 app.include_router(stat.router)
@@ -24,6 +100,8 @@ app.include_router(meditation.router)
 app.include_router(achievement.router)
 app.include_router(leaderboard.router)
 app.include_router(share.router)
+app.include_router(temple.router)
+app.include_router(debug.router)
 
 @app.get("/")
 async def root():
@@ -34,6 +112,40 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus 文本格式指标（多工作进程时为所有进程的合计）"""
+    if coordination.is_multiprocess():
+        text = metrics.REGISTRY.render(coordination.collect("metrics"))
+    else:
+        text = metrics.REGISTRY.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    import argparse
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="木鱼App后端服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，大于1时启动协调端同步各进程状态")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+    else:
+        hub = None
+        if not config.COORDINATION_URL:
+            hub = coordination.Hub().start()
+            os.environ["WOODENFIS_COORDINATION_URL"] = hub.url
+        # 工作进程继承环境变量：所有进程使用相同的 ETag 启动标识
+        os.environ["WOODENFIS_EPOCH"] = versions.EPOCH
+        os.environ["WOODENFIS_BOOT_TIME"] = str(versions.BOOT_TIME)
+        try:
+            uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                        log_level=args.log_level)
+        finally:
+            if hub is not None:
+                hub.close()
@@ -0,0 +1,342 @@
+"""
+请求与SQL指标
+
+- MetricsMiddleware：按路由记录请求延迟直方图、状态码计数和并发请求数
+- instrument_engine：挂载 SQLAlchemy 游标事件，统计每个请求的查询次数、查询耗时以及连接池等待时间
+- REGISTRY.render()：输出 Prometheus 文本格式，由 /metrics 接口暴露；多工作进程时先用 REGISTRY.snapshot()
+  汇总各进程的快照，计数器和直方图按标签相加后再输出
+
+指标更新只做字典查找和整数累加，单个请求的额外开销在微秒级。
+HTTP层指标只在事件循环线程中更新，不加锁；数据库指标会在线程池中更新，需要加锁。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 未匹配任何路由的请求统一记为该标签，避免任意路径撑爆标签基数
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), threadsafe: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock() if threadsafe else None
+        self._values: Dict[Tuple, object] = {}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def snapshot(self) -> list:
+        """可JSON序列化的当前值: [[标签值列表, 值], ...]（在上报线程中调用，先整体复制字典）"""
+        return [[list(labels), value] for labels, value in dict(self._values).items()]
+
+    def _combine(self, current, value):
+        return current + value
+
+    def merge(self, snapshots: Sequence[list]) -> Dict[Tuple, object]:
+        """合并多个进程的快照，同标签的值按 _combine 合并"""
+        merged: Dict[Tuple, object] = {}
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                labels = tuple(labels)
+                merged[labels] = value if labels not in merged else self._combine(merged[labels], value)
+        return merged
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    type_name = "counter"
+
+    def inc(self, labels: Tuple = (), amount: float = 1) -> None:
+        if self._lock is None:
+            self._values[labels] = self._values.get(labels, 0) + amount
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self, values: Optional[Dict[Tuple, float]] = None) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted((self._values if values is None else values).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值，多进程合并时默认相加，merge="max" 时取最大值"""
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), threadsafe=True, merge: str = "sum"):
+        super().__init__(name, documentation, labelnames, threadsafe)
+        if merge == "max":
+            self._combine = max
+
+    def dec(self, labels: Tuple = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, labels: Tuple = (), value: float = 0) -> None:
+        if self._lock is None:
+            self._values[labels] = value
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class GaugeFunction(_Metric):
+    """渲染时通过回调取值的瞬时值，更新方无需调用任何指标方法"""
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation, threadsafe=False)
+        self.function = function
+
+    def snapshot(self) -> list:
+        return [[[], self.function()]]
+
+    def render(self, values: Optional[Dict[Tuple, float]] = None) -> List[str]:
+        value = self.function() if values is None else values.get((), 0)
+        return self.header() + [f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS, threadsafe=True):
+        super().__init__(name, documentation, labelnames, threadsafe)
+        self.buckets = tuple(buckets)
+        # labels -> [各桶计数..., +Inf桶计数, 总和]
+        self._values: Dict[Tuple, list] = {}
+
+    def snapshot(self) -> list:
+        return [[list(labels), list(state)] for labels, state in dict(self._values).items()]
+
+    def _combine(self, current, value):
+        return [a + b for a, b in zip(current, value)]
+
+    def _observe(self, labels: Tuple, value: float) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        if self._lock is None:
+            self._observe(labels, value)
+            return
+        with self._lock:
+            self._observe(labels, value)
+
+    def count(self, labels: Tuple = ()) -> int:
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+    def render(self, values: Optional[Dict[Tuple, list]] = None) -> List[str]:
+        lines = self.header()
+        for labels, state in sorted((self._values if values is None else values).items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += hits
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        """注册指标，同名指标会被替换"""
+        self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def snapshot(self) -> Dict[str, list]:
+        """本进程全部指标的快照，用于多工作进程汇总"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots: Optional[Sequence[Dict[str, list]]] = None) -> str:
+        """输出本进程指标；传入各进程快照时输出合并后的值"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render(metric.merge([s.get(metric.name, []) for s in snapshots])))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP层指标：只在事件循环线程中更新
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "woodenfis_http_requests_total", "HTTP请求数", ("method", "route", "status"), threadsafe=False))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "woodenfis_http_request_duration_seconds", "HTTP请求处理耗时", ("method", "route"), threadsafe=False))
+REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    "woodenfis_http_request_db_queries", "单个请求执行的SQL语句数", ("route",), QUERY_COUNT_BUCKETS, threadsafe=False))
+REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    "woodenfis_http_request_db_seconds", "单个请求的SQL执行总耗时", ("route",), threadsafe=False))
+
+# 数据库指标：在线程池中更新
+DB_QUERIES = REGISTRY.register(Counter(
+    "woodenfis_db_queries_total", "SQL语句执行总数"))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "woodenfis_db_query_duration_seconds", "单条SQL语句执行耗时"))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "woodenfis_db_pool_checkout_seconds", "从连接池获取连接的等待时间"))
+
+# 启动指标：lifespan 启动阶段各步骤耗时
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "woodenfis_startup_seconds", "工作进程启动各阶段耗时", ("phase",), merge="max"))
+
+# 排行榜快照：在线程池中重建
+LEADERBOARD_SNAPSHOT_SECONDS = REGISTRY.register(Histogram(
+    "woodenfis_leaderboard_snapshot_build_seconds", "排行榜快照重建耗时"))
+
+# 限流与过载保护：只在事件循环线程中更新
+RATE_LIMITED = REGISTRY.register(Counter(
+    "woodenfis_rate_limited_total", "被限流拒绝（429）的请求数", ("route_class",), threadsafe=False))
+LOAD_SHED = REGISTRY.register(Counter(
+    "woodenfis_load_shed_total", "被过载保护拒绝（503）的请求数", ("route_class",), threadsafe=False))
+
+# 响应压缩：只在事件循环线程中更新
+COMPRESSED_BYTES = REGISTRY.register(Counter(
+    "woodenfis_http_compression_bytes_total", "压缩中间件处理的响应字节数（raw 压缩前，compressed 压缩后）",
+    ("encoding", "kind"), threadsafe=False))
+COMPRESSION_CACHE_HITS = REGISTRY.register(Counter(
+    "woodenfis_http_compression_cache_hits_total", "直接使用缓存压缩结果的响应数", threadsafe=False))
+
+# 读请求合并：只在事件循环线程中更新
+SINGLE_FLIGHT_REQUESTS = REGISTRY.register(Counter(
+    "woodenfis_singleflight_requests_total", "可合并的读请求数（leader 实际执行读取，coalesced 等待其他请求的结果）",
+    ("route", "role"), threadsafe=False))
+
+
+class RequestStats:
+    """单个请求的上下文，数据库事件据此把查询归属到当前请求"""
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("woodenfis_request", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    """当前请求上下文（不在请求中时为None）"""
+    return _current_request.get()
+
+
+class MetricsMiddleware:
+    """记录请求级指标的ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        REGISTRY.register(GaugeFunction(
+            "woodenfis_http_requests_in_flight", "正在处理的HTTP请求数", lambda: self.in_flight))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            _current_request.reset(token)
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            HTTP_REQUESTS.inc((scope["method"], route, status))
+            HTTP_LATENCY.observe((scope["method"], route), elapsed)
+            REQUEST_DB_QUERIES.observe((route,), stats.queries)
+            REQUEST_DB_SECONDS.observe((route,), stats.db_seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("woodenfis_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["woodenfis_query_start"].pop()
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe((), elapsed)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine) -> None:
+    """为引擎挂载SQL计时事件和连接池等待计时（重复调用无副作用）"""
+    if getattr(engine, "_woodenfis_instrumented", False):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    # SQLAlchemy 没有“开始等待连接”事件，这里包装 raw_connection 计时；
+    # 包装在引擎实例上，engine.dispose() 重建连接池后依然有效
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            DB_POOL_WAIT.observe((), time.perf_counter() - start)
+
+    engine.raw_connection = timed_raw_connection
+    engine._woodenfis_instrumented = True
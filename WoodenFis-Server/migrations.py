@@ -0,0 +1,408 @@
+"""
+数据库结构迁移
+
+按版本号顺序执行迁移步骤，已执行的版本记录在 schema_version 表中：
+- 每个步骤在独立事务中执行并写入版本记录，失败时整体回滚，不会留下半完成的结构
+- SQLite 使用 BEGIN IMMEDIATE、其他数据库锁住版本表，多个进程同时启动时只有一个执行迁移，
+  其余进程拿到锁后重新读取版本并跳过已完成的步骤
+- 大表数据回填使用 backfill() 按主键区间分批提交，每批只短暂持有写锁，可在服务运行中执行，中断后重跑会从剩余数据继续
+- 服务启动时 ensure_current() 只读取一次版本号，与最新版本一致时不做任何表结构检查
+
+新增迁移：在文件末尾追加带 @migration(版本号, 说明) 的函数，版本号必须递增；同时修改 models.py 保持一致。
+步骤函数接收事务内的连接；声明 transactional=False 的步骤（如分批回填）接收引擎，自行管理事务。
+
+用法:
+    python migrate_db.py            # 升级到最新版本
+    python migrate_db.py --status   # 查看当前版本和待执行的步骤
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, MetaData,
+                        String, Table, create_engine, event, inspect, text)
+
+logger = logging.getLogger("woodenfis.migrations")
+
+VERSION_TABLE = "schema_version"
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable
+    transactional: bool
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str, transactional: bool = True):
+    """注册迁移步骤"""
+    def register(function):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"迁移版本号必须递增: {version}")
+        MIGRATIONS.append(Migration(version, description, function, transactional))
+        return function
+    return register
+
+
+def head() -> int:
+    """最新的迁移版本"""
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def _migration_engine(url):
+    """
+    迁移专用引擎。pysqlite 默认不在DDL前开启事务，这里关闭驱动的事务处理并显式发出
+    BEGIN IMMEDIATE，使DDL和版本记录处于同一事务，并在开始时就拿到写锁
+    """
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def disable_driver_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    return engine
+
+
+def _create_version_table(conn) -> None:
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP, duration_ms INTEGER)"))
+
+
+def _read_version(conn) -> int:
+    return conn.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}")).scalar() or 0
+
+
+def current_version(engine) -> Optional[int]:
+    """数据库当前版本，版本表不存在时返回None"""
+    with engine.connect() as conn:
+        try:
+            return _read_version(conn)
+        except Exception:
+            conn.rollback()
+            return None
+
+
+def upgrade(engine, target: Optional[int] = None) -> List[int]:
+    """执行待执行的迁移步骤，返回本次执行的版本号"""
+    target = head() if target is None else target
+    migration_engine = _migration_engine(engine.url)
+    applied = []
+    try:
+        with migration_engine.begin() as conn:
+            _create_version_table(conn)
+        for step in MIGRATIONS:
+            if step.version > target:
+                break
+            start = time.perf_counter()
+            if not step.transactional:
+                # 自行管理事务的步骤（分批回填）在版本锁之外执行，须可重复执行
+                with migration_engine.connect() as conn:
+                    if _read_version(conn) >= step.version:
+                        continue
+                step.upgrade(migration_engine)
+            with migration_engine.begin() as conn:
+                if conn.dialect.name != "sqlite":
+                    conn.execute(text(f"LOCK TABLE {VERSION_TABLE} IN EXCLUSIVE MODE"))
+                # 拿到锁后重新读取，其他进程可能已经执行过
+                if _read_version(conn) >= step.version:
+                    continue
+                if step.transactional:
+                    step.upgrade(conn)
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                conn.execute(text(
+                    f"INSERT INTO {VERSION_TABLE} (version, description, applied_at, duration_ms) "
+                    "VALUES (:version, :description, :applied_at, :duration_ms)"),
+                    {"version": step.version, "description": step.description,
+                     "applied_at": datetime.utcnow(), "duration_ms": duration_ms})
+            logger.info("迁移 %d 完成: %s（%dms）", step.version, step.description, duration_ms)
+            applied.append(step.version)
+    finally:
+        migration_engine.dispose()
+    return applied
+
+
+def ensure_current(engine) -> List[int]:
+    """服务启动时调用：版本已是最新时只有一次查询，否则执行迁移"""
+    if current_version(engine) == head():
+        return []
+    return upgrade(engine)
+
+
+def backfill(engine, table: str, assignments: str, where: str = "1 = 1", batch_size: int = 10_000,
+             params: Optional[dict] = None, pause: float = 0.0, key: str = "id") -> int:
+    """
+    按主键区间分批执行 UPDATE table SET assignments WHERE where，每批单独提交，返回更新行数。
+    where 应排除已回填的行（如 "col IS NULL"），中断后重跑只处理剩余数据；
+    pause 为批次之间的休眠秒数，给线上写入让出锁
+    """
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).one()
+    if low is None:
+        return 0
+    statement = text(f"UPDATE {table} SET {assignments} WHERE {key} >= :_low AND {key} < :_high AND ({where})")
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        with engine.begin() as conn:
+            updated += conn.execute(statement, {**(params or {}), "_low": start, "_high": start + batch_size}).rowcount
+        if pause:
+            time.sleep(pause)
+    return updated
+
+
+# ---------------------------------------------------------------------------
+# 迁移步骤（表结构在步骤内冻结定义，不引用 models，之后修改模型不会影响已有步骤）
+# ---------------------------------------------------------------------------
+
+@migration(1, "初始表结构")
+def _initial_schema(conn):
+    metadata = MetaData()
+    Table("users", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("username", String, unique=True, index=True),
+          Column("email", String, unique=True, index=True, nullable=True),
+          Column("phone", String, unique=True, index=True),
+          Column("hashed_password", String, nullable=True),
+          Column("avatar", String, nullable=True),
+          Column("is_vip", Boolean),
+          Column("vip_expire_date", DateTime, nullable=True),
+          Column("merit_points", Integer),
+          Column("created_at", DateTime))
+    Table("verification_codes", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("phone", String, index=True),
+          Column("code", String),
+          Column("created_at", DateTime),
+          Column("expires_at", DateTime),
+          Column("used", Boolean))
+    Table("achievements", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("name", String),
+          Column("description", String),
+          Column("icon", String))
+    Table("share_tasks", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("title", String),
+          Column("description", String),
+          Column("merit", Integer),
+          Column("icon", String))
+    Table("user_stats", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("total_taps", Integer),
+          Column("today_taps", Integer),
+          Column("consecutive_days", Integer),
+          Column("last_tap_date", DateTime, nullable=True))
+    Table("meditation_sessions", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("duration", Integer),
+          Column("tap_count", Integer),
+          Column("created_at", DateTime))
+    Table("user_achievements", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("achievement_id", Integer, ForeignKey("achievements.id")),
+          Column("unlocked_at", DateTime))
+    Table("leaderboard", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("period", String),
+          Column("rank", Integer),
+          Column("tap_count", Integer),
+          Column("created_at", DateTime))
+    Table("user_share_tasks", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("task_id", Integer, ForeignKey("share_tasks.id")),
+          Column("completed", Boolean),
+          Column("completed_at", DateTime, nullable=True))
+    # 引入迁移前由 create_all 建好的库，已有的表会被跳过
+    metadata.create_all(conn, checkfirst=True)
+
+
+@migration(2, "users 表补充 phone 字段（手机号验证码登录之前建的库）")
+def _users_phone(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "phone" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN phone VARCHAR"))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_phone ON users (phone)"))
+
+
+@migration(3, "热点查询按用户/周期过滤的索引")
+def _hot_path_indexes(conn):
+    metadata = MetaData()
+    user_stats = Table("user_stats", metadata, Column("user_id", Integer))
+    sessions = Table("meditation_sessions", metadata, Column("user_id", Integer), Column("created_at", DateTime))
+    user_achievements = Table("user_achievements", metadata, Column("user_id", Integer))
+    leaderboard = Table("leaderboard", metadata, Column("period", String), Column("rank", Integer))
+    user_share_tasks = Table("user_share_tasks", metadata, Column("user_id", Integer))
+    for index in (
+        Index("ix_user_stats_user_id", user_stats.c.user_id),
+        Index("ix_meditation_sessions_user_created", sessions.c.user_id, sessions.c.created_at),
+        Index("ix_user_achievements_user_id", user_achievements.c.user_id),
+        Index("ix_leaderboard_period_rank", leaderboard.c.period, leaderboard.c.rank),
+        Index("ix_user_share_tasks_user_id", user_share_tasks.c.user_id),
+    ):
+        index.create(conn, checkfirst=True)
+
+
+@migration(4, "按月分区：分区登记表；PostgreSQL 把 meditation_sessions 改为分区表，原表作为 DEFAULT 分区")
+def _monthly_partitions(conn):
+    metadata = MetaData()
+    Table("table_partitions", metadata,
+          Column("parent", String, primary_key=True),
+          Column("month", String, primary_key=True),
+          Column("table_name", String),
+          Column("state", String),
+          Column("row_count", Integer, nullable=True),
+          Column("archive_path", String, nullable=True),
+          Column("created_at", DateTime),
+          Column("archived_at", DateTime, nullable=True))
+    metadata.create_all(conn, checkfirst=True)
+    if conn.dialect.name != "postgresql":
+        # SQLite 的月份分区在首次写入或 partitions.maintain 时创建
+        return
+    for statement in (
+        "ALTER TABLE meditation_sessions RENAME TO meditation_sessions_default",
+        "ALTER INDEX ix_meditation_sessions_user_created RENAME TO ix_meditation_sessions_default_user_created",
+        "CREATE TABLE meditation_sessions (LIKE meditation_sessions_default INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)",
+        "ALTER SEQUENCE meditation_sessions_id_seq OWNED BY meditation_sessions.id",
+        "ALTER TABLE meditation_sessions ATTACH PARTITION meditation_sessions_default DEFAULT",
+        "CREATE INDEX ix_meditation_sessions_user_created ON meditation_sessions (user_id, created_at)",
+    ):
+        conn.execute(text(statement))
+
+
+@migration(5, "连续打卡与留存批处理结果表")
+def _streak_tables(conn):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table("user_streaks", metadata,
+          Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+          Column("current_streak", Integer),
+          Column("longest_streak", Integer),
+          Column("last_active_date", Date, nullable=True),
+          Column("computed_at", DateTime))
+    Table("cohort_retention", metadata,
+          Column("cohort_date", Date, primary_key=True),
+          Column("users", Integer),
+          Column("d1", Float, nullable=True),
+          Column("d7", Float, nullable=True),
+          Column("d30", Float, nullable=True),
+          Column("computed_at", DateTime))
+    metadata.create_all(conn, tables=[metadata.tables["user_streaks"], metadata.tables["cohort_retention"]],
+                        checkfirst=True)
+
+
+@migration(6, "日切：user_stats 增加 timezone 字段和今日有敲击行的部分索引，每日敲击历史表和日切进度表")
+def _day_rollover(conn):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    user_stats = Table("user_stats", metadata,
+                       Column("id", Integer, primary_key=True, index=True),
+                       Column("user_id", Integer, ForeignKey("users.id"), index=True),
+                       Column("total_taps", Integer),
+                       Column("today_taps", Integer),
+                       Column("consecutive_days", Integer),
+                       Column("last_tap_date", DateTime, nullable=True),
+                       Column("timezone", String, nullable=True))
+    rollover_index = Index("ix_user_stats_rollover", user_stats.c.timezone, user_stats.c.user_id,
+                           sqlite_where=text("today_taps > 0"), postgresql_where=text("today_taps > 0"))
+    daily = Table("user_daily_taps", metadata,
+                  Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+                  Column("day", Date, primary_key=True),
+                  Column("taps", Integer))
+    rollovers = Table("day_rollovers", metadata,
+                      Column("timezone", String, primary_key=True),
+                      Column("day", Date),
+                      Column("last_user_id", Integer),
+                      Column("started_at", DateTime),
+                      Column("finished_at", DateTime, nullable=True))
+
+    if conn.dialect.name == "sqlite":
+        # SQLite 的 ADD COLUMN 把新列追加在表约束之后，重建表使结构与新建库一致（user_stats 没有被外键引用）
+        columns = "id, user_id, total_taps, today_taps, consecutive_days, last_tap_date"
+        conn.execute(text("ALTER TABLE user_stats RENAME TO user_stats_old"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_user_stats_id"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_user_stats_user_id"))
+        user_stats.create(conn)
+        conn.execute(text(f"INSERT INTO user_stats ({columns}) SELECT {columns} FROM user_stats_old"))
+        conn.execute(text("DROP TABLE user_stats_old"))
+    else:
+        conn.execute(text("ALTER TABLE user_stats ADD COLUMN timezone VARCHAR"))
+        rollover_index.create(conn)
+    daily.create(conn, checkfirst=True)
+    rollovers.create(conn, checkfirst=True)
+
+
+@migration(7, "关注关系表，按关注者（主键）和被关注者（反向索引）两个方向索引")
+def _follows(conn):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    follows = Table("follows", metadata,
+                    Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
+                    Column("followee_id", Integer, ForeignKey("users.id"), primary_key=True),
+                    Column("created_at", DateTime))
+    Index("ix_follows_followee_follower", follows.c.followee_id, follows.c.follower_id)
+    follows.create(conn, checkfirst=True)
+
+
+@migration(8, "寺庙（用户组）和成员表，寺庙总敲击数按总数排序的索引")
+def _temples(conn):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    temples = Table("temples", metadata,
+                    Column("id", Integer, primary_key=True, index=True),
+                    Column("name", String, unique=True),
+                    Column("goal", BigInteger),
+                    Column("total_taps", BigInteger),
+                    Column("member_count", Integer),
+                    Column("created_at", DateTime))
+    Index("ix_temples_total_taps", temples.c.total_taps, temples.c.id)
+    members = Table("temple_members", metadata,
+                    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+                    Column("temple_id", Integer, ForeignKey("temples.id")),
+                    Column("joined_at", DateTime))
+    Index("ix_temple_members_temple_user", members.c.temple_id, members.c.user_id)
+    metadata.create_all(conn, tables=[temples, members], checkfirst=True)
+
+
+@migration(9, "成就解锁规则表，每个用户一行的成就进度计数和已解锁成就位图；已有用户由 progress.py 回填")
+def _achievement_progress(conn):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table("achievements", metadata, Column("id", Integer, primary_key=True))
+    rules = Table("achievement_rules", metadata,
+                  Column("achievement_id", Integer, ForeignKey("achievements.id"), primary_key=True),
+                  Column("metric", String),
+                  Column("threshold", BigInteger))
+    progress = Table("achievement_progress", metadata,
+                     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+                     Column("sessions", BigInteger),
+                     Column("total_taps", BigInteger),
+                     Column("total_duration", BigInteger),
+                     Column("longest_streak", Integer),
+                     Column("shares", Integer),
+                     Column("unlocked", LargeBinary),
+                     Column("updated_at", DateTime))
+    metadata.create_all(conn, tables=[rules, progress], checkfirst=True)
+
+
+@migration(10, "批处理任务代数表：日切等进程外任务每批递增，工作进程据此使用户数据的 ETag 失效")
+def _batch_generations(conn):
+    metadata = MetaData()
+    generations = Table("batch_generations", metadata,
+                        Column("job", String, primary_key=True),
+                        Column("generation", BigInteger),
+                        Column("updated_at", DateTime))
+    generations.create(conn, checkfirst=True)
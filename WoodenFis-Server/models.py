@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -28,16 +28,21 @@ class VerificationCode(Base):
 
 class UserStat(Base):
     __tablename__ = "user_stats"
+    # 日切只访问今日有敲击的行，按时区分组、user_id 顺序分批
+    __table_args__ = (Index("ix_user_stats_rollover", "timezone", "user_id",
+                            sqlite_where=text("today_taps > 0"), postgresql_where=text("today_taps > 0")),)
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     total_taps = Column(Integer, default=0)
     today_taps = Column(Integer, default=0)
     consecutive_days = Column(Integer, default=0)
     last_tap_date = Column(DateTime, nullable=True)
+    timezone = Column(String, nullable=True)  # IANA 时区名，为空时使用 config.DEFAULT_TIMEZONE
     user = relationship("User")
 
 class MeditationSession(Base):
     __tablename__ = "meditation_sessions"
+    __table_args__ = (Index("ix_meditation_sessions_user_created", "user_id", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     duration = Column(Integer)  # 秒
@@ -55,14 +60,37 @@ class Achievement(Base):
 class UserAchievement(Base):
     __tablename__ = "user_achievements"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     achievement_id = Column(Integer, ForeignKey("achievements.id"))
     unlocked_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship("User")
     achievement = relationship("Achievement")
 
+class AchievementRule(Base):
+    """成就的自动解锁规则：metric 为 achievement_progress 的计数列，达到 threshold 时解锁"""
+    __tablename__ = "achievement_rules"
+    achievement_id = Column(Integer, ForeignKey("achievements.id"), primary_key=True)
+    metric = Column(String)
+    threshold = Column(BigInteger)
+
+class AchievementProgress(Base):
+    """
+    每个用户一行的成就进度：各计数由写入路径增量维护（与 user_stats 等来源数据在同一事务中），
+    unlocked 为已解锁成就ID的位图（第 i 位对应成就 i，小端），已解锁和进度都只读这一行
+    """
+    __tablename__ = "achievement_progress"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    sessions = Column(BigInteger, default=0)
+    total_taps = Column(BigInteger, default=0)
+    total_duration = Column(BigInteger, default=0)
+    longest_streak = Column(Integer, default=0)
+    shares = Column(Integer, default=0)
+    unlocked = Column(LargeBinary, default=b"")
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class Leaderboard(Base):
     __tablename__ = "leaderboard"
+    __table_args__ = (Index("ix_leaderboard_period_rank", "period", "rank"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     period = Column(String)  # daily, weekly
@@ -82,9 +110,90 @@ class ShareTask(Base):
 class UserShareTask(Base):
     __tablename__ = "user_share_tasks"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     task_id = Column(Integer, ForeignKey("share_tasks.id"))
     completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)
     user = relationship("User")
-    task = relationship("ShareTask") 
\ No newline at end of file
+    task = relationship("ShareTask") 
+
+class TablePartition(Base):
+    """按月分区登记（partitions.py 维护）"""
+    __tablename__ = "table_partitions"
+    parent = Column(String, primary_key=True)  # 父表名
+    month = Column(String, primary_key=True)  # YYYY-MM
+    table_name = Column(String)
+    state = Column(String, default="active")  # active, archived
+    row_count = Column(Integer, nullable=True)  # 归档时的行数
+    archive_path = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    archived_at = Column(DateTime, nullable=True)
+
+class UserStreak(Base):
+    """连续打卡天数（streaks.py 批处理按冥想会话日期计算）"""
+    __tablename__ = "user_streaks"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    current_streak = Column(Integer, default=0)  # 截至今天或昨天仍在延续的连续天数
+    longest_streak = Column(Integer, default=0)
+    last_active_date = Column(Date, nullable=True)
+    computed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class CohortRetention(Base):
+    """按首次活跃日分组的留存率（streaks.py 批处理写入），观察日未到时为空"""
+    __tablename__ = "cohort_retention"
+    cohort_date = Column(Date, primary_key=True)
+    users = Column(Integer)
+    d1 = Column(Float, nullable=True)
+    d7 = Column(Float, nullable=True)
+    d30 = Column(Float, nullable=True)
+    computed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class UserDailyTaps(Base):
+    """每日敲击数历史（rollover.py 日切时从 user_stats.today_taps 归档）"""
+    __tablename__ = "user_daily_taps"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # 用户所在时区的日期
+    taps = Column(Integer)
+
+class DayRollover(Base):
+    """各时区日切进度，中断后从 last_user_id 之后继续"""
+    __tablename__ = "day_rollovers"
+    timezone = Column(String, primary_key=True)  # 空字符串表示默认时区
+    day = Column(Date)  # 正在或最近一次归档的日期
+    last_user_id = Column(Integer, default=0)
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class Follow(Base):
+    """关注关系：主键按关注者读关注列表，反向索引按被关注者读粉丝列表"""
+    __tablename__ = "follows"
+    __table_args__ = (Index("ix_follows_followee_follower", "followee_id", "follower_id"),)
+    follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Temple(Base):
+    """寺庙（用户组）：total_taps 恒等于成员 user_stats.total_taps 之和，由敲击上报和成员变动增量维护，读取时不汇总成员"""
+    __tablename__ = "temples"
+    __table_args__ = (Index("ix_temples_total_taps", "total_taps", "id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True)
+    goal = Column(BigInteger, default=0)  # 共同的功德目标（敲击数）
+    total_taps = Column(BigInteger, default=0)
+    member_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class TempleMember(Base):
+    """寺庙成员，每个用户最多属于一个寺庙；敲击上报按 user_id 主键找到所在寺庙"""
+    __tablename__ = "temple_members"
+    __table_args__ = (Index("ix_temple_members_temple_user", "temple_id", "user_id"),)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    temple_id = Column(Integer, ForeignKey("temples.id"))
+    joined_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class BatchGeneration(Base):
+    """进程外批处理任务的代数，每批提交时递增；工作进程轮询后使用户数据的条件请求失效（见 batches.py）"""
+    __tablename__ = "batch_generations"
+    job = Column(String, primary_key=True)
+    generation = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
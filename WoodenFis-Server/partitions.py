@@ -0,0 +1,375 @@
+"""
+按月分区存储
+
+meditation_sessions 按 created_at 所在月份分区，按用户查询最近记录时只访问仍在库中的几个月份：
+- PostgreSQL：原生声明式分区（PARTITION BY RANGE），引入分区前的数据作为 DEFAULT 分区；
+  读写都访问父表，由数据库路由和裁剪分区
+- SQLite：每月一张表（如 meditation_sessions_202610），结构和索引与父表相同。写入路由到所在月份的表，
+  表不存在时在当前事务中创建；按用户查询从最新的月份表开始逐个走 (user_id, created_at) 索引倒序读取，
+  取够 N 条即停止，不足时最后读取父表（引入分区前的历史数据）
+- 分区登记在 table_partitions 表中。进程内缓存分区列表，创建或归档分区后通过 coordination 通知其他工作进程，
+  另有 REFRESH_SECONDS 定期重新读取兜底
+
+SQLite 各月份表的自增ID从 年月 * ID_STRIDE 开始，不同月份之间以及与父表中的历史数据之间ID不会重复。
+
+旧分区可以归档为 Parquet 文件（zstd 压缩）后从库中删除，热查询不再访问；split_default 把父表中的历史数据
+分批搬进对应月份的分区，只支持 SQLite（PostgreSQL 的历史数据留在 DEFAULT 分区）。
+
+用法:
+    python partitions.py --status
+    python partitions.py --maintain                                   # 预先创建本月和下月的分区
+    python partitions.py --split-default                              # 历史数据搬进月份分区
+    python partitions.py --archive-before 2026-01 --archive-dir archive/  # 归档2026年1月之前的分区
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import (Boolean, Column, DateTime, Index, Integer, MetaData, Table, delete, event, func, insert,
+                        select, text)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import batches
+import coordination
+import models
+
+logger = logging.getLogger("woodenfis.partitions")
+
+REGISTRY = "table_partitions"
+ID_STRIDE = 10 ** 10
+# 分区列表缓存的最长有效期（秒）
+REFRESH_SECONDS = 60
+# 归档时每批读取的行数
+ARCHIVE_BATCH = 50_000
+CHANNEL = "partitions"
+
+
+def month_of(moment: Optional[datetime]) -> str:
+    """datetime 所在月份，格式 YYYY-MM（没有时间的历史数据归入1970-01）"""
+    return moment.strftime("%Y-%m") if moment is not None else "1970-01"
+
+
+def next_month(month: str) -> str:
+    year, number = map(int, month.split("-"))
+    return f"{year + number // 12}-{number % 12 + 1:02d}"
+
+
+def _dialect(bind) -> str:
+    return bind.get_bind().dialect.name if isinstance(bind, Session) else bind.dialect.name
+
+
+def _connection(bind):
+    return bind.connection() if isinstance(bind, Session) else bind
+
+
+class MonthlyPartitions:
+    """一张按月分区的表：parent 为父表，key 为按用户查询的列，time_column 为分区依据的时间列"""
+
+    def __init__(self, parent: Table, key: str = "user_id", time_column: str = "created_at"):
+        self.parent = parent
+        self.key = key
+        self.time_column = time_column
+        self._metadata = MetaData()
+        self._tables: Dict[str, Table] = {}
+        self._lock = threading.Lock()
+        # 库中仍在使用的分区月份（升序），None 表示需要重新读取
+        self._months: Optional[List[str]] = None
+        self._loaded_at = 0.0
+        coordination.subscribe(CHANNEL, self._on_change)
+
+    # ----------------------------------------------------------------- 分区表
+
+    def table_name(self, month: str) -> str:
+        return f"{self.parent.name}_{month.replace('-', '')}"
+
+    def table(self, month: str) -> Table:
+        """月份分区的表定义（列与父表相同，外键除外）"""
+        with self._lock:
+            table = self._tables.get(month)
+            if table is None:
+                name = self.table_name(month)
+                table = Table(name, self._metadata,
+                              *(Column(column.name, column.type, primary_key=column.primary_key)
+                                for column in self.parent.columns),
+                              sqlite_autoincrement=True)
+                Index(f"ix_{name}_{self.key}_{self.time_column}", table.c[self.key], table.c[self.time_column])
+                self._tables[month] = table
+            return table
+
+    def native(self, bind) -> bool:
+        """数据库原生支持分区（PostgreSQL），读写直接访问父表"""
+        return _dialect(bind) != "sqlite"
+
+    def ensure(self, bind, month: str) -> bool:
+        """在 bind 的事务中创建分区并登记，已存在时跳过；返回是否新登记"""
+        conn = _connection(bind)
+        table = self.table(month)
+        if conn.dialect.name == "sqlite":
+            table.create(conn, checkfirst=True)
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                              "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+                         {"name": table.name, "seq": int(month.replace("-", "")) * ID_STRIDE})
+        else:
+            start = datetime.strptime(month, "%Y-%m")
+            end = datetime.strptime(next_month(month), "%Y-%m")
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table.name} PARTITION OF {self.parent.name} "
+                              f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"))
+        return conn.execute(text(
+            f"INSERT INTO {REGISTRY} (parent, month, table_name, state, created_at) "
+            "SELECT :parent, :month, :table_name, 'active', :now "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {REGISTRY} WHERE parent = :parent AND month = :month)"),
+            {"parent": self.parent.name, "month": month, "table_name": table.name,
+             "now": datetime.utcnow()}).rowcount > 0
+
+    def maintain(self, engine, ahead: int = 1) -> List[str]:
+        """创建本月及之后 ahead 个月的分区（服务启动时调用），返回新建的月份"""
+        month = month_of(datetime.utcnow())
+        created = []
+        for _ in range(ahead + 1):
+            with engine.begin() as conn:
+                if self.ensure(conn, month):
+                    created.append(month)
+            month = next_month(month)
+        self.changed()
+        return created
+
+    # ----------------------------------------------------------------- 分区列表缓存
+
+    def months(self, bind, refresh: bool = False) -> List[str]:
+        """仍在库中的分区月份（升序）"""
+        months = self._months
+        if refresh or months is None or time.monotonic() - self._loaded_at > REFRESH_SECONDS:
+            months = [row[0] for row in _connection(bind).execute(
+                text(f"SELECT month FROM {REGISTRY} WHERE parent = :parent AND state = 'active' ORDER BY month"),
+                {"parent": self.parent.name})]
+            self._months, self._loaded_at = months, time.monotonic()
+        return months
+
+    def changed(self) -> None:
+        """分区增减后让本进程和其他工作进程重新读取分区列表"""
+        self._months = None
+        coordination.publish(CHANNEL, {"parent": self.parent.name})
+
+    def _on_change(self, message: dict) -> None:
+        if message["parent"] == self.parent.name:
+            self._months = None
+
+    # ----------------------------------------------------------------- 读写路由
+
+    def insert(self, db: Session, values: dict) -> int:
+        """写入 values[time_column] 所在月份的分区，返回新记录ID"""
+        if self.native(db):
+            return db.execute(insert(self.parent).values(**values)).inserted_primary_key[0]
+        month = month_of(values[self.time_column])
+        for refresh in (False, True):
+            if month not in self.months(db, refresh):
+                # 新分区提交后才放进缓存并通知其他进程；提交前每次写入都会检查一遍分区是否存在，
+                # 事务回滚（pysqlite 下建表语句可能已自动提交）时下次写入会补上登记
+                if self.ensure(db, month):
+                    db.info.setdefault("woodenfis_new_partitions", set()).add(self)
+                else:
+                    self._months = None
+            try:
+                return db.execute(insert(self.table(month)).values(**values)).inserted_primary_key[0]
+            except OperationalError as error:
+                # 缓存中的分区已不存在（所在事务回滚或已归档），重新读取分区列表后重试一次
+                if refresh or "no such table" not in str(error):
+                    raise
+
+    def latest(self, db: Session, key_value, limit: int, columns: Optional[Sequence[str]] = None, entity=None):
+        """
+        按 key 取最近 limit 条记录，按时间倒序。
+        entity 为 ORM 类时返回实体列表，否则返回 columns 列的行。
+        SQLite 各月份分区的时间段互不重叠，按月份从新到旧逐个查询，取够 limit 条即停止；
+        父表中是分区前的历史数据，最后查询
+        """
+        names = list(columns or [column.name for column in self.parent.columns])
+        for refresh in (False, True):
+            tables = [self.parent] if self.native(db) else \
+                [self.table(month) for month in reversed(self.months(db, refresh))] + [self.parent]
+            rows = []
+            try:
+                for table in tables:
+                    statement = self._latest_statement(table, key_value, limit - len(rows), names)
+                    if entity is not None:
+                        rows += db.scalars(select(entity).from_statement(statement)).all()
+                    else:
+                        rows += db.execute(statement).all()
+                    if len(rows) >= limit:
+                        break
+                return rows
+            except OperationalError as error:
+                if refresh or "no such table" not in str(error):
+                    raise
+
+    def _latest_statement(self, table: Table, key_value, limit: int, names: List[str]):
+        """走 (key, 时间) 索引倒序取 limit 条"""
+        return (select(*(table.c[name] for name in names))
+                .where(table.c[self.key] == key_value)
+                .order_by(table.c[self.time_column].desc())
+                .limit(limit))
+
+    def delete(self, db: Session, key_value) -> int:
+        """删除 key 的全部记录（各分区和父表），返回删除行数"""
+        return sum(db.execute(delete(table).where(table.c[self.key] == key_value)).rowcount
+                   for table in self.tables(db))
+
+    def tables(self, bind) -> List[Table]:
+        """仍在库中的全部数据所在的表：父表和各月份分区（SQLite），批处理任务据此遍历全量数据"""
+        if self.native(bind):
+            return [self.parent]
+        return [self.parent] + [self.table(month) for month in self.months(bind, refresh=True)]
+
+    # ----------------------------------------------------------------- 维护
+
+    def split_default(self, engine, batch_size: int = 10_000) -> int:
+        """
+        把父表中的历史数据按主键顺序分批搬进对应月份的分区，每批一个事务，中断后重跑继续；返回搬移行数。
+        仅用于 SQLite：PostgreSQL 的历史数据留在 DEFAULT 分区，查询由数据库裁剪分区，不需要搬移
+        """
+        parent, moment = self.parent, self.parent.c[self.time_column]
+        names = [column.name for column in parent.columns]
+        moved = 0
+        while True:
+            with engine.begin() as conn:
+                # 本批为主键最小的 batch_size 行，按月份分组整批 INSERT ... SELECT
+                high = conn.execute(select(parent.c.id).order_by(parent.c.id).offset(batch_size - 1).limit(1)).scalar()
+                if high is None:
+                    high = conn.execute(select(func.max(parent.c.id))).scalar()
+                if high is None:
+                    break
+                in_batch = parent.c.id <= high
+                month_expression = func.strftime("%Y-%m", moment)
+                for (month,) in conn.execute(select(month_expression).where(in_batch).distinct()).all():
+                    table = self.table(month or month_of(None))
+                    self.ensure(conn, month or month_of(None))
+                    same_month = moment.is_(None) if month is None else month_expression == month
+                    conn.execute(insert(table).from_select(names, select(parent).where(in_batch, same_month)))
+                moved += conn.execute(delete(parent).where(in_batch)).rowcount
+        self.changed()
+        return moved
+
+    def archive(self, engine, month: str, directory: str) -> str:
+        """把分区导出为 Parquet 文件后从库中删除，返回文件路径"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = self.table(month)
+        schema = pa.schema([(column.name, arrow_type(column.type)) for column in table.columns])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table.name}.parquet")
+        rows = 0
+        with engine.connect() as conn, pq.ParquetWriter(path + ".tmp", schema, compression="zstd") as writer:
+            result = conn.execution_options(stream_results=True).execute(select(table).order_by(table.c.id))
+            for batch in result.partitions(ARCHIVE_BATCH):
+                columns = list(zip(*batch))
+                writer.write_batch(pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+                rows += len(batch)
+        if pq.read_metadata(path + ".tmp").num_rows != rows:
+            raise RuntimeError(f"归档文件行数不一致: {path}")
+        os.replace(path + ".tmp", path)
+
+        with engine.begin() as conn:
+            if conn.dialect.name != "sqlite":
+                conn.execute(text(f"ALTER TABLE {self.parent.name} DETACH PARTITION {table.name}"))
+            table.drop(conn)
+            conn.execute(text(
+                f"UPDATE {REGISTRY} SET state = 'archived', row_count = :rows, archive_path = :path, archived_at = :now "
+                "WHERE parent = :parent AND month = :month"),
+                {"rows": rows, "path": path, "now": datetime.utcnow(), "parent": self.parent.name, "month": month})
+            # 归档的会话不再出现在按用户的会话列表中
+            batches.bump(conn, f"archive:{self.parent.name}")
+        self.changed()
+        logger.info("分区 %s 已归档: %s（%d 行）", table.name, path, rows)
+        return path
+
+    def status(self, engine) -> List[dict]:
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT month, table_name, state, row_count, archive_path FROM {REGISTRY} "
+                "WHERE parent = :parent ORDER BY month"), {"parent": self.parent.name}).mappings().all()
+            result = [dict(row) for row in rows]
+            for row in result:
+                if row["state"] == "active":
+                    row["row_count"] = conn.execute(text(f"SELECT COUNT(*) FROM {row['table_name']}")).scalar()
+            if not self.native(engine):
+                default = conn.execute(text(f"SELECT COUNT(*) FROM {self.parent.name}")).scalar()
+                result.insert(0, {"month": None, "table_name": self.parent.name, "state": "default",
+                                  "row_count": default, "archive_path": None})
+        return result
+
+
+def arrow_type(column_type):
+    """列类型对应的 Arrow 类型（归档和分析导出共用）"""
+    import pyarrow as pa
+
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_new_partitions(session):
+    for partitions in session.info.pop("woodenfis_new_partitions", ()):
+        partitions.changed()
+
+
+SESSIONS = MonthlyPartitions(models.MeditationSession.__table__)
+
+PARTITIONED = (SESSIONS,)
+
+
+def maintain_all(engine) -> None:
+    for partitions in PARTITIONED:
+        partitions.maintain(engine)
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="按月分区维护")
+    parser.add_argument("--status", action="store_true", help="列出各分区及行数")
+    parser.add_argument("--maintain", action="store_true", help="创建本月和下月的分区")
+    parser.add_argument("--split-default", action="store_true", help="把父表中的历史数据搬进月份分区")
+    parser.add_argument("--archive-before", metavar="YYYY-MM", help="归档该月之前的分区")
+    parser.add_argument("--archive-dir", default="archive", help="归档文件目录")
+    parser.add_argument("--vacuum", action="store_true", help="归档后执行 VACUUM 回收空间（SQLite）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.maintain:
+        maintain_all(engine)
+    if args.split_default:
+        if engine.dialect.name != "sqlite":
+            parser.error("--split-default 只支持 SQLite，PostgreSQL 的历史数据留在 DEFAULT 分区")
+        print(f"搬移 {SESSIONS.split_default(engine)} 行")
+    if args.archive_before:
+        if args.archive_before >= month_of(datetime.utcnow()):
+            parser.error("只能归档本月之前的分区")
+        with engine.connect() as conn:
+            months = SESSIONS.months(conn, refresh=True)
+        for month in months:
+            if month < args.archive_before:
+                print(SESSIONS.archive(engine, month, args.archive_dir))
+        if args.vacuum and engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+    if args.status or not (args.maintain or args.split_default or args.archive_before):
+        for row in SESSIONS.status(engine):
+            print(f"{row['table_name']:<32} {row['state']:<9} {row['row_count'] if row['row_count'] is not None else '-':>10}"
+                  f"  {row['archive_path'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+采样式性能剖析
+
+后台线程按固定间隔抓取所有线程的调用栈，汇总为 flamegraph.pl / speedscope 可读的折叠栈格式：
+    外层函数;...;内层函数 采样次数
+可只保留经过指定接口函数的调用栈，请求处理路径上没有任何额外开销。
+同一时间只允许一次采集。
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Iterable, Optional, Set
+
+# 空闲等待的栈顶函数，不计入采样结果
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+_capture_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """已有采集正在进行"""
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """采样剖析器：start() 启动后台采样线程，stop() 结束并返回折叠栈"""
+
+    def __init__(self, interval: float, target_codes: Optional[Set] = None):
+        self.interval = interval
+        self.target_codes = target_codes
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="woodenfis-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        if not _capture_lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        _capture_lock.release()
+        return self.collapsed()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self._record(frame)
+            self.samples += 1
+
+    def _record(self, frame) -> None:
+        leaf = frame.f_code
+        if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+            return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if self.target_codes is not None and self.target_codes.isdisjoint(codes):
+            return
+        self._stacks[";".join(_frame_label(code) for code in reversed(codes))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+def endpoint_codes(endpoints: Iterable) -> Set:
+    """接口函数对应的代码对象，用于按路由过滤调用栈"""
+    return {endpoint.__code__ for endpoint in endpoints if hasattr(endpoint, "__code__")}
@@ -0,0 +1,262 @@
+"""
+成就进度
+
+每个用户在 achievement_progress 中有一行：会话数、总敲击数、总时长、最长连续天数、分享数等计数，
+以及已解锁成就ID的位图。计数随来源数据在同一事务中增量维护，读取时不汇总：
+- 敲击上报、完成分享任务调用 record()：一条 UPDATE col = col + n ... RETURNING 取回更新后的整行，
+  按内存中的规则找出已达到阈值但位图中还没有的成就，写入 user_achievements 并置位（只有解锁时多写）
+- 最长连续天数由 streaks.py 批处理计算，写回 user_streaks 后由 sync_streaks() 同步变大的行
+- 还没有进度行的用户（功能上线前的老用户）在第一次更新时从来源数据汇总一次建行，之后只做增量更新；
+  已归档分区中的会话不计入
+- 规则在进程内缓存 RULES_SECONDS 秒。新增规则后，已达到阈值的用户在下一次更新时解锁，或运行本脚本立即补上
+
+GET /achievements/{user_id}/progress 只按主键读这一行，已解锁的成就和各规则的进度都由它得出。
+
+用法:
+    python progress.py                    # 按来源数据重建全部用户的进度行，解锁已达到阈值的成就
+    python progress.py --batch-size 5000
+"""
+
+import argparse
+import functools
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import batches
+import models
+import partitions
+
+logger = logging.getLogger("woodenfis.progress")
+
+# 规则可以使用的计数，即 achievement_progress 的计数列
+METRICS = ("sessions", "total_taps", "total_duration", "longest_streak", "shares")
+RULES_SECONDS = 60
+BATCH_SIZE = 10_000
+
+Rule = Tuple[int, str, int]
+
+# (读取时间, 规则)
+_rules: Optional[Tuple[float, List[Rule]]] = None
+
+
+# ----------------------------------------------------------------- 位图
+
+
+def _to_bytes(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, "little")
+
+
+def set_bits(bits: Optional[bytes], achievement_ids: Iterable[int]) -> bytes:
+    """在位图中置位，返回新位图"""
+    value = int.from_bytes(bits or b"", "little")
+    for achievement_id in achievement_ids:
+        value |= 1 << achievement_id
+    return _to_bytes(value)
+
+
+def has(bits: Optional[bytes], achievement_id: int) -> bool:
+    index = achievement_id >> 3
+    return bool(bits) and index < len(bits) and bool(bits[index] >> (achievement_id & 7) & 1)
+
+
+def ids_of(bits: Optional[bytes]) -> List[int]:
+    """位图中的成就ID，升序"""
+    value = int.from_bytes(bits or b"", "little")
+    ids = []
+    while value:
+        lowest = value & -value
+        ids.append(lowest.bit_length() - 1)
+        value ^= lowest
+    return ids
+
+
+# ----------------------------------------------------------------- 规则
+
+
+def rules(bind) -> List[Rule]:
+    """(成就ID, 计数名, 阈值) 列表，按成就ID排序，进程内缓存 RULES_SECONDS 秒"""
+    global _rules
+    now = time.monotonic()
+    if _rules is None or now - _rules[0] >= RULES_SECONDS:
+        table = models.AchievementRule.__table__
+        _rules = (now, [tuple(row) for row in bind.execute(
+            select(table.c.achievement_id, table.c.metric, table.c.threshold)
+            .where(table.c.metric.in_(METRICS)).order_by(table.c.achievement_id))])
+    return _rules[1]
+
+
+def reset() -> None:
+    """丢弃缓存的规则，下次使用时重新读取"""
+    global _rules
+    _rules = None
+
+
+# ----------------------------------------------------------------- 汇总与增量更新
+
+
+def _empty() -> dict:
+    return {**dict.fromkeys(METRICS, 0), "unlocked": b""}
+
+
+def aggregate(bind, first: int, last: int) -> Dict[int, dict]:
+    """从来源数据汇总 user_id 在 [first, last] 内的用户的计数和已解锁位图，只包含有数据的用户"""
+    totals: Dict[int, dict] = {}
+    unlocked: Dict[int, List[int]] = {}
+
+    def add(user_id, **values):
+        row = totals.setdefault(user_id, _empty())
+        for name, value in values.items():
+            row[name] = max(row[name], value or 0) if name == "longest_streak" else row[name] + (value or 0)
+
+    for table in partitions.SESSIONS.tables(bind):
+        for user_id, count, duration in bind.execute(
+                select(table.c.user_id, func.count(), func.sum(table.c.duration))
+                .where(table.c.user_id.between(first, last)).group_by(table.c.user_id)):
+            add(user_id, sessions=count, total_duration=duration)
+    stats, streaks = models.UserStat.__table__, models.UserStreak.__table__
+    for user_id, taps in bind.execute(select(stats.c.user_id, func.sum(stats.c.total_taps))
+                                      .where(stats.c.user_id.between(first, last)).group_by(stats.c.user_id)):
+        add(user_id, total_taps=taps)
+    for user_id, longest in bind.execute(select(streaks.c.user_id, streaks.c.longest_streak)
+                                         .where(streaks.c.user_id.between(first, last))):
+        add(user_id, longest_streak=longest)
+    shares = models.UserShareTask.__table__
+    for user_id, count in bind.execute(select(shares.c.user_id, func.count())
+                                       .where(shares.c.user_id.between(first, last), shares.c.completed.is_(True))
+                                       .group_by(shares.c.user_id)):
+        add(user_id, shares=count)
+    achievements = models.UserAchievement.__table__
+    for user_id, achievement_id in bind.execute(select(achievements.c.user_id, achievements.c.achievement_id)
+                                                .where(achievements.c.user_id.between(first, last))):
+        add(user_id)
+        unlocked.setdefault(user_id, []).append(achievement_id)
+    for user_id, ids in unlocked.items():
+        totals[user_id]["unlocked"] = set_bits(b"", ids)
+    return totals
+
+
+def _insert(bind, replace: bool):
+    """进度行的 INSERT ... ON CONFLICT：replace 时整行覆盖，否则已存在时跳过"""
+    dialect = bind.get_bind().dialect.name if isinstance(bind, Session) else bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    table = models.AchievementProgress.__table__
+    statement = dialect_insert(table)
+    if not replace:
+        return statement.on_conflict_do_nothing(index_elements=[table.c.user_id])
+    return statement.on_conflict_do_update(index_elements=[table.c.user_id], set_={
+        name: statement.excluded[name] for name in (*METRICS, "unlocked", "updated_at")})
+
+
+def _unlock(bind, user_id: int, row, extra: Iterable[int] = ()) -> List[int]:
+    """解锁 row 中已达到阈值但未置位的成就，并把 extra 置位；返回按规则新解锁的成就ID"""
+    bits = row["unlocked"] or b""
+    reached = [achievement_id for achievement_id, metric, threshold in rules(bind)
+               if (row[metric] or 0) >= threshold and not has(bits, achievement_id)]
+    if reached:
+        now = datetime.utcnow()
+        bind.execute(insert(models.UserAchievement.__table__), [
+            {"user_id": user_id, "achievement_id": achievement_id, "unlocked_at": now} for achievement_id in reached])
+    updated = set_bits(bits, [*reached, *extra])
+    if updated != bits:
+        table = models.AchievementProgress.__table__
+        bind.execute(update(table).where(table.c.user_id == user_id).values(unlocked=updated))
+    return reached
+
+
+@functools.lru_cache(maxsize=None)
+def _increment(names: Tuple[str, ...]):
+    """按计数名预先构造的 UPDATE col = col + :delta_col ... RETURNING，每次只绑定参数，不在写事务中构造语句"""
+    table = models.AchievementProgress.__table__
+    return (update(table).where(table.c.user_id == bindparam("progress_user_id"))
+            .values(updated_at=bindparam("progress_updated_at"),
+                    **{name: table.c[name] + bindparam(f"delta_{name}") for name in names})
+            .returning(*table.c))
+
+
+def record(bind, user_id: int, unlocked: Iterable[int] = (), **deltas: int) -> List[int]:
+    """
+    在调用方的事务中累加计数（deltas 为计数名 -> 增量），把 unlocked 中的成就置位，
+    并解锁达到阈值的成就，返回按规则新解锁的成就ID。来源数据须已写入（flush）同一事务
+    """
+    now = datetime.utcnow()
+    statement = _increment(tuple(sorted(deltas)))
+    parameters = {"progress_user_id": user_id, "progress_updated_at": now,
+                  **{f"delta_{name}": amount for name, amount in deltas.items()}}
+    row = bind.execute(statement, parameters).first()
+    if row is not None:
+        return _unlock(bind, user_id, row._mapping, unlocked)
+    # 还没有进度行：汇总结果已包含本事务中的写入，直接作为新行
+    values = {**_empty(), **aggregate(bind, user_id, user_id).get(user_id, {}), "user_id": user_id, "updated_at": now}
+    if bind.execute(_insert(bind, replace=False).values(**values)).rowcount:
+        return _unlock(bind, user_id, values, unlocked)
+    # 并发的首次更新已经建行，其汇总不包含本事务未提交的写入，按增量更新
+    return _unlock(bind, user_id, bind.execute(statement, parameters).first()._mapping, unlocked)
+
+
+def read(bind, user_id: int) -> dict:
+    """用户的计数和已解锁位图：按主键读一行；还没有进度行时从来源数据汇总（不写入，只读副本上也可用）"""
+    table = models.AchievementProgress.__table__
+    row = bind.execute(select(table).where(table.c.user_id == user_id)).first()
+    if row is not None:
+        return dict(row._mapping)
+    return {**_empty(), **aggregate(bind, user_id, user_id).get(user_id, {}), "user_id": user_id}
+
+
+def sync_streaks(conn, first: int, last: int) -> int:
+    """把 user_streaks 中变大的最长连续天数同步到 [first, last] 内已有的进度行并解锁，返回解锁数"""
+    table, streaks = models.AchievementProgress.__table__, models.UserStreak.__table__
+    rows = conn.execute(update(table).values(longest_streak=streaks.c.longest_streak, updated_at=datetime.utcnow())
+                        .where(table.c.user_id == streaks.c.user_id, table.c.user_id.between(first, last),
+                               table.c.longest_streak < streaks.c.longest_streak)
+                        .returning(*table.c)).all()
+    return sum(len(_unlock(conn, row.user_id, row._mapping)) for row in rows)
+
+
+# ----------------------------------------------------------------- 重建
+
+
+def rebuild(engine, batch_size: int = BATCH_SIZE) -> dict:
+    """按 users.id 分批从来源数据重建全部进度行并解锁已达到阈值的成就，每批一个事务，返回行数和解锁数"""
+    users = models.User.__table__
+    reset()
+    last, written, unlocked = 0, 0, 0
+    start = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(select(users.c.id).where(users.c.id > last)
+                               .order_by(users.c.id).limit(batch_size)).scalars().all()
+            if not ids:
+                break
+            totals = aggregate(conn, ids[0], ids[-1])
+            now = datetime.utcnow()
+            rows = [{**_empty(), **totals.get(user_id, {}), "user_id": user_id, "updated_at": now} for user_id in ids]
+            conn.execute(_insert(conn, replace=True), rows)
+            unlocked += sum(len(_unlock(conn, row["user_id"], row)) for row in rows)
+            batches.bump(conn, "progress")
+        written += len(ids)
+        last = ids[-1]
+    result = {"users": written, "unlocked": unlocked, "seconds": round(time.perf_counter() - start, 3)}
+    logger.info("成就进度重建: %s", result)
+    return result
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="按来源数据重建成就进度")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每个事务的用户数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(rebuild(engine, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+日切：归档前一天的敲击数并清零 today_taps
+
+按时区分组（user_stats.timezone，为空时为 config.DEFAULT_TIMEZONE），该时区过了零点后：
+- 今日有敲击（today_taps > 0）的行按 user_id 顺序分批，每批一个事务：先按 user_id 顺序锁定本批的行
+  （SELECT ... FOR UPDATE；SQLite 的写事务本身串行），再只对锁定的行 INSERT ... SELECT 写入 user_daily_taps、
+  UPDATE 清零，并推进 day_rollovers.last_user_id。PostgreSQL READ COMMITTED 下两条语句各取快照，
+  不先锁定时，其间提交的敲击会未经归档就被清零
+- 每批在同一事务中递增批处理代数（batches.bump），工作进程轮询后使用户数据的条件请求失效
+- 批次边界和待处理的时区都从部分索引 ix_user_stats_rollover (timezone, user_id) WHERE today_taps > 0 读取，
+  只访问有敲击的行，清零后的行离开索引，不会改写全表
+- 中断后重跑从 last_user_id 之后继续，归档和进度在同一事务中提交，不会重复归档
+- 已完成当天日切的时区直接跳过，可以每隔几分钟运行一次，各时区在各自的零点后完成日切
+
+读接口不再需要判断 today_taps 是否属于今天。零点到日切完成之间的敲击、以及首次运行或停机后补跑时
+积累的敲击，都计入该时区的前一天。
+
+用法:
+    python rollover.py                    # 建议 cron 每5分钟运行
+    python rollover.py --batch-size 5000
+"""
+
+import argparse
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import Date, and_, func, literal, select, update
+
+import batches
+import config
+import models
+
+logger = logging.getLogger("woodenfis.rollover")
+
+BATCH_SIZE = 10_000
+
+
+def _zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or config.DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("未知时区 %r，按默认时区 %s 日切", name, config.DEFAULT_TIMEZONE)
+        return ZoneInfo(config.DEFAULT_TIMEZONE)
+
+
+def closing_day(name: Optional[str], now: datetime) -> date:
+    """该时区当前应完成日切的日期（当地昨天），now 为 UTC"""
+    return now.replace(tzinfo=timezone.utc).astimezone(_zone(name)).date() - timedelta(days=1)
+
+
+def pending_timezones(conn) -> List[Optional[str]]:
+    """有用户今日敲击数大于0的时区（只扫描部分索引）"""
+    stats = models.UserStat.__table__
+    return [row[0] for row in conn.execute(select(stats.c.timezone).where(stats.c.today_taps > 0).distinct())]
+
+
+def _archive(conn, day: date, rows):
+    """
+    INSERT ... SELECT 把 rows 条件下的 today_taps 写入 day 的历史；同一用户同一天已有记录时累加
+    （用户切换时区后可能两次日切到同一天）
+    """
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stats, daily = models.UserStat.__table__, models.UserDailyTaps.__table__
+    statement = dialect_insert(daily).from_select(
+        ["user_id", "day", "taps"],
+        select(stats.c.user_id, literal(day, Date), func.sum(stats.c.today_taps)).where(rows).group_by(stats.c.user_id))
+    return statement.on_conflict_do_update(index_elements=[daily.c.user_id, daily.c.day],
+                                           set_={"taps": daily.c.taps + statement.excluded.taps})
+
+
+def rollover_timezone(engine, name: Optional[str], day: date, batch_size: int = BATCH_SIZE) -> int:
+    """把时区 name 的 today_taps 归档为 day 的历史并清零，返回清零的行数"""
+    stats, progress = models.UserStat.__table__, models.DayRollover.__table__
+    key = name or ""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        state = conn.execute(select(progress).where(progress.c.timezone == key)).first()
+        if state is not None and (state.day > day or (state.day == day and state.finished_at is not None)):
+            return 0
+        if state is not None and state.day == day:
+            cursor = state.last_user_id
+            logger.info("时区 %s 继续 %s 的日切，从 user_id > %d 开始", key or config.DEFAULT_TIMEZONE, day, cursor)
+        else:
+            cursor = 0
+            values = {"day": day, "last_user_id": 0, "started_at": now, "finished_at": None}
+            if state is None:
+                conn.execute(progress.insert().values(timezone=key, **values))
+            else:
+                conn.execute(update(progress).where(progress.c.timezone == key).values(**values))
+
+    group = stats.c.timezone.is_(None) if name is None else stats.c.timezone == name
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            pending = and_(group, stats.c.today_taps > 0, stats.c.user_id > cursor)
+            # 本批为索引顺序上的前 batch_size 个用户
+            high = conn.execute(select(stats.c.user_id).where(pending).order_by(stats.c.user_id)
+                                .offset(batch_size - 1).limit(1)).scalar()
+            if high is None:
+                high = conn.execute(select(func.max(stats.c.user_id)).where(pending)).scalar()
+            if high is None:
+                conn.execute(update(progress).where(progress.c.timezone == key)
+                             .values(finished_at=datetime.utcnow()))
+                break
+            # 锁定本批的行，归档和清零之间提交的敲击要等本事务结束，不会只清零不归档
+            ids = conn.execute(select(stats.c.user_id).where(pending, stats.c.user_id <= high)
+                               .order_by(stats.c.user_id).with_for_update()).scalars().all()
+            in_batch = and_(group, stats.c.user_id.in_(ids))
+            conn.execute(_archive(conn, day, in_batch))
+            moved += conn.execute(update(stats).where(in_batch).values(today_taps=0)).rowcount
+            conn.execute(update(progress).where(progress.c.timezone == key).values(last_user_id=high))
+            batches.bump(conn, "rollover")
+        cursor = high
+    logger.info("时区 %s 完成 %s 的日切，清零 %d 行", key or config.DEFAULT_TIMEZONE, day, moved)
+    return moved
+
+
+def rollover(engine, now: Optional[datetime] = None, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """对所有已过零点且尚未日切的时区执行日切，返回各时区清零的行数（默认时区为空字符串）"""
+    now = now or datetime.utcnow()
+    with engine.connect() as conn:
+        names = pending_timezones(conn)
+    return {name or "": rollover_timezone(engine, name, closing_day(name, now), batch_size) for name in names}
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="日切：归档前一天的敲击数并清零 today_taps")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每个事务处理的用户数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(rollover(engine, batch_size=args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -83,6 +83,18 @@ class UserAchievementOut(BaseModel):
     class Config:
         from_attributes = True
 
+class AchievementProgressOut(BaseModel):
+    achievement_id: int
+    metric: str
+    threshold: int
+    value: int
+    unlocked: bool
+
+class UserAchievementProgressOut(BaseModel):
+    user_id: int
+    unlocked: List[int]  # 已解锁的成就ID，包括没有规则、手动解锁的
+    progress: List[AchievementProgressOut]
+
 class LeaderboardOut(BaseModel):
     user_id: int
     period: str
@@ -93,6 +105,40 @@ class LeaderboardOut(BaseModel):
     class Config:
         from_attributes = True
 
+class FriendRankOut(BaseModel):
+    """好友排行榜：rank 为在本人和关注用户中的名次，global_rank 为全站名次"""
+    rank: int
+    user_id: int
+    global_rank: int
+    tap_count: int
+
+class FollowOut(BaseModel):
+    user_id: int
+    created_at: datetime
+
+class TempleCreate(BaseModel):
+    name: str
+    goal: int = 0
+
+class TempleOut(BaseModel):
+    id: int
+    name: str
+    goal: int
+    total_taps: int
+    member_count: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class TempleMemberOut(BaseModel):
+    user_id: int
+    temple_id: int
+    joined_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class ShareTaskOut(BaseModel):
     id: int
     title: str
@@ -109,4 +155,13 @@ class UserShareTaskOut(BaseModel):
     completed_at: Optional[datetime]
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class DashboardOut(BaseModel):
+    """首页聚合数据，未请求的分区不返回"""
+    user: Optional[UserOut] = None
+    stat: Optional[UserStatOut] = None
+    sessions: Optional[List[MeditationSessionOut]] = None
+    achievements: Optional[List[UserAchievementOut]] = None
+    share_tasks: Optional[List[UserShareTaskOut]] = None
+    timings: Dict[str, float]  # 各分区耗时（毫秒）
@@ -0,0 +1,54 @@
+"""
+读接口快速序列化
+
+列投影查询返回的元组直接交给预编译的 pydantic-core 序列化器编码为JSON，
+跳过逐行 from_attributes 校验和 FastAPI 的通用编码器。
+输出与对应的 response_model 保持一致。
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Mapping, Optional, Sequence, Tuple, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+
+def field_names(schema: Type[BaseModel]) -> Tuple[str, ...]:
+    """返回输出模型的字段顺序，列投影查询按此顺序选列"""
+    return tuple(schema.model_fields)
+
+
+@lru_cache(maxsize=None)
+def row_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """为输出模型构建（并缓存）列表序列化器"""
+    row_type = TypedDict(
+        f"{schema.__name__}Row",
+        {name: field.annotation for name, field in schema.model_fields.items()},
+    )
+    return TypeAdapter(List[row_type])
+
+
+def dump_rows(schema: Type[BaseModel], rows: Iterable[Sequence]) -> bytes:
+    """将列投影结果编码为JSON字节串"""
+    names = field_names(schema)
+    return row_adapter(schema).dump_json([dict(zip(names, row)) for row in rows])
+
+
+@lru_cache(maxsize=None)
+def model_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """为输出模型构建（并缓存）ORM对象列表的校验和序列化器"""
+    return TypeAdapter(List[schema])
+
+
+def dump_models(schema: Type[BaseModel], objects: Iterable) -> bytes:
+    """将ORM对象按输出模型编码为JSON字节串，与 response_model 的输出一致"""
+    adapter = model_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(list(objects), from_attributes=True))
+
+
+def json_response(schema: Type[BaseModel], rows: Iterable[Sequence],
+                  headers: Optional[Mapping[str, str]] = None) -> Response:
+    """构造快速路径的JSON响应，headers 用于带上依赖项写入的响应头"""
+    return Response(content=dump_rows(schema, rows), media_type="application/json",
+                    headers=dict(headers) if headers else None)
@@ -0,0 +1,57 @@
+"""
+并发相同读请求的合并（single-flight）
+
+推送发出后大量客户端在同一秒内请求相同的排行榜页和成就目录。Group 按 (路由, 参数) 记录正在进行的读取：
+第一个请求在线程池中执行查询和序列化，同一时刻到达的相同请求等待同一个结果，而不是各自查询一次。
+读取结束后立即移除记录，不缓存结果，之后的请求重新读取，不会返回比单独查询更旧的数据。
+
+- 读取作为独立任务运行，发起它的请求被取消（客户端断开）不影响其他等待者
+- 读取失败时所有等待者收到同一个异常
+- 只在事件循环线程中使用，不加锁；各工作进程分别合并
+- 合并情况见 /metrics 中的 woodenfis_singleflight_requests_total（role=leader 实际执行，role=coalesced 被合并）
+"""
+
+import asyncio
+import functools
+from typing import Any, Callable, Dict, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+import config
+import metrics
+
+
+def _consume(task: asyncio.Task) -> None:
+    # 所有等待者都已取消时读取异常无人接收，在这里取出以免事件循环报告未处理的异常
+    if not task.cancelled():
+        task.exception()
+
+
+class Group:
+    """一个路由的合并组：参数 -> 正在进行的读取"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, function: Callable[..., Any], *args) -> Any:
+        """在线程池中执行 function(*args)；key 相同的读取正在进行时等待其结果"""
+        if not config.SINGLE_FLIGHT:
+            return await run_in_threadpool(function, *args)
+        task = self._calls.get(key)
+        if task is None:
+            metrics.SINGLE_FLIGHT_REQUESTS.inc((self.name, "leader"))
+            task = asyncio.ensure_future(run_in_threadpool(function, *args))
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+            task.add_done_callback(_consume)
+        else:
+            metrics.SINGLE_FLIGHT_REQUESTS.inc((self.name, "coalesced"))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -0,0 +1,207 @@
+"""
+排行榜快照
+
+后台任务每隔 LEADERBOARD_REFRESH_SECONDS 秒读取各周期排行榜的前 LEADERBOARD_SNAPSHOT_SIZE 名，
+按 LEADERBOARD_PAGE_SIZE 分页预先编码为JSON字节串，连同按内容生成的 ETag 和预先压缩的 gzip/br 字节串组成不可变的快照，
+再整体替换模块级引用。读请求只做一次字典查找，不访问数据库，也不做序列化和压缩；替换是单次引用赋值，读到的总是某一版完整的快照。
+内容未变的页沿用上一版的压缩结果，刷新时只压缩变化了的页。
+
+快照同时带有各周期全部名次的分数缓存（Ranking，按 user_id 排序的 NumPy 数组，每名约20字节），
+好友排行榜对关注列表二分查找名次后只选出前 limit 名，不做 JOIN 和全量排序。
+分数缓存只在排行榜变化（最大行ID、该周期最大名次或第一页内容改变）时重新读取，其余刷新沿用上一版。
+
+- 周期列表沿 ix_leaderboard_period_rank 跳跃读取（每次取大于上一个周期的最小值），不扫描整个索引
+- 各工作进程各自维护快照，进程之间的快照时间相差不超过一个刷新间隔
+- 后台任务没有运行（如未进入 lifespan）或刷新持续失败时，读请求发现快照缺失或已超过 STALE_INTERVALS 个
+  刷新间隔，就同步重建一次
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+
+import compression
+import config
+import crud
+import metrics
+import models
+import schemas
+from database import ReadSession
+from serializers import dump_rows
+
+logger = logging.getLogger("woodenfis.snapshots")
+
+# 快照超过这么多个刷新间隔仍未更新时视为过期，由读请求同步重建
+STALE_INTERVALS = 3
+# 读取分数缓存时每批的行数
+FETCH_BATCH = 200_000
+
+
+class Page(NamedTuple):
+    body: bytes
+    etag: str
+    # 预先压缩的字节串：编码 -> 内容
+    variants: Dict[str, bytes] = {}
+
+
+def _page(body: bytes, reuse: Optional[Dict[str, Page]] = None) -> Page:
+    """编码好的页；内容与上一版快照中某页相同时沿用其压缩结果"""
+    etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    page = reuse.get(etag) if reuse else None
+    return page if page is not None else Page(body, etag, compression.precompress(body))
+
+
+# 不存在的周期和超出前N名的页
+EMPTY_PAGE = _page(b"[]")
+
+
+class Ranking(NamedTuple):
+    """一个周期全部名次的分数缓存，按 user_id 排序"""
+    fingerprint: tuple
+    user_ids: np.ndarray
+    ranks: np.ndarray
+    tap_counts: np.ndarray
+
+    def top(self, user_ids: Iterable[int], limit: int) -> List[tuple]:
+        """
+        user_ids 中名次最靠前的 limit 个用户，返回 (名次, user_id, 全站名次, 敲击数)。
+        二分查找各用户的位置后用 argpartition 选出前 limit 名再排序，不对全部候选排序
+        """
+        if not len(self.user_ids):
+            return []
+        wanted = user_ids if isinstance(user_ids, np.ndarray) else np.fromiter(user_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.user_ids, wanted), len(self.user_ids) - 1)
+        positions = np.sort(positions[self.user_ids[positions] == wanted])
+        positions = positions[np.append(True, positions[1:] != positions[:-1])]
+        ranks = self.ranks[positions]
+        if len(positions) > limit:
+            keep = np.argpartition(ranks, limit - 1)[:limit]
+            positions, ranks = positions[keep], ranks[keep]
+        positions = positions[np.argsort(ranks, kind="stable")]
+        return list(zip(range(1, len(positions) + 1), self.user_ids[positions].tolist(),
+                        self.ranks[positions].tolist(), self.tap_counts[positions].tolist()))
+
+
+class Snapshot(NamedTuple):
+    built_at: float
+    pages: Dict[str, Tuple[Page, ...]]
+    rankings: Dict[str, Ranking] = {}
+
+    def page(self, period: str, number: int) -> Page:
+        pages = self.pages.get(period, ())
+        return pages[number - 1] if 1 <= number <= len(pages) else EMPTY_PAGE
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.built_at)
+
+
+_snapshot: Optional[Snapshot] = None
+_lock = threading.Lock()
+
+
+def periods(db) -> list:
+    """排行榜中已有的周期：每次取大于上一个周期的最小值，只访问索引中各周期的第一项"""
+    column = models.Leaderboard.period
+    found = []
+    period = db.execute(select(func.min(column))).scalar()
+    while period is not None:
+        found.append(period)
+        period = db.execute(select(func.min(column)).where(column > period)).scalar()
+    return found
+
+
+def load_ranking(db, period: str, fingerprint: tuple) -> Ranking:
+    """读取周期的全部 (user_id, 名次, 敲击数)；同一用户有多行时保留最靠前的名次"""
+    board = models.Leaderboard
+    # 走 Core 连接执行，不经过 ORM 的结果处理，百万行时快约三分之一
+    result = db.connection().execute(select(board.user_id, board.rank, board.tap_count).where(board.period == period),
+                                     execution_options={"stream_results": True})
+    chunks = [np.fromiter(itertools.chain.from_iterable(batch), dtype=np.int64, count=3 * len(batch))
+              for batch in result.partitions(FETCH_BATCH)]
+    rows = np.concatenate(chunks).reshape(-1, 3) if chunks else np.zeros((0, 3), dtype=np.int64)
+    rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:, 0] != rows[:-1, 0]
+    rows = rows[first]
+    return Ranking(fingerprint, rows[:, 0].copy(), rows[:, 1].astype(np.int32), rows[:, 2].copy())
+
+
+def build(previous: Optional[Snapshot] = None) -> Snapshot:
+    """读取各周期前N名并编码分页；分数缓存未变化的周期沿用 previous 中的"""
+    start = time.perf_counter()
+    built_at = time.time()
+    board = models.Leaderboard
+    size = config.LEADERBOARD_PAGE_SIZE
+    pages, rankings = {}, {}
+    reuse = {page.etag: page for period_pages in previous.pages.values() for page in period_pages} if previous else {}
+    db = ReadSession()
+    try:
+        last_id = db.execute(select(func.max(board.id))).scalar()
+        for period in periods(db):
+            rows = crud.get_leaderboard_rows(db, period, limit=config.LEADERBOARD_SNAPSHOT_SIZE)
+            pages[period] = tuple(_page(dump_rows(schemas.LeaderboardOut, rows[offset:offset + size]), reuse)
+                                  for offset in range(0, len(rows), size))
+            last_rank = db.execute(select(func.max(board.rank)).where(board.period == period)).scalar()
+            fingerprint = (last_id, last_rank, pages[period][0].etag if pages[period] else None)
+            ranking = previous.rankings.get(period) if previous is not None else None
+            if ranking is None or ranking.fingerprint != fingerprint:
+                ranking = load_ranking(db, period, fingerprint)
+            rankings[period] = ranking
+    finally:
+        db.close()
+    metrics.LEADERBOARD_SNAPSHOT_SECONDS.observe((), time.perf_counter() - start)
+    return Snapshot(built_at, pages, rankings)
+
+
+def _expired(snapshot: Optional[Snapshot]) -> bool:
+    return snapshot is None or snapshot.age() > STALE_INTERVALS * config.LEADERBOARD_REFRESH_SECONDS
+
+
+def fresh() -> Optional[Snapshot]:
+    """当前快照，缺失或过期时为None（不阻塞，可在事件循环中调用）"""
+    snapshot = _snapshot
+    return None if _expired(snapshot) else snapshot
+
+
+def current() -> Snapshot:
+    """当前快照，缺失或过期时同步重建；并发的请求只重建一次"""
+    global _snapshot
+    snapshot = _snapshot
+    if not _expired(snapshot):
+        return snapshot
+    with _lock:
+        if _expired(_snapshot):
+            _snapshot = build(_snapshot)
+        return _snapshot
+
+
+def refresh() -> Snapshot:
+    """重建并替换快照"""
+    global _snapshot
+    with _lock:
+        _snapshot = build(_snapshot)
+        return _snapshot
+
+
+def reset() -> None:
+    """丢弃当前快照（测试中随数据库回滚一起重置）"""
+    global _snapshot
+    _snapshot = None
+
+
+async def run_refresher(interval: float) -> None:
+    """后台刷新任务，由 lifespan 启动和取消；刷新失败时继续使用上一版快照"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(refresh)
+        except Exception:
+            logger.exception("排行榜快照刷新失败，继续使用 %.0f 秒前的快照", _snapshot.age() if _snapshot else 0)
@@ -0,0 +1,184 @@
+"""
+慢查询日志与请求级SQL轨迹
+
+- 慢查询：执行时间超过 config.SLOW_QUERY_MS 的语句记录归一化SQL、参数形态、耗时和来源路由，
+  写入 woodenfis.slow_query 日志并保存在环形缓冲区中
+- SQL轨迹：被采样的请求记录全部语句的时间线，保存在环形缓冲区中；
+  管理员请求携带 `X-Debug-Trace: 1` 时强制采样，并在响应头 X-Debug-Trace 中返回时间线
+
+未采样的请求只多一次随机数判断，语句执行只多一次阈值比较。
+"""
+
+import hmac
+import itertools
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+import config
+import metrics
+
+logger = logging.getLogger("woodenfis.slow_query")
+
+# 响应头中的时间线长度上限，超出部分只保留在环形缓冲区
+TRACE_HEADER_LIMIT = 8192
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+
+slow_queries: deque = deque(maxlen=config.SLOW_QUERY_BUFFER)
+traces: deque = deque(maxlen=config.TRACE_BUFFER)
+
+_trace_ids = itertools.count(1)
+
+
+def normalize_sql(statement: str) -> str:
+    """归一化SQL：合并空白，字面量替换为 ?，IN 列表折叠为 (?, ...)"""
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _POSTCOMPILE.sub("(?, ...)", sql)
+    return _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+
+
+def _value_types(parameters) -> str:
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+
+
+def parameter_shape(parameters, executemany: bool) -> str:
+    """参数形态：只记录类型和批量大小，不记录参数值"""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)}x{_value_types(rows[0])}" if rows else "0x()"
+    return _value_types(parameters or ())
+
+
+class Trace:
+    """单个请求的SQL时间线"""
+    __slots__ = ("id", "method", "path", "started", "wall_time", "statements")
+
+    def __init__(self, method: str, path: str):
+        self.id = next(_trace_ids)
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_time = time.time()
+        self.statements: List[tuple] = []
+
+    def timeline(self) -> List[list]:
+        """[[相对请求开始的毫秒数, 耗时毫秒, 归一化SQL], ...]"""
+        return [[round(offset * 1000, 3), round(duration * 1000, 3), normalize_sql(sql)]
+                for offset, duration, sql in self.statements]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "time": self.wall_time,
+            "statements": self.timeline(),
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("woodenfis_sql_trace", default=None)
+
+
+def _trace_header(trace: Trace) -> str:
+    """时间线编码为ASCII JSON，超长时截断并注明语句总数"""
+    timeline = trace.timeline()
+    value = json.dumps(timeline, separators=(",", ":"))
+    while len(value) > TRACE_HEADER_LIMIT and timeline:
+        timeline.pop()
+        value = json.dumps({"truncated": len(trace.statements), "statements": timeline}, separators=(",", ":"))
+    return value
+
+
+class SQLTraceMiddleware:
+    """对采样请求记录SQL时间线的ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        forced = _forced(scope)
+        if not forced and (config.TRACE_SAMPLE_RATE <= 0 or random.random() >= config.TRACE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_with_trace(message):
+            if forced and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-debug-trace-id", str(trace.id).encode()))
+                headers.append((b"x-debug-trace", _trace_header(trace).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            _current_trace.reset(token)
+            traces.append(trace)
+
+
+def _forced(scope) -> bool:
+    """管理员请求携带 X-Debug-Trace: 1 时强制采样"""
+    if not config.ADMIN_TOKEN:
+        return False
+    headers = dict(scope.get("headers") or ())
+    # 与 api/debug.py 的 require_admin 一样常数时间比较
+    return (headers.get(b"x-debug-trace") == b"1"
+            and hmac.compare_digest(headers.get(b"x-admin-token", b""), config.ADMIN_TOKEN.encode()))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("woodenfis_trace_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end = time.perf_counter()
+    start = conn.info["woodenfis_trace_start"].pop()
+    duration = end - start
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.statements.append((start - trace.started, duration, statement))
+
+    if duration * 1000 >= config.SLOW_QUERY_MS:
+        request = metrics.current_request()
+        entry = {
+            "time": time.time(),
+            "duration_ms": round(duration * 1000, 3),
+            "sql": normalize_sql(statement),
+            "params": parameter_shape(parameters, executemany),
+            "route": request.route if request is not None else None,
+        }
+        slow_queries.append(entry)
+        logger.warning("慢查询 %.1fms route=%s params=%s sql=%s",
+                       entry["duration_ms"], entry["route"], entry["params"], entry["sql"])
+
+
+def instrument_engine(engine) -> None:
+    """为引擎挂载慢查询与轨迹事件（重复调用无副作用）"""
+    if getattr(engine, "_woodenfis_traced", False):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    engine._woodenfis_traced = True
@@ -0,0 +1,238 @@
+"""
+连续打卡与留存批处理
+
+把全部冥想会话按 (用户, 日期) 读成 NumPy 数组，整体向量化计算，不逐用户循环：
+- 连续打卡：按用户、日期排序去重后，相邻两天之差不为1或换用户处即新一段连续区间的起点，
+  区间起点的位置差即区间长度；每个用户最长的区间为最长连续天数，最后一个区间截至今天或昨天时为当前连续天数
+- 留存：每个用户的首次活跃日为同期群，Dn 为首次活跃后第 n 天仍活跃的用户比例（analytics.py 共用）
+
+结果按 user_id 分批写回：user_streaks 批量 upsert（最长连续天数只增不减，分区归档后不会变小），
+同一事务内用 UPDATE ... FROM 同步 user_stats.consecutive_days 和成就进度的最长连续天数（并解锁达到阈值的成就），
+并递增批处理代数（batches.bump），工作进程轮询后使用户数据的条件请求失效；cohort_retention 整表替换。
+每批一个短事务，可在服务运行中执行，建议每天凌晨运行一次。
+
+用法:
+    python streaks.py                     # 以今天（UTC）为基准
+    python streaks.py --today 2026-10-19 --batch-size 20000
+"""
+
+import argparse
+import itertools
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Date, Integer, case, cast, delete, func, insert, literal, select, type_coerce, update
+
+import batches
+import models
+import partitions
+import progress
+
+logger = logging.getLogger("woodenfis.streaks")
+
+BATCH_SIZE = 50_000
+# 每次从库中读取的会话行数
+FETCH_BATCH = 200_000
+OFFSETS = (1, 7, 30)
+EPOCH = date(1970, 1, 1)
+# SQLite julianday 中 1970-01-01 00:00 的值
+JULIAN_EPOCH = 2440587.5
+
+
+def day_of(number: int) -> date:
+    return EPOCH + timedelta(days=int(number))
+
+
+# ----------------------------------------------------------------- 向量化计算
+
+
+def distinct(values: np.ndarray) -> np.ndarray:
+    """排序去重。不带 return_* 参数的 np.unique 在 NumPy 2.3+ 走哈希去重，千万行时比排序慢一个数量级"""
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def unique_days(users: np.ndarray, days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(用户, 日期) 去重，按用户、日期排序"""
+    keys = distinct((users.astype(np.int64) << 32) | days.astype(np.int64))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def first_days(users: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """按用户、日期排序的 (users, days) 中每行所属用户的首次活跃日"""
+    _, starts = np.unique(users, return_index=True)
+    return np.repeat(days[starts], np.diff(np.append(starts, len(users))))
+
+
+def compute_streaks(users: np.ndarray, days: np.ndarray, today: int):
+    """
+    users/days 已按用户、日期排序去重（unique_days），today 为距1970-01-01的天数。
+    返回 (user_ids, 当前连续天数, 最长连续天数, 最后活跃日)，每个用户一项
+    """
+    count = len(users)
+    if not count:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    new_user = np.ones(count, dtype=bool)
+    new_user[1:] = users[1:] != users[:-1]
+    new_run = new_user.copy()
+    new_run[1:] |= np.diff(days) != 1
+
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.append(run_starts, count))
+    # 每行所属区间的序号，用于定位各用户的第一段和最后一段
+    run_of_row = np.cumsum(new_run) - 1
+    user_starts = np.flatnonzero(new_user)
+    user_ends = np.append(user_starts[1:], count) - 1
+
+    longest = np.maximum.reduceat(run_lengths, run_of_row[user_starts])
+    last_day = days[user_ends]
+    current = np.where(last_day >= today - 1, run_lengths[run_of_row[user_ends]], 0)
+    return users[user_starts], current, longest, last_day
+
+
+def compute_retention(users: np.ndarray, days: np.ndarray, offsets: Sequence[int] = OFFSETS):
+    """
+    users/days 已按用户、日期排序去重。返回 (同期群首日, 人数, {n: Dn 留存率})，
+    数据还没覆盖到第 n 天的同期群留存率为 NaN
+    """
+    if not len(users):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, {offset: np.zeros(0) for offset in offsets}
+    first = first_days(users, days)
+    cohorts, sizes = np.unique(first[days == first], return_counts=True)
+    latest = days.max()
+    rates = {}
+    for offset in offsets:
+        retained = np.zeros(len(cohorts), dtype=np.int64)
+        hit_cohorts, hits = np.unique(first[days - first == offset], return_counts=True)
+        retained[np.searchsorted(cohorts, hit_cohorts)] = hits
+        rates[offset] = np.where(cohorts + offset <= latest, retained / sizes, np.nan)
+    return cohorts, sizes, rates
+
+
+# ----------------------------------------------------------------- 读取与写回
+
+
+def _day_number(conn, column):
+    """时间列在库中换算为距1970-01-01的天数"""
+    if conn.dialect.name == "sqlite":
+        return cast(func.julianday(column) - JULIAN_EPOCH, Integer)
+    return type_coerce(cast(column, Date) - literal(EPOCH, Date), Integer)
+
+
+def load_activity(conn, sessions: partitions.MonthlyPartitions = partitions.SESSIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """读取仍在库中的全部会话的 (user_id, 日期)，去重后按用户、日期排序"""
+    chunks = []
+    for table in sessions.tables(conn):
+        moment = table.c[sessions.time_column]
+        result = conn.execution_options(stream_results=True).execute(
+            select(table.c[sessions.key], _day_number(conn, moment)).where(moment.is_not(None)))
+        for batch in result.partitions(FETCH_BATCH):
+            # np.array 直接处理 Row 时会逐行探测映射接口，展平后 fromiter 快得多；每批先去重，控制内存
+            chunk = np.fromiter(itertools.chain.from_iterable(batch), dtype=np.int64, count=2 * len(batch)).reshape(-1, 2)
+            chunks.append(distinct((chunk[:, 0] << 32) | chunk[:, 1]))
+    if not chunks:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys = distinct(np.concatenate(chunks))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def _upsert(conn):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    table = models.UserStreak.__table__
+    statement = dialect_insert(table)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(index_elements=[table.c.user_id], set_={
+        "current_streak": excluded.current_streak,
+        "longest_streak": case((excluded.longest_streak > table.c.longest_streak, excluded.longest_streak),
+                               else_=table.c.longest_streak),
+        "last_active_date": excluded.last_active_date,
+        "computed_at": excluded.computed_at,
+    })
+
+
+def write_streaks(engine, user_ids, current, longest, last_day, batch_size: int = BATCH_SIZE) -> int:
+    """按 user_id 分批 upsert user_streaks 并同步 user_stats.consecutive_days 和成就进度，返回 user_stats 更新行数"""
+    streaks, stats = models.UserStreak.__table__, models.UserStat.__table__
+    now = datetime.utcnow()
+    updated = 0
+    for start in range(0, len(user_ids), batch_size):
+        stop = min(start + batch_size, len(user_ids))
+        rows = [{"user_id": user_id, "current_streak": streak, "longest_streak": best,
+                 "last_active_date": day_of(day), "computed_at": now}
+                for user_id, streak, best, day in zip(user_ids[start:stop].tolist(), current[start:stop].tolist(),
+                                                      longest[start:stop].tolist(), last_day[start:stop].tolist())]
+        with engine.begin() as conn:
+            conn.execute(_upsert(conn), rows)
+            updated += conn.execute(
+                update(stats).values(consecutive_days=streaks.c.current_streak).where(
+                    stats.c.user_id == streaks.c.user_id,
+                    streaks.c.user_id.between(int(user_ids[start]), int(user_ids[stop - 1])),
+                    stats.c.consecutive_days.is_distinct_from(streaks.c.current_streak))).rowcount
+            progress.sync_streaks(conn, int(user_ids[start]), int(user_ids[stop - 1]))
+            batches.bump(conn, "streaks")
+    return updated
+
+
+def write_retention(engine, cohorts, sizes, rates: Dict[int, np.ndarray]) -> None:
+    """整表替换 cohort_retention"""
+    table = models.CohortRetention.__table__
+    now = datetime.utcnow()
+    rows = [{"cohort_date": day_of(cohort), "users": size, "computed_at": now,
+             **{f"d{offset}": None if np.isnan(rates[offset][i]) else float(rates[offset][i]) for offset in OFFSETS}}
+            for i, (cohort, size) in enumerate(zip(cohorts.tolist(), sizes.tolist()))]
+    with engine.begin() as conn:
+        conn.execute(delete(table))
+        if rows:
+            conn.execute(insert(table), rows)
+
+
+def run(engine, today: Optional[date] = None, sessions: partitions.MonthlyPartitions = partitions.SESSIONS,
+        batch_size: int = BATCH_SIZE) -> dict:
+    """读取、计算、写回，返回各阶段耗时和行数"""
+    today_number = ((today or datetime.utcnow().date()) - EPOCH).days
+    timings = {}
+
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        users, days = load_activity(conn, sessions)
+    timings["load_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    user_ids, current, longest, last_day = compute_streaks(users, days, today_number)
+    retention = compute_retention(users, days)
+    timings["compute_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updated = write_streaks(engine, user_ids, current, longest, last_day, batch_size)
+    write_retention(engine, *retention)
+    timings["write_seconds"] = time.perf_counter() - start
+
+    result = {"active_days": len(users), "users": len(user_ids), "user_stats_updated": updated,
+              "cohorts": len(retention[0]), **{name: round(value, 3) for name, value in timings.items()}}
+    logger.info("连续打卡与留存: %s", result)
+    return result
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="连续打卡与留存批处理")
+    parser.add_argument("--today", type=date.fromisoformat, help="计算当前连续天数的基准日（UTC），默认今天")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每个写回事务的用户数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(run(engine, args.today, batch_size=args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+成就进度测试
+
+- 敲击上报和完成分享任务在同一事务中累加进度，达到阈值的成就只解锁一次，已解锁和进度都从进度行读出
+- 没有进度行的老用户第一次更新时从来源数据建行；任意操作序列后进度行与来源数据的汇总一致
+- 批量重建补上新增规则的解锁，连续打卡批处理同步最长连续天数；两者每批递增批处理代数
+"""
+
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, select
+
+from main import app
+import batches
+import models
+import partitions
+import progress
+import streaks
+
+client = TestClient(app)
+
+
+def test_bitset():
+    bits = progress.set_bits(b"", [0, 9, 64])
+    assert len(bits) == 9 and progress.ids_of(bits) == [0, 9, 64]
+    assert progress.has(bits, 9) and not progress.has(bits, 8) and not progress.has(bits, 200)
+    assert progress.set_bits(bits, [9]) == bits and progress.ids_of(b"") == []
+
+
+@pytest.fixture
+def catalog(db):
+    """3个带规则的成就和1个没有规则（只能手动解锁）的成就"""
+    achievements = [models.Achievement(name=name, description=name, icon="star")
+                    for name in ("初敲木鱼", "百次功德", "三次冥想", "分享善缘")]
+    db.add_all(achievements)
+    db.commit()
+    first, hundred, sessions, _ = [achievement.id for achievement in achievements]
+    db.add_all([models.AchievementRule(achievement_id=first, metric="total_taps", threshold=1),
+                models.AchievementRule(achievement_id=hundred, metric="total_taps", threshold=100),
+                models.AchievementRule(achievement_id=sessions, metric="sessions", threshold=3)])
+    db.commit()
+    return [achievement.id for achievement in achievements]
+
+
+def new_user(db, name, phone):
+    user = models.User(username=name, phone=phone)
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def tap(user_id, count):
+    assert client.post(f"/meditation/{user_id}/sessions", json={"duration": 60, "tap_count": count}).status_code == 200
+
+
+def unlocked_rows(db, user_id):
+    return sorted(db.scalars(select(models.UserAchievement.achievement_id)
+                             .where(models.UserAchievement.user_id == user_id)).all())
+
+
+def test_incremental_unlock(db, catalog):
+    first, hundred, sessions, manual = catalog
+    user_id = new_user(db, "进度测试", "13700000500")
+    tap(user_id, 60)
+    body = client.get(f"/achievements/{user_id}/progress").json()
+    assert body["unlocked"] == [first]
+    assert {item["achievement_id"]: (item["value"], item["unlocked"]) for item in body["progress"]} == \
+        {first: (60, True), hundred: (60, False), sessions: (1, False)}
+
+    tap(user_id, 60)
+    tap(user_id, 0)
+    tap(user_id, 5)
+    assert client.get(f"/achievements/{user_id}/progress").json()["unlocked"] == [first, hundred, sessions]
+    assert unlocked_rows(db, user_id) == [first, hundred, sessions]
+
+    assert client.post(f"/achievements/{user_id}/unlock/{manual}").status_code == 200
+    row = db.get(models.AchievementProgress, user_id)
+    assert progress.ids_of(row.unlocked) == [first, hundred, sessions, manual]
+    assert (row.sessions, row.total_taps, row.total_duration) == (4, 125, 240)
+    assert len(client.get(f"/achievements/{user_id}/user").json()) == 4
+
+
+def test_existing_user_and_invariant(db, catalog):
+    """来源数据早于进度行的老用户：读取时汇总，第一次更新时建行；之后随机操作，进度行始终等于汇总"""
+    first, hundred, sessions, _ = catalog
+    user_id = new_user(db, "老用户", "13700000501")
+    db.add(models.UserStat(user_id=user_id, total_taps=500, today_taps=0, consecutive_days=0))
+    partitions.SESSIONS.insert(db, {"user_id": user_id, "duration": 300, "tap_count": 500,
+                                    "created_at": datetime(2026, 1, 5)})
+    task = models.ShareTask(title="分享", description="分享", merit=1, icon="share")
+    db.add(task)
+    db.commit()
+    assert client.get(f"/achievements/{user_id}/progress").json()["unlocked"] == []
+    assert db.get(models.AchievementProgress, user_id) is None
+
+    rng = random.Random(50)
+    for _ in range(20):
+        if rng.random() < 0.8:
+            tap(user_id, rng.randint(0, 30))
+        else:
+            assert client.post(f"/share/{user_id}/complete/{task.id}").status_code == 200
+        row = db.get(models.AchievementProgress, user_id)
+        db.refresh(row)
+        expected = progress.aggregate(db, user_id, user_id)[user_id]
+        assert {name: getattr(row, name) for name in (*progress.METRICS, "unlocked")} == expected
+    assert progress.ids_of(row.unlocked) == [first, hundred, sessions] == unlocked_rows(db, user_id)
+
+
+def test_rebuild_and_streaks(engine):
+    with engine.begin() as conn:
+        user_ids = conn.execute(insert(models.User.__table__).returning(models.User.__table__.c.id),
+                                [{"username": f"重建{i}", "phone": f"137000006{i:02d}"} for i in range(5)]).scalars().all()
+        achievement_ids = conn.execute(insert(models.Achievement.__table__).returning(models.Achievement.__table__.c.id),
+                                       [{"name": "千次功德"}, {"name": "连续七天"}]).scalars().all()
+        conn.execute(insert(models.UserStat.__table__),
+                     [{"user_id": user_id, "total_taps": 400 * i, "today_taps": 0, "consecutive_days": 0}
+                      for i, user_id in enumerate(user_ids)])
+        conn.execute(insert(models.AchievementRule.__table__), [
+            {"achievement_id": achievement_ids[0], "metric": "total_taps", "threshold": 1000},
+            {"achievement_id": achievement_ids[1], "metric": "longest_streak", "threshold": 7}])
+
+    result = progress.rebuild(engine, batch_size=2)
+    assert (result["users"], result["unlocked"]) == (5, 2)
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.AchievementProgress.__table__).order_by("user_id")).all()
+        assert [row.total_taps for row in rows] == [0, 400, 800, 1200, 1600]
+        assert [progress.ids_of(row.unlocked) for row in rows] == [[], [], [], [achievement_ids[0]], [achievement_ids[0]]]
+    assert progress.rebuild(engine)["unlocked"] == 0
+    assert batches.refresh(engine)[0] == 4
+
+    ids = np.array(user_ids[:2])
+    streaks.write_streaks(engine, ids, np.array([3, 8]), np.array([3, 8]), np.array([20_000, 20_000]))
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.AchievementProgress.__table__)
+                            .where(models.AchievementProgress.user_id.in_(user_ids[:2])).order_by("user_id")).all()
+        assert [row.longest_streak for row in rows] == [3, 8]
+        assert [progress.ids_of(row.unlocked) for row in rows] == [[], [achievement_ids[1]]]
+        assert conn.execute(select(func.count()).select_from(models.UserAchievement)).scalar() == 3
+    assert batches.refresh(engine)[0] == 5
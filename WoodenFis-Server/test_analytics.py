@@ -0,0 +1,98 @@
+"""
+离线分析导出与查询测试
+
+- 增量导出：第二次只导出新增会话和有变化的用户，等待期内的会话留到下一批
+- 中断批次留下的文件查询时不可见，重跑后不重复
+- DAU、D1/D7/D30 留存和周同期群只读取导出文件
+"""
+
+from datetime import date, datetime, timedelta
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+import analytics
+import models
+import partitions
+
+NOW = datetime(2026, 10, 20, 12)
+
+
+@pytest.fixture
+def sessions():
+    return partitions.MonthlyPartitions(models.MeditationSession.__table__)
+
+
+def add_sessions(engine, sessions, rows):
+    with Session(engine) as db:
+        for user_id, moment in rows:
+            sessions.insert(db, {"user_id": user_id, "duration": 60, "tap_count": 10, "created_at": moment})
+        db.commit()
+
+
+def read(directory, name):
+    files = analytics.committed_files(str(directory), name)
+    return pq.ParquetDataset(files).read().to_pylist() if files else []
+
+
+def test_incremental_export(engine, sessions, tmp_path):
+    """按天分区写出；等待期内的会话、未变化的用户不导出"""
+    directory = tmp_path / "export"
+    add_sessions(engine, sessions, [(1, datetime(2026, 9, 30, 8)), (2, datetime(2026, 10, 1, 9)),
+                                    (1, NOW - timedelta(seconds=10))])
+    with engine.begin() as conn:
+        conn.execute(insert(models.UserStat.__table__), [
+            {"user_id": 1, "total_taps": 100, "today_taps": 5}, {"user_id": 2, "total_taps": 50, "today_taps": 0}])
+
+    first = analytics.export(engine, str(directory), sessions, now=NOW)
+    assert first == {"sequence": 1, "meditation_sessions": 2, "user_stats": 2}
+    assert (directory / "meditation_sessions" / "date=2026-09-30").is_dir()
+    assert {row["total_taps_delta"] for row in read(directory, "user_stats")} == {100, 50}
+
+    with engine.begin() as conn:
+        conn.execute(update(models.UserStat.__table__).where(models.UserStat.user_id == 1).values(total_taps=130))
+    second = analytics.export(engine, str(directory), sessions, now=NOW + timedelta(minutes=5))
+    assert second == {"sequence": 2, "meditation_sessions": 1, "user_stats": 1}
+    assert len(read(directory, "meditation_sessions")) == 3
+    deltas = [(row["user_id"], row["total_taps_delta"]) for row in read(directory, "user_stats")]
+    assert sorted(deltas) == [(1, 30), (1, 100), (2, 50)]
+
+
+def test_interrupted_export(engine, sessions, tmp_path):
+    """未写入检查点的批次文件不可见，重跑时删除后重新导出"""
+    directory = tmp_path / "export"
+    add_sessions(engine, sessions, [(1, datetime(2026, 10, 1))])
+    analytics.export(engine, str(directory), sessions, now=NOW)
+
+    add_sessions(engine, sessions, [(2, datetime(2026, 10, 2))])
+    leftover = directory / "meditation_sessions" / "date=2026-10-02" / "part-000002-0000.parquet"
+    leftover.parent.mkdir(parents=True)
+    pq.write_table(pq.read_table(analytics.committed_files(str(directory), "meditation_sessions")[0]), leftover)
+    assert len(read(directory, "meditation_sessions")) == 1
+
+    assert analytics.export(engine, str(directory), sessions, now=NOW)["meditation_sessions"] == 1
+    assert sorted(row["user_id"] for row in read(directory, "meditation_sessions")) == [1, 2]
+
+
+def test_queries(engine, sessions, tmp_path):
+    """同一天多次会话只算一次活跃；留存以首次活跃日为基准，未到观察日的为 None"""
+    directory = tmp_path / "export"
+    start = datetime(2026, 9, 1, 10)  # 周二
+    add_sessions(engine, sessions, [
+        (1, start), (1, start + timedelta(hours=2)), (1, start + timedelta(days=1)), (1, start + timedelta(days=7)),
+        (2, start), (2, start + timedelta(days=30)),
+        (3, start + timedelta(days=1)), (3, start + timedelta(days=2)),
+    ])
+    analytics.export(engine, str(directory), sessions, now=NOW)
+
+    assert analytics.dau(str(directory), end=date(2026, 9, 3)) == [
+        (date(2026, 9, 1), 2), (date(2026, 9, 2), 2), (date(2026, 9, 3), 1)]
+
+    rows = {row["cohort"]: row for row in analytics.retention(str(directory))}
+    assert rows[date(2026, 9, 1)] == {"cohort": date(2026, 9, 1), "users": 2, "d1": 0.5, "d7": 0.5, "d30": 0.5}
+    assert rows[date(2026, 9, 2)] == {"cohort": date(2026, 9, 2), "users": 1, "d1": 1.0, "d7": 0.0, "d30": None}
+
+    assert analytics.cohort(str(directory), weeks=6) == [
+        {"cohort": date(2026, 8, 31), "users": 3, "weeks": [3, 1, 0, 0, 1, 0]}]
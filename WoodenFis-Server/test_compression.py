@@ -0,0 +1,91 @@
+"""
+响应压缩测试
+
+- 按 Accept-Encoding 的权重选择编码，q=0 的编码不使用
+- 超过阈值的JSON/文本响应压缩并改写 Content-Length，小响应和不接受压缩的请求原样返回，都带 Vary
+- 目录类（Cache-Control: public）响应的压缩结果按内容缓存，分块响应逐块压缩
+- 排行榜快照页返回预先压缩的字节串，内容未变的页在刷新后沿用压缩结果
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+from starlette.responses import StreamingResponse
+
+from main import app
+import compression
+import config
+import metrics
+import models
+import snapshots
+
+client = TestClient(app)
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def test_negotiate():
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("gzip;q=0, deflate") is None
+    assert compression.negotiate("identity") is None
+    assert compression.negotiate("*;q=0.5") == compression.ENCODINGS[0]
+    assert compression.negotiate("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert compression.negotiate("br, gzip", ("br", "gzip")) == "br"
+
+
+def test_threshold_and_vary():
+    """/metrics 超过阈值按 gzip 压缩；不接受压缩时原样返回；小响应不压缩"""
+    compressed = client.get("/metrics", headers=GZIP)
+    assert compressed.headers["content-encoding"] == "gzip" and "Accept-Encoding" in compressed.headers["vary"]
+    assert int(compressed.headers["content-length"]) < len(compressed.content)
+    assert "woodenfis_http_requests_total" in compressed.text
+
+    plain = client.get("/metrics", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and "Accept-Encoding" in plain.headers["vary"]
+    assert "content-encoding" not in client.get("/", headers=GZIP).headers
+
+
+def test_catalog_compression_cached(db):
+    """成就目录每次请求都序列化，但内容不变时直接使用缓存的压缩结果"""
+    db.add_all([models.Achievement(name=f"压缩测试成就{i}", description="连续敲击木鱼" * 5, icon="star")
+                for i in range(10)])
+    db.commit()
+    compression.cache.clear()
+    first = client.get("/achievements/", headers=GZIP)
+    assert first.headers["content-encoding"] == "gzip" and first.headers["cache-control"].startswith("public")
+    hits = metrics.COMPRESSION_CACHE_HITS.value()
+    second = client.get("/achievements/", headers=GZIP)
+    assert second.json() == first.json() and len(first.json()) >= 10
+    assert metrics.COMPRESSION_CACHE_HITS.value() == hits + 1
+
+
+def test_streaming_response():
+    async def chunks():
+        for i in range(20):
+            yield json.dumps({"chunk": i, "padding": "木鱼" * 20}).encode() + b"\n"
+
+    async def streaming_app(scope, receive, send):
+        await StreamingResponse(chunks(), media_type="text/plain")(scope, receive, send)
+
+    response = TestClient(compression.CompressionMiddleware(streaming_app)).get("/", headers=GZIP)
+    assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+    assert [json.loads(line)["chunk"] for line in response.text.splitlines()] == list(range(20))
+
+
+def test_precompressed_snapshot(db, monkeypatch):
+    monkeypatch.setattr(config, "LEADERBOARD_PAGE_SIZE", 10)
+    user = models.User(username="压缩快照测试", phone="13700000330")
+    db.add(user)
+    db.commit()
+    db.add_all([models.Leaderboard(user_id=user.id, period="compressed", rank=rank, tap_count=1000 - rank)
+                for rank in range(1, 11)])
+    db.commit()
+
+    response = client.get("/leaderboard/compressed", headers=GZIP)
+    assert response.headers["content-encoding"] == "gzip" and "Accept-Encoding" in response.headers["vary"]
+    assert [row["rank"] for row in response.json()] == list(range(1, 11))
+    plain = client.get("/leaderboard/compressed", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.json() == response.json()
+
+    page = snapshots.current().page("compressed", 1)
+    assert set(page.variants) == set(compression.ENCODINGS)
+    assert snapshots.refresh().page("compressed", 1).variants is page.variants
@@ -0,0 +1,176 @@
+"""
+多工作进程协调测试
+
+- 广播只转发给其他进程，带 key 的消息保留并在新进程连接时同步；保留消息有上限，淘汰数随同步下发
+- 协调端重启后工作进程自动重连，重发自己的带 key 消息，断开期间的广播不丢失
+- collect 汇总所有进程上报的快照
+- 并发写入合并出的版本号与任何一方合并前的都不同，收到旧版本时不回退
+- 指标快照按标签合并
+"""
+
+import time
+
+import pytest
+
+import coordination
+import metrics
+import versions
+
+
+@pytest.fixture
+def hub(tmp_path):
+    hub = coordination.Hub(str(tmp_path / "hub.sock")).start()
+    clients = []
+
+    def connect():
+        client = coordination.UnixSocketBackend(hub.path)
+        client.start()
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.stop()
+    hub.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_publish_relays_and_retains(hub, monkeypatch):
+    """发送方自己收不到；保留的最后一条在新进程 start() 返回前同步完"""
+    received = []
+    monkeypatch.setitem(coordination._handlers, "test", [received.append])
+    first, second = hub(), hub()
+
+    first.publish("test", {"n": 1}, key="a")
+    first.publish("test", {"n": 2}, key="a")
+    second.publish("test", {"n": 3})
+    assert wait_for(lambda: len(received) == 3)
+    assert sorted(message["n"] for message in received) == [1, 2, 3]
+
+    received.clear()
+    hub()
+    assert received == [{"n": 2}]
+
+
+def test_retained_messages_are_bounded(tmp_path, monkeypatch):
+    """超出上限时淘汰最久未更新的保留消息，之后连接的进程得到淘汰数"""
+    received = []
+    monkeypatch.setitem(coordination._handlers, "test", [received.append])
+    hub = coordination.Hub(str(tmp_path / "hub.sock"), limit=2).start()
+    clients = [coordination.UnixSocketBackend(hub.path) for _ in range(2)]
+    try:
+        clients[0].start()
+        for key in ("a", "b", "a", "c"):
+            clients[0].publish("test", {"key": key}, key=key)
+        assert wait_for(lambda: hub.evicted == 1)
+        assert clients[0].evicted() == 0
+
+        clients[1].start()
+        assert received == [{"key": "a"}, {"key": "c"}] and clients[1].evicted() == 1
+    finally:
+        for client in clients:
+            client.stop()
+        hub.close()
+
+
+def test_reconnect_after_hub_restart(tmp_path, monkeypatch):
+    """协调端重启后重连并重发带 key 的消息，包括断开期间发出的"""
+    received = []
+    monkeypatch.setitem(coordination._handlers, "test", [received.append])
+    monkeypatch.setattr(coordination, "RECONNECT_SECONDS", 0.05)
+    path = str(tmp_path / "hub.sock")
+    hub = coordination.Hub(path).start()
+    writer, reader = coordination.UnixSocketBackend(path), coordination.UnixSocketBackend(path)
+    try:
+        writer.start()
+        writer.publish("test", {"n": 1}, key="a")
+        hub.close()
+        writer.publish("test", {"n": 2}, key="b")
+
+        hub = coordination.Hub(path).start()
+        assert wait_for(lambda: len(hub.retained) == 2)
+        reader.start()
+        assert sorted(message["n"] for message in received) == [1, 2]
+        reader.publish("test", {"n": 3})
+        assert wait_for(lambda: len(received) == 3)
+    finally:
+        writer.stop()
+        reader.stop()
+        hub.close()
+
+
+def test_collect_gathers_every_worker(hub, monkeypatch):
+    """每个进程先上报最新快照，再取回全部进程的快照"""
+    monkeypatch.setitem(coordination._reporters, "test", lambda: {"pid": "same-process"})
+    first, second = hub(), hub()
+    second.report("test")
+    assert wait_for(lambda: len(first.collect("test")) == 2)
+
+
+def test_version_merge(monkeypatch):
+    """两个进程同时写入：各自收到对方的广播后合并为同一个新版本，ETag 与双方合并前的都不同"""
+    monkeypatch.setattr(versions, "_versions", {})
+    published = []
+    monkeypatch.setattr(coordination, "publish", lambda channel, data, key=None: published.append(data))
+
+    # 进程 A 写入
+    monkeypatch.setattr(versions, "WRITER", 0xA)
+    first = versions.bump(7)
+    from_a = published.pop()
+    # 进程 B 写入（尚未收到 A 的广播）
+    monkeypatch.setattr(versions, "_versions", {})
+    monkeypatch.setattr(versions, "WRITER", 0xB)
+    second = versions.bump(7)
+    from_b = published.pop()
+    assert versions.token(first) != versions.token(second)
+
+    # B 收到 A 的广播
+    versions._apply(from_a)
+    merged = versions.get(7)[0]
+    assert versions.token(merged) not in (versions.token(first), versions.token(second))
+    # A 收到 B 的广播后得到相同的版本
+    b_state = dict(versions._versions)
+    monkeypatch.setattr(versions, "_versions", {7: (first, from_a["modified"])})
+    versions._apply(from_b)
+    assert versions.get(7)[0] == merged
+
+    # 重复或过期的广播不回退
+    versions._apply(from_b)
+    versions._apply({**from_a, "count": 0})
+    assert versions.get(7)[0] == merged == b_state[7][0]
+    monkeypatch.setattr(versions, "WRITER", 0xA)
+    assert dict(versions.bump(7)) == {0xA: 2, 0xB: 1}
+
+    # 协调端淘汰过保留消息后，同一版本的 ETag 也不同于淘汰前的
+    monkeypatch.setattr(coordination, "evicted", lambda: 3)
+    assert versions.token(merged).endswith("~3")
+
+
+def test_registry_merge():
+    """计数器和直方图相加，merge="max" 的瞬时值取最大"""
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("requests_total", "请求数", ("route",)))
+    latency = registry.register(metrics.Histogram("latency_seconds", "耗时", buckets=(0.1, 1.0)))
+    startup = registry.register(metrics.Gauge("startup_seconds", "启动耗时", merge="max"))
+
+    requests.inc(("/a",), 2)
+    latency.observe((), 0.05)
+    startup.inc((), 3)
+    first = registry.snapshot()
+    requests.inc(("/b",))
+    latency.observe((), 0.5)
+    startup.inc((), -2)
+    second = registry.snapshot()
+
+    text = registry.render([first, second])
+    assert 'requests_total{route="/a"} 4' in text
+    assert 'requests_total{route="/b"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'latency_seconds_count 3' in text
+    assert "startup_seconds 3" in text
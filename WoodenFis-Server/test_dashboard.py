@@ -0,0 +1,76 @@
+"""
+首页聚合接口测试
+
+GET /users/{user_id}/dashboard 一次返回多个分区，支持 fields 选择分区
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal
+from api import user as user_api
+import crud
+import models
+import partitions
+import schemas
+
+client = TestClient(app)
+
+ALL_SECTIONS = {"user", "stat", "sessions", "achievements", "share_tasks"}
+
+
+@pytest.fixture
+def user_id():
+    """创建带统计和冥想记录的测试用户"""
+    db = SessionLocal()
+    user = crud.create_user_by_phone(db, schemas.UserCreateByPhone(username="首页测试用户", phone="13700000003"))
+    crud.create_user_stat(db, user.id)
+    crud.create_meditation_session(db, user.id, schemas.MeditationSessionCreate(duration=300, tap_count=108))
+    yield user.id
+    partitions.SESSIONS.delete(db, user.id)
+    db.query(models.UserStat).filter(models.UserStat.user_id == user.id).delete()
+    db.query(models.User).filter(models.User.id == user.id).delete()
+    db.commit()
+    db.close()
+
+
+@pytest.mark.parametrize("concurrent", [pytest.param(True, marks=pytest.mark.no_transaction), False])
+def test_dashboard_all_sections(user_id, monkeypatch, concurrent):
+    """缺省返回全部分区及各分区耗时（并发与顺序两种查询方式）"""
+    monkeypatch.setattr(user_api, "_concurrent_reads", lambda db: concurrent)
+    response = client.get(f"/users/{user_id}/dashboard")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert set(data) == ALL_SECTIONS | {"timings"}
+    assert set(data["timings"]) == ALL_SECTIONS
+    assert data["user"]["id"] == user_id
+    assert data["stat"]["total_taps"] == 108
+    assert data["sessions"][0]["tap_count"] == 108
+    assert data["achievements"] == []
+    assert data["share_tasks"] == []
+
+
+def test_dashboard_selected_fields(user_id):
+    """fields 只返回选中的分区"""
+    data = client.get(f"/users/{user_id}/dashboard", params={"fields": "stat,sessions"}).json()
+    assert set(data) == {"stat", "sessions", "timings"}
+    assert set(data["timings"]) == {"stat", "sessions"}
+
+
+def test_dashboard_unknown_field(user_id):
+    """未知分区返回400"""
+    response = client.get(f"/users/{user_id}/dashboard", params={"fields": "stat,friends"})
+    assert response.status_code == 400
+
+
+def test_dashboard_missing_user():
+    """用户不存在返回404"""
+    assert client.get("/users/99999/dashboard").status_code == 404
+
+
+def test_dashboard_conditional_get(user_id):
+    """首页聚合同样支持 ETag 条件请求"""
+    etag = client.get(f"/users/{user_id}/dashboard").headers["etag"]
+    assert client.get(f"/users/{user_id}/dashboard", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,123 @@
+"""
+关注关系与好友排行榜测试
+
+- 关注/取消关注，关注列表和粉丝列表分别读主键和反向索引
+- 好友排行榜包含本人和关注的用户，按全站名次取前 limit 名，与查询路径结果一致
+- 关注列表按用户缓存，本进程或其他工作进程关注/取消关注后失效
+- 排行榜未变化时刷新快照沿用分数缓存
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from main import app
+from database import SessionLocal
+import config
+import coordination
+import crud
+import models
+import snapshots
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def users():
+    """6个用户，在 friends 周期中的名次为 6 - 序号（最后一个用户没有名次）"""
+    db = SessionLocal()
+    created = [models.User(username=f"好友测试{i}", phone=f"1370000010{i}") for i in range(6)]
+    db.add_all(created)
+    db.commit()
+    ids = [user.id for user in created]
+    db.add_all([models.Leaderboard(user_id=user_id, period="friends", rank=6 - i, tap_count=100 * i)
+                for i, user_id in enumerate(ids[:5])])
+    db.commit()
+    yield ids
+    db.close()
+
+
+def test_follow_and_lists(users):
+    """重复关注幂等，不能关注自己或不存在的用户；粉丝列表读反向索引"""
+    me = users[0]
+    for followee in users[1:4]:
+        assert client.post(f"/users/{me}/following/{followee}").json()["user_id"] == followee
+    assert client.post(f"/users/{me}/following/{users[1]}").status_code == 200
+    assert client.post(f"/users/{me}/following/{me}").status_code == 400
+    assert client.post(f"/users/{me}/following/999999").status_code == 404
+    assert client.post(f"/users/999999/following/{me}").status_code == 404
+    client.post(f"/users/{users[2]}/following/{users[1]}")
+
+    assert [row["user_id"] for row in client.get(f"/users/{me}/following").json()] == users[1:4]
+    assert [row["user_id"] for row in client.get(f"/users/{me}/following?limit=1&offset=1").json()] == [users[2]]
+    assert [row["user_id"] for row in client.get(f"/users/{users[1]}/followers").json()] == [me, users[2]]
+
+    assert client.delete(f"/users/{me}/following/{users[1]}").status_code == 204
+    assert client.delete(f"/users/{me}/following/{users[1]}").status_code == 404
+    assert [row["user_id"] for row in client.get(f"/users/{me}/followers").json()] == []
+    assert [row["user_id"] for row in client.get(f"/users/{users[1]}/followers").json()] == [users[2]]
+
+    db = SessionLocal()
+    plan = " ".join(row[3] for row in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT follower_id FROM follows WHERE followee_id = 1 ORDER BY follower_id")))
+    assert "ix_follows_followee_follower" in plan and "TEMP B-TREE" not in plan
+    db.close()
+
+
+def test_friends_leaderboard(users, monkeypatch):
+    """本人和关注的用户按全站名次排列，没有名次的用户不出现；关闭快照时结果相同"""
+    me = users[0]
+    for followee in (users[1], users[3], users[4], users[5]):
+        client.post(f"/users/{me}/following/{followee}")
+
+    response = client.get(f"/leaderboard/friends/friends/{me}")
+    assert response.status_code == 200 and "Age" in response.headers
+    board = response.json()
+    assert [(row["rank"], row["user_id"], row["global_rank"]) for row in board] == [
+        (1, users[4], 2), (2, users[3], 3), (3, users[1], 5), (4, me, 6)]
+    assert board[0]["tap_count"] == 400
+    limited = client.get(f"/leaderboard/friends/friends/{me}?limit=2").json()
+    assert limited == board[:2]
+    assert client.get(f"/leaderboard/missing/friends/{me}").json() == []
+
+    monkeypatch.setattr(config, "LEADERBOARD_REFRESH_SECONDS", 0)
+    assert client.get(f"/leaderboard/friends/friends/{me}").json() == board
+    assert client.get(f"/leaderboard/friends/friends/{me}?limit=2").json() == limited
+
+
+def test_followee_cache(users):
+    """缓存命中时不读关注表；关注/取消关注和其他工作进程的通知使缓存失效"""
+    me = users[0]
+    client.post(f"/users/{me}/following/{users[1]}")
+    friends = lambda: [row["user_id"] for row in client.get(f"/leaderboard/friends/friends/{me}").json()]
+    assert friends() == [users[1], me]
+
+    # 绕过 crud 写入的关注关系在缓存失效前不可见
+    db = SessionLocal()
+    db.add(models.Follow(follower_id=me, followee_id=users[3]))
+    db.commit()
+    assert friends() == [users[1], me]
+
+    coordination._dispatch(crud.FOLLOWEES_CHANNEL, {"user_id": me})
+    assert friends() == [users[3], users[1], me]
+
+    client.post(f"/users/{me}/following/{users[4]}")
+    assert friends() == [users[4], users[3], users[1], me]
+    client.delete(f"/users/{me}/following/{users[3]}")
+    assert friends() == [users[4], users[1], me]
+    db.close()
+
+
+def test_ranking_reused_until_board_changes(users):
+    """刷新时排行榜未变化的周期沿用分数缓存，名次变化后重新读取"""
+    first = snapshots.refresh().rankings["friends"]
+    assert snapshots.refresh().rankings["friends"] is first
+
+    db = SessionLocal()
+    db.query(models.Leaderboard).filter(models.Leaderboard.period == "friends",
+                                        models.Leaderboard.user_id == users[0]).update({"rank": 7})
+    db.commit()
+    db.close()
+    reloaded = snapshots.refresh().rankings["friends"]
+    assert reloaded is not first
+    assert reloaded.top([users[0], users[1]], 10) == [(1, users[1], 5, 100), (2, users[0], 7, 0)]
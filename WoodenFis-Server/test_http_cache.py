@@ -0,0 +1,120 @@
+"""
+HTTP条件请求缓存测试
+
+- 读接口返回弱 ETag / Last-Modified
+- 数据未变化时条件请求返回304且不读数据库
+- 通过 crud 写入后 ETag 变化，Last-Modified 为写入时的墙上时间
+- 进程外批处理提交后，工作进程读取到新的批处理代数，旧 ETag 和 If-Modified-Since 不再命中
+"""
+
+import time
+from email.utils import parsedate_to_datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from main import app
+from database import SessionLocal
+import batches
+import crud
+import migrations
+import schemas
+import versions
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def user_id():
+    """创建带统计记录的测试用户"""
+    db = SessionLocal()
+    user = crud.create_user_by_phone(db, schemas.UserCreateByPhone(username="缓存测试用户", phone="13700000002"))
+    crud.create_user_stat(db, user.id)
+    yield user.id
+    db.close()
+
+
+@pytest.mark.parametrize("path", [
+    "/users/{user_id}",
+    "/stats/{user_id}",
+    "/meditation/{user_id}/sessions",
+    "/achievements/{user_id}/user",
+    "/share/{user_id}/user",
+])
+def test_conditional_get_returns_304(user_id, path):
+    """相同 ETag 的条件请求返回304"""
+    url = path.format(user_id=user_id)
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["last-modified"]
+
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert second.content == b""
+
+
+def test_not_modified_skips_database(user_id, monkeypatch):
+    """命中304时不调用 crud 查询"""
+    etag = client.get(f"/stats/{user_id}").headers["etag"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("条件请求命中时不应读取数据库")
+
+    monkeypatch.setattr(crud, "get_user_stat", fail)
+    assert client.get(f"/stats/{user_id}", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_write_changes_etag(user_id):
+    """写入冥想会话后旧 ETag 失效"""
+    etag = client.get(f"/meditation/{user_id}/sessions").headers["etag"]
+    client.post(f"/meditation/{user_id}/sessions", json={"duration": 60, "tap_count": 10})
+
+    response = client.get(f"/meditation/{user_id}/sessions", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 1
+
+
+def test_if_modified_since(user_id):
+    """If-Modified-Since 不早于最后修改时间时返回304"""
+    last_modified = client.get(f"/users/{user_id}").headers["last-modified"]
+    assert client.get(f"/users/{user_id}", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/users/{user_id}", headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+
+
+def test_rapid_writes_keep_wall_clock(user_id):
+    """同一秒内多次写入：ETag 各不相同，Last-Modified 不超前于当前时间"""
+    etags = set()
+    for _ in range(5):
+        versions.bump(user_id)
+        response = client.get(f"/users/{user_id}")
+        etags.add(response.headers["etag"])
+        assert parsedate_to_datetime(response.headers["last-modified"]).timestamp() <= time.time()
+    assert len(etags) == 5
+
+
+def test_batch_generation_invalidates(user_id, tmp_path):
+    """批处理任务提交一批后，轮询到新代数的工作进程不再对旧 ETag / Last-Modified 返回304"""
+    jobs = create_engine(f"sqlite:///{tmp_path}/jobs.db")
+    migrations.upgrade(jobs)
+    first = client.get(f"/stats/{user_id}")
+    assert batches.refresh(jobs) == (0, 0)
+    assert client.get(f"/stats/{user_id}", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    with jobs.begin() as conn:
+        batches.bump(conn, "rollover")
+        batches.bump(conn, "rollover")
+        batches.bump(conn, "streaks")
+    generation, modified = batches.refresh(jobs)
+    jobs.dispose()
+    assert generation == 3 and modified >= parsedate_to_datetime(first.headers["last-modified"]).timestamp()
+
+    response = client.get(f"/stats/{user_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 200 and response.headers["etag"].endswith('-b3"')
+    assert client.get(f"/stats/{user_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    versions.bump(user_id)
+    assert client.get(f"/stats/{user_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 200
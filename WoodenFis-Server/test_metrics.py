@@ -0,0 +1,54 @@
+"""
+请求与SQL指标测试
+
+验证 /metrics 输出 Prometheus 文本格式，并按路由记录请求数、延迟和SQL查询数
+"""
+
+import re
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from main import app
+import metrics
+
+client = TestClient(app)
+
+SAMPLE_LINE = re.compile(r'^[a-z_]+(\{([a-z_]+="(?:[^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$')
+
+
+def test_metrics_exposition_format():
+    """每行要么是注释，要么是 `名称{标签} 数值`"""
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for line in response.text.strip().splitlines():
+        assert line.startswith("# ") or SAMPLE_LINE.match(line), line
+
+
+@pytest.mark.no_transaction
+def test_request_and_query_metrics_per_route():
+    """请求按路由模板计数，并记录该请求执行的SQL"""
+    labels = ("GET", "/stats/{user_id}", 404)
+    before = metrics.HTTP_REQUESTS.value(labels)
+    queries_before = metrics.DB_QUERIES.value()
+    pool_waits_before = metrics.DB_POOL_WAIT.count()
+
+    assert client.get("/stats/99999").status_code == 404
+
+    assert metrics.HTTP_REQUESTS.value(labels) == before + 1
+    assert metrics.HTTP_LATENCY.count(("GET", "/stats/{user_id}")) >= 1
+    assert metrics.DB_QUERIES.value() > queries_before
+    assert metrics.DB_POOL_WAIT.count() > pool_waits_before
+
+    text = client.get("/metrics").text
+    assert 'woodenfis_http_request_db_queries_count{route="/stats/{user_id}"}' in text
+    assert "woodenfis_http_requests_in_flight 1" in text
+
+
+def test_unmatched_route_label():
+    """未匹配路由的请求不按原始路径打标签"""
+    client.get("/no/such/path/123")
+    assert metrics.HTTP_REQUESTS.value(("GET", metrics.UNMATCHED_ROUTE, 404)) >= 1
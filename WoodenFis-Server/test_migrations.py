@@ -0,0 +1,109 @@
+"""
+数据库迁移测试
+
+- 从空库迁移得到的表结构与 models 一致
+- 版本已是最新时启动只查询一次版本号
+- 引入迁移前建的旧库可以直接升级
+- 步骤失败时整体回滚
+- 分批回填可中断后继续
+"""
+
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from database import Base
+import migrations
+import models  # noqa: F401
+
+
+def schema_of(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE name NOT IN (?, 'sqlite_sequence') ORDER BY name",
+        (migrations.VERSION_TABLE,)).fetchall()
+    conn.close()
+    return rows
+
+
+def test_migrated_schema_matches_models(tmp_path):
+    """迁移出的表和索引与 create_all 逐条一致"""
+    migrated = create_engine(f"sqlite:///{tmp_path}/migrated.db")
+    assert migrations.upgrade(migrated) == [step.version for step in migrations.MIGRATIONS]
+    reference = create_engine(f"sqlite:///{tmp_path}/reference.db")
+    Base.metadata.create_all(reference)
+
+    assert schema_of(tmp_path / "migrated.db") == schema_of(tmp_path / "reference.db")
+    assert migrations.current_version(migrated) == migrations.head()
+
+
+def test_ensure_current_is_single_query(tmp_path):
+    """已是最新版本时不做表结构检查"""
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    migrations.upgrade(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    assert migrations.ensure_current(engine) == []
+    assert len(statements) == 1 and migrations.VERSION_TABLE in statements[0]
+
+
+def test_upgrade_legacy_database(tmp_path):
+    """没有版本表、users 缺少 phone 字段的旧库升级后保留数据"""
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, email VARCHAR, "
+                 "hashed_password VARCHAR, avatar VARCHAR, is_vip BOOLEAN, vip_expire_date DATETIME, "
+                 "merit_points INTEGER, created_at DATETIME)")
+    conn.execute("INSERT INTO users (id, username) VALUES (1, '老用户')")
+    conn.commit()
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    assert migrations.current_version(engine) is None
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT username, phone FROM users")).one() == ("老用户", None)
+        indexes = {row[1] for row in conn.execute(text("PRAGMA index_list(users)"))}
+    assert "ix_users_phone" in indexes
+    assert migrations.current_version(engine) == migrations.head()
+
+
+def test_failed_step_rolls_back(tmp_path, monkeypatch):
+    """步骤中途失败时已执行的DDL和版本记录一起回滚"""
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    migrations.upgrade(engine)
+
+    def broken(conn):
+        conn.execute(text("CREATE TABLE half_done (id INTEGER)"))
+        raise RuntimeError("boom")
+
+    version = migrations.head() + 1
+    monkeypatch.setattr(migrations, "MIGRATIONS",
+                        migrations.MIGRATIONS + [migrations.Migration(version, "失败的步骤", broken, True)])
+    with pytest.raises(RuntimeError):
+        migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'half_done'")).first() is None
+    assert migrations.current_version(engine) == version - 1
+
+
+def test_backfill_in_batches(tmp_path):
+    """按主键区间分批更新，重跑只处理剩余行"""
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER, doubled INTEGER)"))
+        conn.execute(text("INSERT INTO items (id, value) VALUES (:id, :id)"), [{"id": i} for i in range(1, 26)])
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+
+    assert migrations.backfill(engine, "items", "doubled = value * :factor", "doubled IS NULL AND id <= 12",
+                               batch_size=10, params={"factor": 2}) == 12
+    assert len(commits) == 3
+    assert migrations.backfill(engine, "items", "doubled = value * 2", "doubled IS NULL", batch_size=10) == 13
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM items WHERE doubled = value * 2")).scalar() == 25
@@ -0,0 +1,102 @@
+"""
+按月分区测试（SQLite 每月一张表）
+
+- 写入按月份路由，按用户查询合并各分区和父表中的历史数据，取够条数后不再查询更早的分区
+- 历史数据分批搬进月份分区后查询结果不变
+- 归档为 Parquet 后分区从库中删除，热查询不再访问
+- 创建分区的事务回滚后，下次写入补上登记
+"""
+
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import event, insert, inspect, text
+from sqlalchemy.orm import Session
+
+import models
+import partitions
+
+
+@pytest.fixture
+def sessions():
+    # 独立实例，分区缓存不与应用共用
+    return partitions.MonthlyPartitions(models.MeditationSession.__table__)
+
+
+def add(db, sessions, user_id, moment, taps):
+    return sessions.insert(db, {"user_id": user_id, "duration": 60, "tap_count": taps, "created_at": moment})
+
+
+def test_routing_and_latest(engine, sessions):
+    """各月写入不同的表，ID按月份区间分配；查询按时间倒序合并父表和各分区"""
+    with engine.begin() as conn:
+        conn.execute(insert(models.MeditationSession.__table__),
+                     [{"user_id": 1, "duration": 60, "tap_count": 1, "created_at": datetime(2026, 7, 3)}])
+    with Session(engine) as db:
+        first = add(db, sessions, 1, datetime(2026, 9, 1), 2)
+        add(db, sessions, 1, datetime(2026, 10, 2), 3)
+        add(db, sessions, 2, datetime(2026, 10, 5), 4)
+        db.commit()
+
+        assert first == 202609 * partitions.ID_STRIDE + 1
+        assert sessions.months(db) == ["2026-09", "2026-10"]
+        assert [row.tap_count for row in sessions.latest(db, 1, 10, entity=models.MeditationSession)] == [3, 2, 1]
+        assert sessions.latest(db, 1, 2, columns=["tap_count"]) == [(3,), (2,)]
+
+        # 最新的月份已够 limit 条时只查询这一张表
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        assert sessions.latest(db, 1, 1, columns=["tap_count"]) == [(3,)]
+        assert len(statements) == 1 and "meditation_sessions_202610" in statements[0]
+    assert {"meditation_sessions_202609", "meditation_sessions_202610"} <= set(inspect(engine).get_table_names())
+
+
+def test_split_default(engine, sessions):
+    """父表中的历史数据按月搬进分区，保留原ID"""
+    with engine.begin() as conn:
+        conn.execute(insert(models.MeditationSession.__table__), [
+            {"user_id": 1, "duration": 60, "tap_count": day, "created_at": datetime(2026, 8 + day % 2, day)}
+            for day in range(1, 8)])
+    with Session(engine) as db:
+        before = sessions.latest(db, 1, 10, columns=["id", "tap_count"])
+
+    assert sessions.split_default(engine, batch_size=3) == 7
+    assert sessions.split_default(engine) == 0
+    with Session(engine) as db:
+        assert sessions.latest(db, 1, 10, columns=["id", "tap_count"]) == before
+        assert sessions.months(db) == ["2026-08", "2026-09"]
+        assert db.execute(text("SELECT COUNT(*) FROM meditation_sessions")).scalar() == 0
+
+
+def test_archive(engine, sessions, tmp_path):
+    """归档分区写成 Parquet 并删除表，查询只剩仍在库中的月份"""
+    with Session(engine) as db:
+        for day in range(1, 4):
+            add(db, sessions, 1, datetime(2026, 8, day), day)
+        add(db, sessions, 1, datetime(2026, 10, 1), 10)
+        db.commit()
+
+    path = sessions.archive(engine, "2026-08", str(tmp_path / "archive"))
+    table = pq.read_table(path)
+    assert table.num_rows == 3 and sorted(table.column("tap_count").to_pylist()) == [1, 2, 3]
+
+    assert "meditation_sessions_202608" not in inspect(engine).get_table_names()
+    with Session(engine) as db:
+        assert sessions.latest(db, 1, 10, columns=["tap_count"]) == [(10,)]
+    status = {row["month"]: row for row in sessions.status(engine)}
+    assert status["2026-08"]["state"] == "archived" and status["2026-08"]["row_count"] == 3
+
+
+def test_rolled_back_partition(engine, sessions):
+    """创建分区的事务回滚后分区未登记，下次写入补上登记，提交后查询能看到"""
+    with Session(engine) as db:
+        add(db, sessions, 1, datetime(2026, 10, 1), 1)
+        db.rollback()
+        assert sessions.months(db, refresh=True) == []
+
+    with Session(engine) as db:
+        add(db, sessions, 1, datetime(2026, 10, 2), 2)
+        db.commit()
+        assert sessions.months(db) == ["2026-10"]
+        assert sessions.latest(db, 1, 10, columns=["tap_count"]) == [(2,)]
@@ -0,0 +1,73 @@
+"""
+采样剖析接口测试
+"""
+
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+import config
+import profiler
+
+client = TestClient(app)
+
+ADMIN = {"X-Admin-Token": "test-admin-token"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", ADMIN["X-Admin-Token"])
+    monkeypatch.setattr(config, "PROFILE_INTERVAL_MS", 1)
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_returns_collapsed_stacks():
+    """返回 `栈;栈 次数` 格式的折叠栈"""
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    try:
+        response = client.get("/debug/profile", params={"seconds": 0.2}, headers=ADMIN)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 200
+    assert int(response.headers["x-profile-samples"]) > 0
+    lines = response.text.strip().splitlines()
+    assert any("busy_loop" in line for line in lines)
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and stack
+
+
+def test_profile_route_filter():
+    """按路由过滤时只保留经过该接口函数的调用栈"""
+    response = client.get("/debug/profile", params={"seconds": 0.1, "route": "/stats/*"}, headers=ADMIN)
+    assert response.status_code == 200
+    for line in response.text.strip().splitlines():
+        assert "get_user_stat" in line
+
+    response = client.get("/debug/profile", params={"seconds": 0.1, "route": "/nothing/*"}, headers=ADMIN)
+    assert response.status_code == 400
+
+
+def test_only_one_capture_at_a_time():
+    """已有采集进行时返回409"""
+    sampler = profiler.SamplingProfiler(0.01).start()
+    try:
+        response = client.get("/debug/profile", params={"seconds": 0.1}, headers=ADMIN)
+        assert response.status_code == 409
+    finally:
+        sampler.stop()
+    assert client.get("/debug/profile", params={"seconds": 0.05}, headers=ADMIN).status_code == 200
+
+
+def test_profile_requires_admin():
+    assert client.get("/debug/profile", params={"seconds": 0.1}).status_code == 403
@@ -0,0 +1,111 @@
+"""
+限流与过载保护测试
+
+- 按方法和路径分出路由类别和路径中的用户ID，运维接口不限流
+- 验证码接口按IP限流、敲击上报按用户限流，超出时返回429和 Retry-After，不影响其他用户和类别
+- 已补满的令牌桶被清理，桶数超出上限时只保留最近活跃的
+- 并发上限随延迟收缩和增长，满载时先拒绝低优先级的排行榜读取（503），敲击上报不受影响
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+import config
+import limits
+import models
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT", True)
+    monkeypatch.setattr(config, "RATE_LIMITS_IP", "auth=0.01/2")
+    monkeypatch.setattr(config, "RATE_LIMITS_USER", "tap=0.01/2")
+    limits.reset()
+    yield
+    limits.reset()
+
+
+def test_classify():
+    assert limits.classify("POST", "/users/send-code") == ("auth", None)
+    assert limits.classify("POST", "/meditation/42/sessions") == ("tap", 42)
+    assert limits.classify("GET", "/meditation/42/sessions") == ("default", 42)
+    assert limits.classify("GET", "/leaderboard/daily") == ("catalog", None)
+    assert limits.classify("GET", "/leaderboard/daily/friends/7") == ("catalog", 7)
+    assert limits.classify("GET", "/achievements/") == ("catalog", None)
+    assert limits.classify("POST", "/temples/3/members/9") == ("default", 9)
+    assert limits.classify("GET", "/metrics") == (None, None)
+
+
+def test_rate_limits(limited, db):
+    """同一IP第三次发送验证码被拒绝；同一用户第三次上报被拒绝，其他用户和目录接口不受影响"""
+    for _ in range(2):
+        assert client.post("/users/send-code", json={"phone": "13700000301"}).status_code == 200
+    response = client.post("/users/send-code", json={"phone": "13700000302"})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+
+    users = [models.User(username=f"限流测试{i}", phone=f"1370000031{i}") for i in range(2)]
+    db.add_all(users)
+    db.commit()
+    session = {"duration": 60, "tap_count": 1}
+    for _ in range(2):
+        assert client.post(f"/meditation/{users[0].id}/sessions", json=session).status_code == 200
+    assert client.post(f"/meditation/{users[0].id}/sessions", json=session).status_code == 429
+    assert client.post(f"/meditation/{users[1].id}/sessions", json=session).status_code == 200
+    assert client.get("/achievements/").status_code == 200
+    assert client.get("/metrics").status_code == 200
+
+
+def test_bucket_eviction():
+    buckets = limits.TokenBuckets(max_keys=4)
+    rate = (1.0, 2.0)
+    assert buckets.take([(("tap", "user", 1), rate)], now=0) == 0
+    for _ in range(2):
+        assert buckets.take([(("tap", "user", 2), rate)], now=0) == 0
+    assert buckets.take([(("tap", "user", 2), rate)], now=0) == pytest.approx(1.0)
+    buckets.evict(now=1.5)
+    assert len(buckets) == 1
+    for user_id in range(10, 16):
+        buckets.take([(("tap", "user", user_id), rate)], now=2 + user_id)
+    assert len(buckets) <= 4
+    assert buckets.take([(("tap", "user", 15), rate)], now=17.5) == 0
+
+
+def test_adaptive_limit():
+    limit = limits.ConcurrencyLimit(initial=10, minimum=2, maximum=20, tolerance=2)
+    for step in range(20):
+        limit.record("catalog", 0.01, now=step)
+    assert limit.limit == 10
+    for step in range(20, 40):
+        limit.record("catalog", 0.5, now=step)
+    assert limit.limit == 10  # 并发远低于上限时变慢不收缩
+    limit.in_flight = 8
+    for step in range(40, 60):
+        limit.record("catalog", 0.5, now=step)
+    assert limit.limit < 10
+    shrunk = limit.limit
+    limit.in_flight = 20
+    for step in range(60, 200):
+        limit.record("tap", 0.01, now=step)
+    assert limit.limit > shrunk
+
+    limit = limits.ConcurrencyLimit(initial=10, minimum=2, maximum=20, tolerance=2)
+    limit.in_flight = 6
+    assert not limit.admit(limits.LOW)
+    assert limit.admit(limits.NORMAL) and limit.admit(limits.HIGH)
+
+
+def test_sheds_low_priority_first(db, monkeypatch):
+    monkeypatch.setattr(config, "LOAD_SHEDDING", True)
+    monkeypatch.setattr(limits, "concurrency", limits.ConcurrencyLimit(4, 4, 4, 2))
+    limits.concurrency.in_flight = 2
+    response = client.get("/leaderboard/daily")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+
+    user = models.User(username="过载测试", phone="13700000320")
+    db.add(user)
+    db.commit()
+    assert client.post(f"/meditation/{user.id}/sessions", json={"duration": 60, "tap_count": 1}).status_code == 200
+    assert limits.concurrency.in_flight == 2
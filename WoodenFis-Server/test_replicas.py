@@ -0,0 +1,123 @@
+"""
+只读副本路由测试
+
+副本用 SQLite 在线备份复制出的文件代替，复制之后主库的写入不会出现在副本中：
+- 用户刚写入后读自己的数据走主库，超过 READ_YOUR_WRITES_SECONDS 后回到副本
+- 写请求下发的写入 Cookie 使该客户端读主库，即使本进程的版本号还不知道这次写入（如写入由其他进程处理）
+- 不保存 Cookie 的客户端在请求头中带回写入标记，同样读主库
+- 批处理任务刚提交过时按用户读请求走主库，响应体与含新批处理代数的 ETag 一致
+- 不区分用户的读会话轮流使用各副本
+"""
+
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import batches
+import config
+import database
+import versions
+from main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    urls = [f"sqlite:///{tmp_path}/replica{i}.db" for i in range(2)]
+    for url in urls:
+        database.copy_sqlite(str(database.engine.url), url)
+    database.configure_replicas(urls)
+    yield database.replica_engines
+    database.configure_replicas([])
+
+
+@pytest.mark.no_transaction
+def test_read_your_writes(replicas, monkeypatch):
+    """副本复制之后注册的用户：刚写入时读主库能查到，超出窗口后读副本查不到"""
+    app.dependency_overrides.clear()
+    suffix = uuid.uuid4().hex
+    response = client.post("/users/register", json={"username": f"replica-{suffix}", "phone": suffix[:11]})
+    user_id = response.json()["id"]
+
+    assert database.WROTE_COOKIE in response.headers["set-cookie"]
+    assert client.get(f"/users/{user_id}").status_code == 200
+    assert client.get(f"/users/{user_id}/dashboard").status_code == 200
+
+    # 最后一次写入已在窗口之外（Cookie 也已过期）
+    client.cookies.clear()
+    version, _ = versions.get(user_id)
+    monkeypatch.setitem(versions._versions, user_id,
+                        (version, int(time.time() - config.READ_YOUR_WRITES_SECONDS) - 1))
+    assert client.get(f"/users/{user_id}").status_code == 404
+    assert client.get(f"/users/{user_id}/dashboard").status_code == 404
+
+
+@pytest.mark.no_transaction
+def test_write_cookie(replicas, monkeypatch):
+    """本进程不知道的写入：带回写入 Cookie 的客户端读主库，其他客户端读副本"""
+    app.dependency_overrides.clear()
+    writer = TestClient(app)
+    suffix = uuid.uuid4().hex
+    user_id = writer.post("/users/register", json={"username": f"cookie-{suffix}", "phone": suffix[:11]}).json()["id"]
+    monkeypatch.delitem(versions._versions, user_id)
+
+    assert writer.get(f"/users/{user_id}").status_code == 200
+    assert TestClient(app).get(f"/users/{user_id}").status_code == 404
+    # 读请求和失败的写请求不下发 Cookie
+    assert "set-cookie" not in writer.get(f"/users/{user_id}").headers
+    assert "set-cookie" not in writer.post("/users/register", json={}).headers
+
+    writer.cookies.set(database.WROTE_COOKIE, str(time.time() - config.READ_YOUR_WRITES_SECONDS - 1))
+    assert writer.get(f"/users/{user_id}").status_code == 404
+
+
+@pytest.mark.no_transaction
+def test_write_header_without_cookies(replicas, monkeypatch):
+    """不保存 Cookie 的客户端（如 Flutter 的 package:http）：带回响应头中的写入标记时读主库"""
+    app.dependency_overrides.clear()
+    suffix = uuid.uuid4().hex
+    response = client.post("/users/register", json={"username": f"header-{suffix}", "phone": suffix[:11]})
+    client.cookies.clear()
+    user_id = response.json()["id"]
+    marker = response.headers[database.WROTE_HEADER]
+    monkeypatch.delitem(versions._versions, user_id)
+
+    assert client.get(f"/users/{user_id}").status_code == 404
+    assert client.get(f"/users/{user_id}", headers={database.WROTE_HEADER: marker}).status_code == 200
+    assert database.WROTE_HEADER not in client.get(f"/users/{user_id}").headers
+
+    expired = str(time.time() - config.READ_YOUR_WRITES_SECONDS - 1)
+    assert client.get(f"/users/{user_id}", headers={database.WROTE_HEADER: expired}).status_code == 404
+
+
+@pytest.mark.no_transaction
+def test_recent_batch_reads_primary(replicas, monkeypatch):
+    """批处理提交后副本可能尚未应用：窗口内读主库，超出窗口后回到副本"""
+    app.dependency_overrides.clear()
+    suffix = uuid.uuid4().hex
+    user_id = client.post("/users/register", json={"username": f"batch-{suffix}", "phone": suffix[:11]}).json()["id"]
+    client.cookies.clear()
+    monkeypatch.delitem(versions._versions, user_id)
+
+    monkeypatch.setattr(batches, "_state", (1, int(time.time())))
+    response = client.get(f"/users/{user_id}")
+    assert response.status_code == 200
+    assert response.headers["ETag"].endswith('-b1"')
+
+    monkeypatch.setattr(batches, "_state", (1, int(time.time() - config.READ_YOUR_WRITES_SECONDS) - 1))
+    assert client.get(f"/users/{user_id}").status_code == 404
+
+
+@pytest.mark.no_transaction
+def test_read_sessions_rotate_replicas(replicas):
+    """只读会话在副本之间轮流分配，写会话始终在主库"""
+    binds = set()
+    for _ in range(4):
+        session = database.ReadSession()
+        binds.add(session.get_bind())
+        session.close()
+    assert binds == set(replicas)
+    assert database.SessionLocal().get_bind() is database.engine
@@ -0,0 +1,112 @@
+"""
+日切测试
+
+- 各时区在各自零点后日切，今日敲击数写入前一天的历史并清零
+- 已完成当天日切的时区跳过；中断后从进度继续，不重复归档
+- 批次边界和待处理时区只扫描今日有敲击行的部分索引
+- 只清零本批锁定（已归档）的行；每批递增批处理代数
+"""
+
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import insert, select, text
+
+import batches
+import models
+import rollover
+
+LOS_ANGELES = "America/Los_Angeles"
+
+
+@pytest.fixture
+def engine(engine):
+    """在 conftest 的迁移后数据库中写入各时区用户的统计"""
+    with engine.begin() as conn:
+        conn.execute(insert(models.UserStat.__table__), [
+            {"user_id": 1, "today_taps": 10, "total_taps": 10, "timezone": None},
+            {"user_id": 2, "today_taps": 0, "total_taps": 5, "timezone": None},
+            {"user_id": 3, "today_taps": 7, "total_taps": 7, "timezone": None},
+            {"user_id": 4, "today_taps": 3, "total_taps": 3, "timezone": LOS_ANGELES},
+        ])
+    return engine
+
+
+def history(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(models.UserDailyTaps.user_id, models.UserDailyTaps.day, models.UserDailyTaps.taps)
+                            .order_by(models.UserDailyTaps.user_id)).all()
+
+
+def today_taps(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(models.UserStat.user_id, models.UserStat.today_taps)).all())
+
+
+def test_per_timezone_boundaries(engine):
+    """UTC 17:00 时上海已过零点、洛杉矶未过；洛杉矶零点后再日切"""
+    with engine.begin() as conn:
+        conn.execute(insert(models.DayRollover.__table__).values(
+            timezone=LOS_ANGELES, day=date(2026, 10, 18), last_user_id=4, finished_at=datetime(2026, 10, 19, 8)))
+
+    assert rollover.rollover(engine, now=datetime(2026, 10, 19, 17)) == {"": 2, LOS_ANGELES: 0}
+    assert history(engine) == [(1, date(2026, 10, 19), 10), (3, date(2026, 10, 19), 7)]
+    assert today_taps(engine) == {1: 0, 2: 0, 3: 0, 4: 3}
+    assert rollover.rollover(engine, now=datetime(2026, 10, 19, 18)) == {LOS_ANGELES: 0}
+
+    assert rollover.rollover(engine, now=datetime(2026, 10, 20, 8)) == {LOS_ANGELES: 1}
+    assert history(engine)[-1] == (4, date(2026, 10, 19), 3)
+    # 两个时区各提交一批
+    assert batches.refresh(engine)[0] == 2
+
+
+def test_resume_after_interruption(engine, monkeypatch):
+    """第二批失败后重跑，从已提交的进度继续"""
+    archive = rollover._archive
+    calls = []
+
+    def failing(conn, day, rows):
+        calls.append(day)
+        if len(calls) == 2:
+            raise RuntimeError("中断")
+        return archive(conn, day, rows)
+
+    monkeypatch.setattr(rollover, "_archive", failing)
+    with pytest.raises(RuntimeError):
+        rollover.rollover_timezone(engine, None, date(2026, 10, 19), batch_size=1)
+    assert today_taps(engine) == {1: 0, 2: 0, 3: 7, 4: 3}
+    with engine.connect() as conn:
+        assert conn.execute(select(models.DayRollover.last_user_id, models.DayRollover.finished_at)).one() == (1, None)
+
+    assert rollover.rollover_timezone(engine, None, date(2026, 10, 19), batch_size=1) == 1
+    assert history(engine) == [(1, date(2026, 10, 19), 10), (3, date(2026, 10, 19), 7)]
+    assert rollover.rollover_timezone(engine, None, date(2026, 10, 19)) == 0
+
+
+def test_only_locked_rows_are_cleared(engine, monkeypatch):
+    """锁定本批之后才有敲击的行（模拟 READ COMMITTED 下归档与清零之间提交的敲击）不会被清零"""
+    archive = rollover._archive
+
+    def tap_between(conn, day, rows):
+        statement = archive(conn, day, rows)
+        conn.execute(models.UserStat.__table__.update().where(models.UserStat.user_id == 2).values(today_taps=4))
+        return statement
+
+    monkeypatch.setattr(rollover, "_archive", tap_between)
+    assert rollover.rollover_timezone(engine, None, date(2026, 10, 19)) == 2
+    assert history(engine) == [(1, date(2026, 10, 19), 10), (3, date(2026, 10, 19), 7)]
+    assert today_taps(engine)[2] == 4
+
+
+def test_uses_partial_index(engine):
+    """待处理时区和批次边界只扫描部分索引"""
+    stats = models.UserStat.__table__
+    with engine.connect() as conn:
+        for statement in (
+            select(stats.c.timezone).where(stats.c.today_taps > 0).distinct(),
+            select(stats.c.user_id).where(stats.c.timezone.is_(None), stats.c.today_taps > 0, stats.c.user_id > 0)
+            .order_by(stats.c.user_id).offset(99).limit(1),
+        ):
+            compiled = statement.compile(conn, compile_kwargs={"literal_binds": True})
+            plan = " ".join(row[3] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+            assert "ix_user_stats_rollover" in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,59 @@
+"""
+读接口快速序列化测试
+
+验证开启 FAST_JSON 后，列投影 + 预编译序列化器的输出与默认路径一致
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal
+import config
+import models
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def seeded():
+    """写入排行榜、成就、分享任务和冥想会话数据"""
+    db = SessionLocal()
+    user = models.User(username="序列化测试用户", phone="13700000001")
+    db.add(user)
+    db.commit()
+    rows = [
+        models.Leaderboard(user_id=user.id, period="fastjson", rank=i, tap_count=100 - i)
+        for i in range(1, 6)
+    ]
+    rows += [models.MeditationSession(user_id=user.id, duration=60 * i, tap_count=108) for i in range(3)]
+    rows.append(models.Achievement(name="初心", description="第一次敲木鱼", icon="star"))
+    rows.append(models.ShareTask(title="分享功德", description="分享到朋友圈", merit=10, icon="share"))
+    db.add_all(rows)
+    db.commit()
+    yield user.id
+    for row in rows:
+        db.delete(row)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+@pytest.mark.parametrize("path", [
+    "/leaderboard/fastjson",
+    "/meditation/{user_id}/sessions",
+    "/achievements/",
+    "/share/tasks",
+])
+def test_fast_path_matches_default(seeded, monkeypatch, path):
+    """快速路径与默认路径返回相同的JSON"""
+    url = path.format(user_id=seeded)
+    monkeypatch.setattr(config, "FAST_JSON", False)
+    expected = client.get(url)
+    monkeypatch.setattr(config, "FAST_JSON", True)
+    actual = client.get(url)
+
+    assert expected.status_code == actual.status_code == 200
+    assert actual.headers["content-type"] == "application/json"
+    assert actual.json() == expected.json()
+    assert len(actual.json()) > 0
@@ -0,0 +1,114 @@
+"""
+并发读请求合并测试
+
+- 同一时刻的相同读取只执行一次，所有等待者拿到同一个结果；参数不同的读取分别执行
+- 读取失败时等待者都收到异常，结束后不缓存，下一次重新读取；发起读取的请求被取消不影响其他等待者
+- 并发的成就目录请求和快照缺失时的排行榜请求只查询一次，合并数计入指标
+"""
+
+import asyncio
+import threading
+
+import httpx
+
+from main import app
+import crud
+import metrics
+import singleflight
+import snapshots
+
+
+def coalesced(route):
+    return metrics.SINGLE_FLIGHT_REQUESTS.value((route, "coalesced"))
+
+
+def gated(result=None, error=None):
+    """阻塞到 release 被设置的读取函数，记录调用次数"""
+    release = threading.Event()
+    calls = []
+
+    def function(*args):
+        calls.append(args)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+    return function, release, calls
+
+
+async def _gather_released(release, *awaitables):
+    async def open_gate():
+        await asyncio.sleep(0.05)
+        release.set()
+    results = await asyncio.gather(*awaitables, open_gate(), return_exceptions=True)
+    return results[:-1]
+
+
+def test_identical_reads_share_one_call():
+    group = singleflight.Group("test-share")
+    function, release, calls = gated(result=b"[]")
+
+    async def run():
+        same = [group.do(("daily", 1), function, "daily", 1) for _ in range(8)]
+        return await _gather_released(release, *same, group.do(("daily", 2), function, "daily", 2))
+
+    results = asyncio.run(run())
+    assert results == [b"[]"] * 9
+    assert sorted(calls) == [("daily", 1), ("daily", 2)]
+    assert coalesced("test-share") == 7 and len(group) == 0
+
+
+def test_errors_and_cancellation():
+    group = singleflight.Group("test-error")
+    function, release, calls = gated(error=ValueError("boom"))
+
+    async def failing():
+        return await _gather_released(release, *(group.do("key", function) for _ in range(3)))
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(failing()))
+    function, release, calls = gated(result=42)
+
+    async def cancelled_leader():
+        leader = asyncio.ensure_future(group.do("key", function))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("key", function))
+        await asyncio.sleep(0)
+        leader.cancel()
+        release.set()
+        return await follower
+
+    assert asyncio.run(cancelled_leader()) == 42 and len(calls) == 1
+
+
+async def _concurrent_get(path, count):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.get(path) for _ in range(count)))
+
+
+def test_catalog_and_snapshot_rebuild(monkeypatch):
+    slow = threading.Event()
+    original_achievements, original_build = crud.get_achievements, snapshots.build
+    calls = {"achievements": 0, "build": 0}
+
+    def get_achievements(db):
+        calls["achievements"] += 1
+        slow.wait(0.2)
+        return original_achievements(db)
+
+    def build(previous=None):
+        calls["build"] += 1
+        slow.wait(0.2)
+        return original_build(previous)
+
+    monkeypatch.setattr(crud, "get_achievements", get_achievements)
+    monkeypatch.setattr(snapshots, "build", build)
+    before = coalesced("/achievements/")
+    responses = asyncio.run(_concurrent_get("/achievements/", 8))
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.content for response in responses}) == 1
+    assert calls["achievements"] == 1 and coalesced("/achievements/") == before + 7
+
+    responses = asyncio.run(_concurrent_get("/leaderboard/daily", 8))
+    assert {response.status_code for response in responses} == {200}
+    assert calls["build"] == 1
@@ -0,0 +1,96 @@
+"""
+排行榜快照测试
+
+- 各周期前N名按页预先编码，读请求直接返回快照中的字节串，带 Age / Last-Modified / ETag
+- 快照生成后读请求不再访问数据库，刷新后整体替换；过期的快照由读请求同步重建
+- 关闭快照时按页查询数据库，输出与快照一致
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, text
+
+from main import app
+from database import SessionLocal
+import config
+import models
+import snapshots
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def seeded(monkeypatch):
+    """两个周期：snapshot-a 有25名，snapshot-b 有3名；每页10条，快照保存前20名"""
+    monkeypatch.setattr(config, "LEADERBOARD_PAGE_SIZE", 10)
+    monkeypatch.setattr(config, "LEADERBOARD_SNAPSHOT_SIZE", 20)
+    db = SessionLocal()
+    user = models.User(username="快照测试用户", phone="13700000003")
+    db.add(user)
+    db.commit()
+    db.add_all([models.Leaderboard(user_id=user.id, period="snapshot-a", rank=rank, tap_count=1000 - rank)
+                for rank in range(1, 26)])
+    db.add_all([models.Leaderboard(user_id=user.id, period="snapshot-b", rank=rank, tap_count=10 - rank)
+                for rank in range(1, 4)])
+    db.commit()
+    yield db
+    db.close()
+
+
+def test_pages_and_headers(seeded):
+    """按页返回前N名，超出前N名和不存在的周期返回空列表；ETag 未变时返回304"""
+    first = client.get("/leaderboard/snapshot-a")
+    assert first.status_code == 200 and first.headers["content-type"] == "application/json"
+    assert [row["rank"] for row in first.json()] == list(range(1, 11))
+    assert [row["rank"] for row in client.get("/leaderboard/snapshot-a?page=2").json()] == list(range(11, 21))
+    assert client.get("/leaderboard/snapshot-a?page=3").json() == []
+    assert client.get("/leaderboard/missing").json() == []
+    assert client.get("/leaderboard/snapshot-a?page=0").status_code == 422
+
+    assert int(first.headers["Age"]) >= 0 and "Last-Modified" in first.headers
+    assert first.headers["Cache-Control"].startswith("public, max-age=")
+    cached = client.get("/leaderboard/snapshot-a", headers={"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304 and cached.content == b""
+    assert client.get("/leaderboard/snapshot-b", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_reads_do_not_query_until_refresh(seeded, monkeypatch):
+    """快照生成后读请求不重建；刷新后返回新数据，内容未变的页 ETag 不变"""
+    before = client.get("/leaderboard/snapshot-b")
+    unchanged = client.get("/leaderboard/snapshot-a").headers["ETag"]
+    seeded.query(models.Leaderboard).filter(models.Leaderboard.period == "snapshot-b").update({"tap_count": 0})
+    seeded.commit()
+
+    with monkeypatch.context() as patched:
+        patched.setattr(snapshots, "build", pytest.fail)
+        assert client.get("/leaderboard/snapshot-b").content == before.content
+
+    snapshots.refresh()
+    assert [row["tap_count"] for row in client.get("/leaderboard/snapshot-b").json()] == [0, 0, 0]
+    assert client.get("/leaderboard/snapshot-a").headers["ETag"] == unchanged
+
+    # 后台刷新停止后，过期的快照由读请求重建
+    snapshots._snapshot = snapshots._snapshot._replace(built_at=0)
+    assert int(client.get("/leaderboard/snapshot-a").headers["Age"]) < config.LEADERBOARD_REFRESH_SECONDS
+
+
+def test_disabled_queries_database(seeded, monkeypatch):
+    """刷新间隔为0时每次请求按页查询，两种序列化路径与快照输出一致"""
+    expected = [client.get(f"/leaderboard/snapshot-a?page={page}").json() for page in (1, 2)]
+    monkeypatch.setattr(config, "LEADERBOARD_REFRESH_SECONDS", 0)
+    for fast_json in (False, True):
+        monkeypatch.setattr(config, "FAST_JSON", fast_json)
+        response = client.get("/leaderboard/snapshot-a?page=2")
+        assert "Age" not in response.headers and response.json() == expected[1]
+        assert client.get("/leaderboard/snapshot-a").json() == expected[0]
+
+
+def test_periods_use_index(seeded):
+    """周期列表沿 (period, rank) 索引跳跃读取"""
+    assert [period for period in snapshots.periods(seeded) if period.startswith("snapshot-")] == \
+        ["snapshot-a", "snapshot-b"]
+    column = models.Leaderboard.period
+    statement = select(func.min(column)).where(column > "snapshot-a")
+    compiled = statement.compile(seeded.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[3] for row in seeded.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "ix_leaderboard_period_rank" in plan and "SCAN" not in plan
@@ -0,0 +1,76 @@
+"""
+慢查询日志与SQL轨迹测试
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+import config
+import partitions
+import sqltrace
+
+client = TestClient(app)
+
+ADMIN = {"X-Admin-Token": "test-admin-token"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", ADMIN["X-Admin-Token"])
+
+
+def test_normalize_sql():
+    """合并空白、替换字面量、折叠 IN 列表"""
+    sql = "SELECT *\n  FROM users WHERE id IN (?, ?, ?) AND name = 'abc' LIMIT 10"
+    assert sqltrace.normalize_sql(sql) == "SELECT * FROM users WHERE id IN (?, ...) AND name = ? LIMIT ?"
+    # 月份分区表名中的数字不是字面量
+    partition = partitions.SESSIONS.table_name("2026-10")
+    assert sqltrace.normalize_sql(f"SELECT id FROM {partition} WHERE user_id = 5") == \
+        f"SELECT id FROM {partition} WHERE user_id = ?"
+
+
+def test_parameter_shape_hides_values():
+    """参数形态只包含类型与批量大小"""
+    assert sqltrace.parameter_shape((1, "13800138000"), False) == "(int, str)"
+    assert sqltrace.parameter_shape([(1, "a"), (2, "b")], True) == "2x(int, str)"
+
+
+def test_slow_query_records_route(monkeypatch):
+    """超过阈值的语句记录归一化SQL、参数形态和来源路由"""
+    monkeypatch.setattr(config, "SLOW_QUERY_MS", 0)
+    sqltrace.slow_queries.clear()
+    client.get("/stats/99999")
+
+    entry = sqltrace.slow_queries[-1]
+    assert entry["route"] == "/stats/{user_id}"
+    assert "FROM user_stats" in entry["sql"]
+    assert entry["params"].startswith("(")
+    assert "99999" not in entry["params"]
+
+    listed = client.get("/debug/slow-queries", headers=ADMIN).json()
+    assert listed[0]["route"] == "/stats/{user_id}"
+
+
+def test_forced_trace_header():
+    """管理员请求携带 X-Debug-Trace 时返回SQL时间线"""
+    response = client.get("/stats/99999", headers={**ADMIN, "X-Debug-Trace": "1"})
+    timeline = json.loads(response.headers["x-debug-trace"])
+    assert timeline and "FROM user_stats" in timeline[0][2]
+    assert all(offset >= 0 and duration >= 0 for offset, duration, _ in timeline)
+
+    trace_id = response.headers["x-debug-trace-id"]
+    stored = client.get(f"/debug/traces/{trace_id}", headers=ADMIN).json()
+    assert stored["path"] == "/stats/99999"
+    assert stored["statements"] == timeline
+
+
+def test_trace_requires_admin():
+    """非管理员无法强制采样，也无法访问 /debug"""
+    response = client.get("/stats/99999", headers={"X-Debug-Trace": "1"})
+    assert "x-debug-trace" not in response.headers
+    response = client.get("/stats/99999", headers={"X-Admin-Token": "wrong", "X-Debug-Trace": "1"})
+    assert "x-debug-trace" not in response.headers
+    assert client.get("/debug/traces").status_code == 403
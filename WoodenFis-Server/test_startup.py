@@ -0,0 +1,53 @@
+"""
+工作进程启动测试
+
+- 导入 main 不访问数据库，表结构检查和预热在 lifespan 中完成
+- 预热后连接池中保留已建立的连接，各阶段耗时记录到启动指标（取最近一次启动的值，不累加）
+- 单项预热失败不阻止服务启动
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import engine
+import config
+import metrics
+import warmup
+
+PHASES = ("migrations", "lifespan", "warmup_pool", "warmup_mappers", "warmup_queries", "warmup_serializers")
+
+
+@pytest.mark.no_transaction
+def test_lifespan_runs_migrations_and_warmup():
+    """启动完成后连接池已有空闲连接，启动指标包含各阶段"""
+    engine.dispose()
+    metrics.STARTUP_SECONDS.set(("lifespan",), 1000)
+    with TestClient(app) as client:
+        assert engine.pool.checkedin() >= config.WARMUP_CONNECTIONS
+        assert client.get("/leaderboard/daily").status_code == 200
+
+    text = TestClient(app).get("/metrics").text
+    for phase in PHASES:
+        assert f'woodenfis_startup_seconds{{phase="{phase}"}}' in text
+    # 再次启动覆盖上一次的耗时
+    assert metrics.STARTUP_SECONDS.value(("lifespan",)) < 1000
+
+
+@pytest.mark.no_transaction
+def test_failed_warmup_does_not_block_startup(monkeypatch):
+    """预热出错只记录日志"""
+    def broken():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(warmup, "warm_queries", broken)
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+
+
+def test_warmup_can_be_disabled(monkeypatch):
+    """关闭预热时不执行预热项"""
+    monkeypatch.setattr(config, "WARMUP", False)
+    monkeypatch.setattr(warmup, "warm_up", pytest.fail)
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
@@ -0,0 +1,81 @@
+"""
+连续打卡与留存批处理测试
+
+- 向量化结果与逐用户逐日计算一致
+- 同一天多次会话只算一天，最后一段截至昨天仍算当前连续
+- 写回 user_streaks / user_stats / cohort_retention，最长连续天数不因数据减少而变小
+"""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import models
+import partitions
+import streaks
+
+TODAY = date(2026, 10, 19)
+
+
+def reference(days, today):
+    """逐日扫描的参考实现"""
+    days = sorted(set(days))
+    longest = run = 0
+    for i, day in enumerate(days):
+        run = run + 1 if i and day - days[i - 1] == 1 else 1
+        longest = max(longest, run)
+    return (run if days[-1] >= today - 1 else 0), longest, days[-1]
+
+
+def test_compute_matches_reference():
+    """随机活跃数据：当前/最长连续天数与逐用户计算一致"""
+    rng = np.random.default_rng(7)
+    users = rng.integers(1, 300, 20_000)
+    days = rng.integers(20_000, 20_090, 20_000)
+    ids, current, longest, last_day = streaks.compute_streaks(*streaks.unique_days(users, days), 20_089)
+
+    for position, user_id in enumerate(ids.tolist()):
+        assert (current[position], longest[position], last_day[position]) == \
+            reference(days[users == user_id].tolist(), 20_089)
+
+
+def test_run_writes_back(engine):
+    """user_streaks 和 user_stats.consecutive_days 写回，留存按首次活跃日分组"""
+    sessions = partitions.MonthlyPartitions(models.MeditationSession.__table__)
+    moments = {
+        1: [TODAY - timedelta(days=offset) for offset in (1, 2, 3, 3, 10, 11)],  # 截至昨天连续3天
+        2: [TODAY - timedelta(days=offset) for offset in (20, 19, 13)],  # 已中断
+    }
+    with Session(engine) as db:
+        for user_id, days in moments.items():
+            for day in days:
+                sessions.insert(db, {"user_id": user_id, "duration": 60, "tap_count": 1,
+                                     "created_at": datetime.combine(day, datetime.min.time()) + timedelta(hours=9)})
+        db.commit()
+    with engine.begin() as conn:
+        conn.execute(insert(models.UserStat.__table__), [{"user_id": 1, "consecutive_days": 0},
+                                                        {"user_id": 2, "consecutive_days": 5}])
+
+    result = streaks.run(engine, TODAY, sessions, batch_size=1)
+    assert result["users"] == 2 and result["user_stats_updated"] == 2
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.UserStreak.__table__).order_by(models.UserStreak.user_id)).all()
+        assert [(row.user_id, row.current_streak, row.longest_streak, row.last_active_date) for row in rows] == [
+            (1, 3, 3, TODAY - timedelta(days=1)), (2, 0, 2, TODAY - timedelta(days=13))]
+        assert conn.execute(select(models.UserStat.user_id, models.UserStat.consecutive_days)
+                            .order_by(models.UserStat.user_id)).all() == [(1, 3), (2, 0)]
+        retention = conn.execute(select(models.CohortRetention.__table__)
+                                 .order_by(models.CohortRetention.cohort_date)).all()
+        assert [(row.cohort_date, row.users, row.d1, row.d7, row.d30) for row in retention] == [
+            (TODAY - timedelta(days=20), 1, 1.0, 1.0, None), (TODAY - timedelta(days=11), 1, 1.0, 0.0, None)]
+
+    # 旧会话归档后重算，最长连续天数保持不变
+    with engine.begin() as conn:
+        for table in sessions.tables(conn):
+            conn.execute(delete(table).where(table.c.user_id == 2, table.c.created_at < datetime.combine(
+                TODAY - timedelta(days=15), datetime.min.time())))
+    streaks.run(engine, TODAY, sessions)
+    with engine.connect() as conn:
+        assert conn.execute(select(models.UserStreak.longest_streak).where(models.UserStreak.user_id == 2)).scalar() == 2
@@ -0,0 +1,111 @@
+"""
+寺庙（用户组）测试
+
+- 敲击上报同时累加用户统计和所在寺庙的总敲击数
+- 加入、转入、退出寺庙时按成员的总敲击数增减，任意操作序列后总数等于成员 user_stats.total_taps 之和
+- 寺庙排行榜和敲击上报的寺庙定位都走索引，不扫描成员
+"""
+
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, text
+
+from main import app
+from database import SessionLocal
+import models
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def setup():
+    """4个已有统计记录的用户和2个寺庙"""
+    db = SessionLocal()
+    users = [models.User(username=f"寺庙测试{i}", phone=f"1370000020{i}") for i in range(4)]
+    db.add_all(users)
+    db.commit()
+    db.add_all([models.UserStat(user_id=user.id, total_taps=100 * (i + 1), today_taps=0, consecutive_days=0)
+                for i, user in enumerate(users)])
+    db.commit()
+    temples = [client.post("/temples/", json={"name": name, "goal": 10_000}).json() for name in ("灵隐寺", "少林寺")]
+    yield db, [user.id for user in users], [temple["id"] for temple in temples]
+    db.close()
+
+
+def tap(user_id, count):
+    assert client.post(f"/meditation/{user_id}/sessions", json={"duration": 60, "tap_count": count}).status_code == 200
+
+
+def temple(temple_id):
+    return client.get(f"/temples/{temple_id}").json()
+
+
+def member_sum(db, temple_id):
+    return db.query(func.coalesce(func.sum(models.UserStat.total_taps), 0)).join(
+        models.TempleMember, models.TempleMember.user_id == models.UserStat.user_id).filter(
+        models.TempleMember.temple_id == temple_id).scalar()
+
+
+def test_taps_and_membership(setup):
+    """加入时计入已有敲击，之后的敲击实时累加，转入和退出时扣除"""
+    db, users, (first, second) = setup
+    assert client.post("/temples/", json={"name": "灵隐寺"}).status_code == 400
+    assert client.post(f"/temples/{first}/members/{users[0]}").json()["temple_id"] == first
+    assert client.post(f"/temples/{first}/members/{users[1]}").status_code == 200
+    assert client.post(f"/temples/{first}/members/{users[1]}").status_code == 200
+    assert (temple(first)["total_taps"], temple(first)["member_count"]) == (300, 2)
+
+    tap(users[0], 50)
+    tap(users[2], 7)
+    assert temple(first)["total_taps"] == 350
+    stat = client.get(f"/stats/{users[0]}").json()
+    assert (stat["total_taps"], stat["today_taps"]) == (150, 50)
+
+    assert client.post(f"/temples/{second}/members/{users[0]}").status_code == 200
+    assert (temple(first)["total_taps"], temple(first)["member_count"]) == (200, 1)
+    assert (temple(second)["total_taps"], temple(second)["member_count"]) == (150, 1)
+    assert [member["user_id"] for member in client.get(f"/temples/{second}/members").json()] == [users[0]]
+
+    assert client.delete(f"/temples/{first}/members/{users[0]}").status_code == 404
+    assert client.delete(f"/temples/{second}/members/{users[0]}").status_code == 204
+    assert (temple(second)["total_taps"], temple(second)["member_count"]) == (0, 0)
+    assert client.post(f"/temples/999999/members/{users[0]}").status_code == 404
+
+
+def test_totals_match_member_sum(setup):
+    """随机的敲击、加入、转入、退出之后，各寺庙总数等于成员统计之和"""
+    db, users, temples = setup
+    rng = random.Random(5)
+    for _ in range(60):
+        user_id, temple_id = rng.choice(users), rng.choice(temples)
+        action = rng.random()
+        if action < 0.5:
+            tap(user_id, rng.randint(1, 30))
+        elif action < 0.8:
+            client.post(f"/temples/{temple_id}/members/{user_id}")
+        else:
+            client.delete(f"/temples/{temple_id}/members/{user_id}")
+    db.expire_all()
+    for temple_id in temples:
+        assert temple(temple_id)["total_taps"] == member_sum(db, temple_id)
+        assert temple(temple_id)["member_count"] == db.query(models.TempleMember).filter(
+            models.TempleMember.temple_id == temple_id).count()
+
+
+def test_leaderboard(setup):
+    """按总敲击数倒序；排行榜和敲击上报的寺庙定位都不扫描成员表"""
+    db, users, (first, second) = setup
+    client.post(f"/temples/{first}/members/{users[0]}")
+    client.post(f"/temples/{second}/members/{users[3]}")
+    board = [row["id"] for row in client.get("/temples/leaderboard").json() if row["id"] in (first, second)]
+    assert board == [second, first]
+
+    def plan(statement):
+        return " ".join(row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+
+    board_plan = plan("SELECT id FROM temples ORDER BY total_taps DESC, id DESC LIMIT 50")
+    assert "ix_temples_total_taps" in board_plan and "TEMP B-TREE" not in board_plan
+    assert "SCAN" not in plan("UPDATE temples SET total_taps = total_taps + 1 "
+                              "WHERE id = (SELECT temple_id FROM temple_members WHERE user_id = 1)")
@@ -0,0 +1,77 @@
+"""
+用户数据版本号
+
+crud 中每次写入用户相关数据后递增该用户的版本号，读接口据此生成 ETag / Last-Modified，
+条件请求只需查一次内存字典即可判断数据是否变化。
+
+多工作进程时，版本号变化通过 coordination 广播给其他进程（按用户和写入进程保留最后一条，新启动的进程先同步），
+其他进程的下一次条件请求即可看到新版本。版本号是按写入进程分别计数的向量 ((写入进程, 计数), ...)：
+每个进程只递增自己的计数，收到广播时逐项取最大值。两个进程同时写入同一用户时各自的向量不同，
+互相收到后合并为双方都没有单独发出过的同一个向量，ETag 不会与任何一方合并前的相同，各进程最终一致。
+协调端的保留消息有上限，淘汰过消息后启动的进程在 ETag 中带上淘汰数，不会重复旧的 ETag。
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import coordination
+
+# 进程启动标识：版本号只保存在内存中，重启后从0开始，
+# 将启动标识编入 ETag 可避免新旧进程的版本号相互混淆。
+# 多工作进程时由主进程通过环境变量统一设置，所有工作进程生成相同的 ETag
+EPOCH = os.getenv("WOODENFIS_EPOCH") or format(int(time.time() * 1000), "x")
+BOOT_TIME = int(os.getenv("WOODENFIS_BOOT_TIME") or time.time())
+
+# 写入进程标识，单进程时为0
+WRITER = os.getpid() if os.getenv("WOODENFIS_COORDINATION_URL") else 0
+
+CHANNEL = "versions"
+
+# ((写入进程, 计数), ...)，按写入进程排序；未写入过为空
+Version = Tuple[Tuple[int, int], ...]
+
+_lock = threading.Lock()
+_versions: Dict[int, Tuple[Version, int]] = {}
+
+
+def bump(user_id: int) -> Version:
+    """递增本进程对该用户的计数并通知其他工作进程，返回新版本号"""
+    with _lock:
+        version, modified = _versions.get(user_id, ((), BOOT_TIME))
+        counts = dict(version)
+        counts[WRITER] = counts.get(WRITER, 0) + 1
+        # Last-Modified 取写入时的墙上时间（秒），不超前于实际时间；同一秒内的多次写入由 ETag 中的版本号区分
+        modified = max(int(time.time()), modified)
+        version = tuple(sorted(counts.items()))
+        _versions[user_id] = (version, modified)
+    coordination.publish(CHANNEL, {"user_id": user_id, "writer": WRITER, "count": counts[WRITER],
+                                   "modified": modified}, key=f"{user_id}:{WRITER:x}")
+    return version
+
+
+def get(user_id: int) -> Tuple[Version, int]:
+    """返回 (版本号, 最后修改时间戳)，未写入过的用户为 ((), 进程启动时间)"""
+    return _versions.get(user_id, ((), BOOT_TIME))
+
+
+def token(version: Version) -> str:
+    """版本号在 ETag 中的表示：单进程为计数，多进程为各写入进程的 计数.进程 以 _ 连接"""
+    text = "_".join(f"{count}.{writer:x}" if writer else str(count) for writer, count in version) or "0"
+    evicted = coordination.evicted()
+    return f"{text}~{evicted}" if evicted else text
+
+
+def _apply(message: dict) -> None:
+    """收到其他进程的计数，逐项取最大值；旧消息不会使版本号回退"""
+    user_id, writer = message["user_id"], message["writer"]
+    with _lock:
+        version, modified = _versions.get(user_id, ((), BOOT_TIME))
+        counts = dict(version)
+        if message["count"] > counts.get(writer, 0):
+            counts[writer] = message["count"]
+            _versions[user_id] = (tuple(sorted(counts.items())), max(modified, message["modified"]))
+
+
+coordination.subscribe(CHANNEL, _apply)
@@ -0,0 +1,93 @@
+"""
+工作进程启动预热
+
+在 lifespan 启动阶段、开始接收请求之前并发执行，把原本落在前几个请求上的一次性开销提前：
+- 连接池：并发建立若干连接后归还，首批请求无需现场建连
+- ORM映射：configure_mappers() 完成所有模型关系的配置
+- 热点查询：用不存在的用户ID执行一遍热点读查询，填充 SQLAlchemy 的语句编译缓存
+- 序列化器：预先构建快速JSON路径的行序列化器
+
+各项相互独立，互不依赖；单项失败只记录日志，不阻止服务启动。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import configure_mappers
+
+import config
+import crud
+import schemas
+from database import SessionLocal
+from serializers import row_adapter
+
+logger = logging.getLogger("woodenfis.warmup")
+
+# 快速JSON路径使用的输出模型
+FAST_JSON_SCHEMAS = (schemas.AchievementOut, schemas.LeaderboardOut,
+                     schemas.MeditationSessionOut, schemas.ShareTaskOut)
+
+# 用于编译热点查询的用户ID（不存在，查询不返回数据）
+_MISSING_USER = 0
+
+
+def warm_mappers() -> None:
+    configure_mappers()
+
+
+def warm_queries() -> None:
+    db = SessionLocal()
+    try:
+        crud.get_user(db, _MISSING_USER)
+        crud.get_user_stat(db, _MISSING_USER)
+        crud.get_meditation_sessions(db, _MISSING_USER)
+        crud.get_user_achievements(db, _MISSING_USER)
+        crud.get_user_share_tasks(db, _MISSING_USER)
+        crud.get_leaderboard(db, "daily")
+        if config.FAST_JSON:
+            crud.get_meditation_session_rows(db, _MISSING_USER)
+            crud.get_leaderboard_rows(db, "daily")
+            crud.get_achievement_rows(db)
+            crud.get_share_task_rows(db)
+    finally:
+        db.close()
+
+
+def warm_serializers() -> None:
+    if config.FAST_JSON:
+        for schema in FAST_JSON_SCHEMAS:
+            row_adapter(schema)
+
+
+async def warm_pool(engine, connections: int) -> None:
+    """并发建立连接后一起归还，连接池中保留这些连接"""
+    opened = await asyncio.gather(*(run_in_threadpool(engine.connect) for _ in range(connections)))
+    for connection in opened:
+        connection.close()
+
+
+async def _timed(name: str, job, timings: Dict[str, float]) -> None:
+    start = time.perf_counter()
+    try:
+        if asyncio.iscoroutine(job):
+            await job
+        else:
+            await run_in_threadpool(job)
+    except Exception:
+        logger.exception("预热 %s 失败", name)
+    timings[name] = time.perf_counter() - start
+
+
+async def warm_up(engine) -> Dict[str, float]:
+    """并发执行全部预热项，返回各项耗时（秒）"""
+    timings: Dict[str, float] = {}
+    await asyncio.gather(
+        _timed("pool", warm_pool(engine, config.WARMUP_CONNECTIONS), timings),
+        _timed("mappers", warm_mappers, timings),
+        _timed("queries", warm_queries, timings),
+        _timed("serializers", warm_serializers, timings),
+    )
+    return timings
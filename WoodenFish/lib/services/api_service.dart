@@ -5,6 +5,37 @@ import 'package:http/http.dart' as http;
 class ApiService {
   static const String baseUrl = 'http://118.178.243.73:8080';
 
+  /// 写入标记的请求/响应头，服务端据此让写入后的读请求走主库
+  static const String _wroteHeader = 'x-woodenfis-wrote';
+
+  /// 最近一次写请求成功时服务端返回的写入标记
+  /// package:http 不保存Cookie，由这里保存并在之后的请求中带回，
+  /// 保证写入后立刻读到自己的数据；过期的标记由服务端忽略
+  static String? _wroteMarker;
+
+  /// 发送GET请求，带上最近的写入标记
+  Future<http.Response> _get(Uri uri) {
+    final marker = _wroteMarker;
+    return http.get(
+      uri,
+      headers: marker == null ? null : {_wroteHeader: marker},
+    );
+  }
+
+  /// 发送POST请求，保存响应中的写入标记
+  Future<http.Response> _post(
+    Uri uri, {
+    Map<String, String>? headers,
+    Object? body,
+  }) async {
+    final response = await http.post(uri, headers: headers, body: body);
+    final marker = response.headers[_wroteHeader];
+    if (marker != null) {
+      _wroteMarker = marker;
+    }
+    return response;
+  }
+
   /// 用户注册
   /// @param username 用户名
   /// @param email 邮箱
@@ -15,7 +46,7 @@ class ApiService {
     String email,
     String password,
   ) async {
-    final response = await http.post(
+    final response = await _post(
       Uri.parse('$baseUrl/users/register'),
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({
@@ -34,7 +65,27 @@ class ApiService {
   /// @param userId 用户ID
   /// @return 用户信息Map，失败返回null
   Future<Map<String, dynamic>?> getUser(int userId) async {
-    final response = await http.get(Uri.parse('$baseUrl/users/$userId'));
+    final response = await _get(Uri.parse('$baseUrl/users/$userId'));
+    if (response.statusCode == 200) {
+      return jsonDecode(response.body);
+    }
+    return null;
+  }
+
+  /// 获取首页聚合数据（用户信息、统计、冥想记录、成就、分享任务）
+  /// 一次请求替代 getUser/getUserStat/getMeditationSessions/
+  /// getUserAchievements/getUserShareTasks 五次往返
+  /// @param userId 用户ID
+  /// @param fields 需要的数据分区，缺省返回全部
+  /// @return 聚合数据Map，失败返回null
+  Future<Map<String, dynamic>?> getDashboard(
+    int userId, {
+    List<String>? fields,
+  }) async {
+    final uri = Uri.parse('$baseUrl/users/$userId/dashboard').replace(
+      queryParameters: fields == null ? null : {'fields': fields.join(',')},
+    );
+    final response = await _get(uri);
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -45,7 +96,7 @@ class ApiService {
   /// @param userId 用户ID
   /// @return 统计信息Map，失败返回null
   Future<Map<String, dynamic>?> getUserStat(int userId) async {
-    final response = await http.get(Uri.parse('$baseUrl/stats/$userId'));
+    final response = await _get(Uri.parse('$baseUrl/stats/$userId'));
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -62,7 +113,7 @@ class ApiService {
     int duration,
     int tapCount,
   ) async {
-    final response = await http.post(
+    final response = await _post(
       Uri.parse('$baseUrl/meditation/$userId/sessions'),
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({'duration': duration, 'tap_count': tapCount}),
@@ -77,7 +128,7 @@ class ApiService {
   /// @param userId 用户ID
   /// @return 会话列表，失败返回null
   Future<List<dynamic>?> getMeditationSessions(int userId) async {
-    final response = await http.get(
+    final response = await _get(
       Uri.parse('$baseUrl/meditation/$userId/sessions'),
     );
     if (response.statusCode == 200) {
@@ -89,7 +140,7 @@ class ApiService {
   /// 获取成就列表
   /// @return 成就列表，失败返回null
   Future<List<dynamic>?> getAchievements() async {
-    final response = await http.get(Uri.parse('$baseUrl/achievements/'));
+    final response = await _get(Uri.parse('$baseUrl/achievements/'));
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -104,7 +155,7 @@ class ApiService {
     int userId,
     int achievementId,
   ) async {
-    final response = await http.post(
+    final response = await _post(
       Uri.parse('$baseUrl/achievements/$userId/unlock/$achievementId'),
     );
     if (response.statusCode == 200) {
@@ -117,7 +168,7 @@ class ApiService {
   /// @param userId 用户ID
   /// @return 用户成就列表，失败返回null
   Future<List<dynamic>?> getUserAchievements(int userId) async {
-    final response = await http.get(
+    final response = await _get(
       Uri.parse('$baseUrl/achievements/$userId/user'),
     );
     if (response.statusCode == 200) {
@@ -130,7 +181,7 @@ class ApiService {
   /// @param period 排行榜周期（如 day/week/month）
   /// @return 排行榜列表，失败返回null
   Future<List<dynamic>?> getLeaderboard(String period) async {
-    final response = await http.get(Uri.parse('$baseUrl/leaderboard/$period'));
+    final response = await _get(Uri.parse('$baseUrl/leaderboard/$period'));
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -140,7 +191,7 @@ class ApiService {
   /// 获取分享任务
   /// @return 分享任务列表，失败返回null
   Future<List<dynamic>?> getShareTasks() async {
-    final response = await http.get(Uri.parse('$baseUrl/share/tasks'));
+    final response = await _get(Uri.parse('$baseUrl/share/tasks'));
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -155,7 +206,7 @@ class ApiService {
     int userId,
     int taskId,
   ) async {
-    final response = await http.post(
+    final response = await _post(
       Uri.parse('$baseUrl/share/$userId/complete/$taskId'),
     );
     if (response.statusCode == 200) {
@@ -168,7 +219,7 @@ class ApiService {
   /// @param userId 用户ID
   /// @return 用户分享任务列表，失败返回null
   Future<List<dynamic>?> getUserShareTasks(int userId) async {
-    final response = await http.get(Uri.parse('$baseUrl/share/$userId/user'));
+    final response = await _get(Uri.parse('$baseUrl/share/$userId/user'));
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
     }
@@ -187,7 +238,7 @@ class ApiService {
     String? fullName,
     String? email,
   }) async {
-    final response = await http.post(
+    final response = await _post(
       Uri.parse('$baseUrl/users/login/apple'),
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({
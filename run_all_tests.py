@@ -2,6 +2,9 @@
 """
 木鱼App双端自动化测试执行脚本
 自动化运行服务端和客户端的所有测试，包括错误自动修复
+
+各阶段按依赖关系组成DAG，互不依赖的阶段并发执行，输出按阶段名加前缀实时打印；
+阶段结果按相关源文件的哈希缓存，源文件未变化且上次通过的阶段直接复用结果。
 """
 
 import os
@@ -10,9 +13,18 @@ import subprocess
 import time
 import json
 import signal
+import hashlib
+import argparse
 import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+CACHE_FILE = Path(".test_cache.json")
+# 计算源文件哈希时跳过的目录
+IGNORED_DIRS = {"__pycache__", ".dart_tool", "build", "reports", "htmlcov", ".pytest_cache"}
 
 class Colors:
     """终端颜色定义"""
@@ -26,12 +38,48 @@ class Colors:
     BOLD = '\033[1m'
     END = '\033[0m'
 
+@dataclass
+class Stage:
+    """测试阶段"""
+    name: str
+    run: Callable[[], bool]              # 返回False时依赖它的阶段被跳过
+    deps: Tuple[str, ...] = ()
+    sources: Tuple[str, ...] = ()        # 参与缓存键计算的文件（glob，相对仓库根目录）
+    cacheable: bool = True               # 启动服务等有副作用的阶段不缓存，只在有下游阶段需要执行时运行
+    exclusive: bool = False              # 独占运行（性能基准），避免与其他阶段争抢CPU
+    locks: Tuple[str, ...] = ()          # 持有同名锁的阶段不并发（如共用同一个Flutter工程的构建目录）
+    # 运行结果
+    status: str = "pending"              # running / passed / failed / skipped / cached
+    started: float = 0.0
+    duration: float = 0.0
+    cache_key: str = ""
+    outputs: List[str] = field(default_factory=list)
+
+
+def hash_sources(patterns) -> str:
+    """按文件路径和内容计算哈希"""
+    digest = hashlib.sha256()
+    for pattern in patterns:
+        for path in sorted(Path(".").glob(pattern)):
+            if not path.is_file() or IGNORED_DIRS.intersection(path.parts):
+                continue
+            digest.update(str(path).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
 class AutoTestRunner:
     """自动化测试运行器"""
     
-    def __init__(self):
+    def __init__(self, jobs=None, use_cache=True, only=None):
         self.start_time = datetime.now()
         self.server_process = None
+        self.jobs = jobs or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.only = only
+        self.stages: Dict[str, Stage] = {}
+        self._local = threading.local()
+        self._print_lock = threading.Lock()
         self.test_results = {
             'server_tests': {'passed': 0, 'failed': 0, 'errors': []},
             'flutter_unit_tests': {'passed': 0, 'failed': 0, 'errors': []},
@@ -40,35 +88,56 @@ class AutoTestRunner:
         }
         
     def log(self, message, color=Colors.WHITE):
-        """彩色日志输出"""
+        """彩色日志输出（并发阶段的输出带阶段名前缀）"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"{color}[{timestamp}] {message}{Colors.END}")
+        stage = getattr(self._local, "stage", None)
+        prefix = f"[{stage}] " if stage else ""
+        with self._print_lock:
+            print(f"{color}[{timestamp}] {prefix}{message}{Colors.END}", flush=True)
+    
+    def _stream(self, pipe, lines, color):
+        """逐行转发子进程输出，同时保留完整内容"""
+        for line in pipe:
+            lines.append(line)
+            self.log(line.rstrip("\n"), color)
+        pipe.close()
     
     def run_command(self, command, cwd=None, timeout=300):
-        """运行命令并返回结果"""
+        """运行命令，实时输出并返回结果（CompletedProcess，超时或出错时返回None）"""
         try:
             self.log(f"执行命令: {command}", Colors.CYAN)
-            result = subprocess.run(
+            process = subprocess.Popen(
                 command,
                 shell=True,
                 cwd=cwd,
-                capture_output=True,
-                text=True,
-                timeout=timeout
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
             )
-            return result
-        except subprocess.TimeoutExpired:
-            self.log(f"命令超时: {command}", Colors.RED)
-            return None
+            stdout, stderr = [], []
+            readers = [
+                threading.Thread(target=self._stream, args=(process.stdout, stdout, Colors.WHITE), daemon=True),
+                threading.Thread(target=self._stream, args=(process.stderr, stderr, Colors.YELLOW), daemon=True),
+            ]
+            for reader in readers:
+                reader.start()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                self.log(f"命令超时: {command}", Colors.RED)
+                return None
+            finally:
+                for reader in readers:
+                    reader.join()
+            return subprocess.CompletedProcess(command, process.returncode, "".join(stdout), "".join(stderr))
         except Exception as e:
             self.log(f"命令执行错误: {e}", Colors.RED)
             return None
     
-    def install_dependencies(self):
-        """安装所有依赖"""
-        self.log("开始安装依赖...", Colors.YELLOW)
-        
-        # 安装Python依赖
+    def install_python_dependencies(self):
+        """安装Python服务端依赖"""
         self.log("安装Python服务端依赖...", Colors.BLUE)
         result = self.run_command("pip install -r requirements.txt", cwd="WoodenFis-Server")
         if result and result.returncode != 0:
@@ -84,8 +153,10 @@ class AutoTestRunner:
                 if result and result.returncode == 0:
                     self.log("依赖安装成功！", Colors.GREEN)
                     break
-        
-        # 获取Flutter依赖
+        return bool(result and result.returncode == 0)
+    
+    def install_flutter_dependencies(self):
+        """获取Flutter依赖"""
         self.log("获取Flutter依赖...", Colors.BLUE)
         result = self.run_command("flutter pub get", cwd="WoodenFish")
         if result and result.returncode != 0:
@@ -96,6 +167,7 @@ class AutoTestRunner:
             result = self.run_command("flutter pub get", cwd="WoodenFish")
             if result and result.returncode == 0:
                 self.log("Flutter依赖获取成功！", Colors.GREEN)
+        return bool(result and result.returncode == 0)
     
     def start_server(self):
         """启动测试服务器"""
@@ -289,32 +361,31 @@ class AutoTestRunner:
         """运行性能测试"""
         self.log("开始运行性能测试...", Colors.PURPLE)
         
-        # 服务端性能测试
-        self.log("测试服务端API响应时间...", Colors.BLUE)
-        perf_commands = [
-            "curl -w '%{time_total}' -o /dev/null -s http://localhost:8000/achievements/",
-            "curl -w '%{time_total}' -o /dev/null -s http://localhost:8000/leaderboard/",
-        ]
+        # 服务端负载基准：自带临时数据库和服务进程，结果与 benchmarks/baseline.json 对比
+        self.log("运行服务端负载基准...", Colors.BLUE)
+        result = self.run_command(
+            "python -m benchmarks.load --output benchmark_report.json",
+            cwd="WoodenFis-Server",
+            timeout=600
+        )
         
-        performance_passed = True
-        for cmd in perf_commands:
-            result = self.run_command(cmd, timeout=30)
-            if result and result.stdout:
-                try:
-                    response_time = float(result.stdout.strip())
-                    if response_time > 2.0:  # 超过2秒认为性能不佳
-                        self.log(f"API响应时间过长: {response_time}s", Colors.YELLOW)
-                        performance_passed = False
-                    else:
-                        self.log(f"API响应时间正常: {response_time}s", Colors.GREEN)
-                except ValueError:
-                    pass
+        # 冷启动耗时：import 耗时、到首个成功请求的时间，与 benchmarks/startup_budget.json 预算对比
+        if result and result.returncode == 0:
+            self.log("运行启动耗时基准...", Colors.BLUE)
+            result = self.run_command(
+                "python -m benchmarks.startup --output startup_report.json",
+                cwd="WoodenFis-Server",
+                timeout=300
+            )
         
-        if performance_passed:
+        if result and result.returncode == 0:
             self.test_results['performance_tests']['passed'] = 1
             self.log("性能测试通过！", Colors.GREEN)
         else:
             self.test_results['performance_tests']['failed'] = 1
+            if result:
+                self.test_results['performance_tests']['errors'].append(result.stderr)
+            self.log("性能测试未通过，存在超过阈值的性能回归", Colors.RED)
     
     def generate_report(self):
         """生成测试报告"""
@@ -343,9 +414,14 @@ class AutoTestRunner:
 """
         
         for test_type, result in self.test_results.items():
+            stage = self.stages.get(test_type)
+            if stage and stage.status == "skipped":
+                report += f"- {test_type}: {Colors.YELLOW}跳过{Colors.END}\n"
+                continue
             status_color = Colors.GREEN if result['failed'] == 0 else Colors.RED
             report += f"- {test_type}: {status_color}{'通过' if result['failed'] == 0 else '失败'}{Colors.END}\n"
         
+        report += self.timing_report(duration.total_seconds())
         print(report)
         
         # 保存报告到文件
@@ -356,6 +432,22 @@ class AutoTestRunner:
         
         self.log("测试报告已保存到 test_report_summary.txt", Colors.GREEN)
     
+    def timing_report(self, wall_time):
+        """各阶段耗时明细：开始时间（相对流程开始）、耗时和状态"""
+        labels = {"passed": "通过", "failed": "失败", "skipped": "跳过", "cached": "缓存命中", "pending": "未执行"}
+        lines = [f"\n{Colors.BOLD}阶段耗时:{Colors.END}",
+                 f"{'阶段':<26}{'开始(秒)':>7}{'耗时(秒)':>7}  状态"]
+        origin = self.start_time.timestamp()
+        executed = 0.0
+        for stage in sorted(self.stages.values(), key=lambda item: (item.started or float("inf"), item.name)):
+            started = f"{stage.started - origin:.2f}" if stage.started else "-"
+            lines.append(f"{stage.name:<28}{started:>10}{stage.duration:>10.2f}  {labels[stage.status]}")
+            if stage.status in ("passed", "failed"):
+                executed += stage.duration
+        lines.append(f"阶段耗时合计 {executed:.2f}秒，实际耗时 {wall_time:.2f}秒，"
+                     f"并行加速 {executed / wall_time if wall_time else 0:.2f}x")
+        return "\n".join(lines) + "\n"
+    
     def cleanup(self):
         """清理资源"""
         self.log("清理测试环境...", Colors.YELLOW)
@@ -381,27 +473,163 @@ class AutoTestRunner:
                 else:
                     os.remove(file_path)
     
+    def _test_stage(self, method, result_key):
+        """把 run_xxx_tests 包装成阶段函数，以 test_results 中的结果作为阶段结果"""
+        def run():
+            method()
+            return self.test_results[result_key]['passed'] == 1
+        return run
+    
+    def build_stages(self):
+        """测试阶段DAG"""
+        server_sources = ("WoodenFis-Server/**/*.py", "WoodenFis-Server/requirements.txt", "WoodenFis-Server/pytest.ini")
+        flutter_sources = ("WoodenFish/pubspec.yaml", "WoodenFish/pubspec.lock", "WoodenFish/lib/**/*")
+        stages = [
+            Stage("python_dependencies", self.install_python_dependencies,
+                  sources=("WoodenFis-Server/requirements.txt",)),
+            Stage("flutter_dependencies", self.install_flutter_dependencies,
+                  sources=("WoodenFish/pubspec.yaml", "WoodenFish/pubspec.lock"), locks=("flutter",)),
+            Stage("test_server", self.start_server, deps=("python_dependencies",), cacheable=False),
+            Stage("server_tests", self._test_stage(self.run_server_tests, "server_tests"),
+                  deps=("python_dependencies",), sources=server_sources),
+            Stage("performance_tests", self._test_stage(self.run_performance_tests, "performance_tests"),
+                  deps=("python_dependencies",), sources=server_sources + ("WoodenFis-Server/benchmarks/baseline.json",),
+                  exclusive=True),
+            Stage("flutter_unit_tests", self._test_stage(self.run_flutter_unit_tests, "flutter_unit_tests"),
+                  deps=("flutter_dependencies",), sources=flutter_sources + ("WoodenFish/test/**/*",),
+                  locks=("flutter",)),
+            Stage("flutter_integration_tests",
+                  self._test_stage(self.run_flutter_integration_tests, "flutter_integration_tests"),
+                  deps=("flutter_dependencies", "test_server"),
+                  sources=flutter_sources + ("WoodenFish/integration_test/**/*",) + server_sources,
+                  locks=("flutter",)),
+        ]
+        return {stage.name: stage for stage in stages}
+    
+    def _selected(self):
+        """--only 指定的阶段及其全部依赖"""
+        if not self.only:
+            return set(self.stages)
+        unknown = set(self.only) - set(self.stages)
+        if unknown:
+            raise ValueError(f"未知的测试阶段: {', '.join(sorted(unknown))}，可选: {', '.join(self.stages)}")
+        selected, pending = set(), list(self.only)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.stages[name].deps)
+        return selected
+    
+    def _plan(self, cache):
+        """
+        按拓扑序计算缓存键（包含依赖阶段的键）并标记缓存命中；
+        不可缓存的阶段只在有下游阶段需要执行时运行
+        """
+        order, visiting = [], set()
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"测试阶段存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            order.append(name)
+        selected = self._selected()
+        for name in sorted(selected):
+            visit(name)
+        
+        for name in order:
+            stage = self.stages[name]
+            dep_keys = "".join(self.stages[dep].cache_key for dep in stage.deps)
+            stage.cache_key = hashlib.sha256((hash_sources(stage.sources) + dep_keys).encode()).hexdigest()
+            entry = cache.get(name)
+            if self.use_cache and stage.cacheable and entry and entry["key"] == stage.cache_key:
+                stage.status = "cached"
+        
+        for name in reversed(order):
+            stage = self.stages[name]
+            if stage.cacheable:
+                continue
+            needed = any(name in other.deps and other.status == "pending"
+                         for other in self.stages.values() if other.name in selected)
+            if not needed:
+                stage.status = "cached"
+        
+        for name in set(self.stages) - selected:
+            self.stages[name].status = "skipped"
+        return order
+    
+    def _run_stage(self, stage):
+        self._local.stage = stage.name
+        stage.started = time.time()
+        try:
+            ok = stage.run()
+        except Exception as e:
+            self.log(f"阶段执行异常: {e}", Colors.RED)
+            ok = False
+        finally:
+            stage.duration = time.time() - stage.started
+            self._local.stage = None
+        return ok
+    
+    def run_stages(self):
+        """按DAG并发执行阶段：依赖全部成功后才启动，独占阶段单独运行，同名锁的阶段互斥"""
+        cache = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
+        order = self._plan(cache)
+        for name in order:
+            stage = self.stages[name]
+            if stage.status == "cached" and stage.name in self.test_results:
+                self.test_results[stage.name]['passed'] = 1
+                self.log(f"{stage.name}: 源文件未变化，复用上次通过的结果", Colors.GREEN)
+        
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while True:
+                held = {lock for stage in running.values() for lock in stage.locks}
+                exclusive_running = any(stage.exclusive for stage in running.values())
+                for name in order:
+                    stage = self.stages[name]
+                    if stage.status != "pending":
+                        continue
+                    dep_states = [self.stages[dep].status for dep in stage.deps]
+                    if any(state in ("failed", "skipped") for state in dep_states):
+                        stage.status = "skipped"
+                        self.log(f"{name}: 依赖阶段未通过，跳过", Colors.YELLOW)
+                        continue
+                    if not all(state in ("passed", "cached") for state in dep_states):
+                        continue
+                    if exclusive_running or (stage.exclusive and running) or held.intersection(stage.locks):
+                        continue
+                    if len(running) >= self.jobs:
+                        break
+                    stage.status = "running"
+                    running[pool.submit(self._run_stage, stage)] = stage
+                    held.update(stage.locks)
+                    exclusive_running = exclusive_running or stage.exclusive
+                
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    stage.status = "passed" if future.result() else "failed"
+                    self.log(f"{stage.name}: {'通过' if stage.status == 'passed' else '失败'}（{stage.duration:.2f}秒）",
+                             Colors.GREEN if stage.status == "passed" else Colors.RED)
+                    if stage.status == "passed" and stage.cacheable:
+                        cache[stage.name] = {"key": stage.cache_key, "duration": round(stage.duration, 2)}
+                    else:
+                        cache.pop(stage.name, None)
+        
+        CACHE_FILE.write_text(json.dumps(cache, indent=2, ensure_ascii=False))
+    
     def run_all_tests(self):
         """运行所有测试"""
         try:
             self.log("开始自动化测试流程...", Colors.BOLD)
-            
-            # 安装依赖
-            self.install_dependencies()
-            
-            # 启动服务器
-            if not self.start_server():
-                self.log("服务器启动失败，跳过服务端相关测试", Colors.YELLOW)
-            else:
-                # 运行服务端测试
-                self.run_server_tests()
-                
-                # 运行性能测试
-                self.run_performance_tests()
-            
-            # 运行Flutter测试
-            self.run_flutter_unit_tests()
-            self.run_flutter_integration_tests()
+            self.stages = self.build_stages()
+            self.run_stages()
             
             # 生成报告
             self.generate_report()
@@ -425,5 +653,11 @@ if __name__ == "__main__":
     print(f"{Colors.BOLD}{Colors.PURPLE}木鱼App自动化测试系统{Colors.END}")
     print(f"{Colors.CYAN}这个脚本将自动运行所有测试并处理遇到的问题{Colors.END}\n")
     
-    runner = AutoTestRunner()
+    parser = argparse.ArgumentParser(description="木鱼App自动化测试")
+    parser.add_argument("--jobs", "-j", type=int, help="最多同时执行的阶段数，默认CPU核数")
+    parser.add_argument("--no-cache", action="store_true", help="忽略缓存，执行全部阶段")
+    parser.add_argument("--only", nargs="+", help="只执行指定阶段（及其依赖）")
+    args = parser.parse_args()
+    
+    runner = AutoTestRunner(jobs=args.jobs, use_cache=not args.no_cache, only=args.only)
     runner.run_all_tests() 
\ No newline at end of file